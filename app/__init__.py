@@ -7,12 +7,35 @@ import time
 import os
 
 BASE_DIR=os.path.dirname(os.path.abspath(__file__))
+# Port the Pi publishes TaskStatusMsg on
+TASK_STATUS_PORT=int(os.environ.get("PITRAC_TASK_STATUS_PORT", "5557"))
 
 def create_app():
-    from .routes import viewfinder, api
+    from .routes import viewfinder, viewfinder_ws, api, metrics
+    from .routes.command.client import CommandClient
+    from .routes.command.heartbeat import HeartbeatMonitor
+    from .routes.command.dispatcher import CommandDispatcher
+    from .routes.command.mode import ModeController
+    from .routes.tasks.aggregator import TaskStatusService
+    from .routes.messages.Common import PI_IP, ZMQ_CONTEXT
     app=Flask(__name__)
+    # One command channel to the Pi, shared by every request thread
+    app.extensions["pitrac_commands"]=CommandClient(f"tcp://{PI_IP}:6000", ZMQ_CONTEXT)
+    # Pi liveness, round trip and clock offset, polled over the command channel once started
+    app.extensions["pitrac_heartbeat"]=HeartbeatMonitor(app.extensions["pitrac_commands"])
+    # Circuit breaker and retries in front of the command channel; routes send commands through this
+    app.extensions["pitrac_dispatcher"]=CommandDispatcher(app.extensions["pitrac_commands"],
+                                                          app.extensions["pitrac_heartbeat"])
+    # Cached Pi mode; change_mode skips and coalesces redundant changes
+    app.extensions["pitrac_mode"]=ModeController(app.extensions["pitrac_dispatcher"])
+    # Latest TaskStatusMsg per task, subscribed on first use
+    app.extensions["pitrac_tasks"]=TaskStatusService(f"tcp://{PI_IP}:{TASK_STATUS_PORT}", ZMQ_CONTEXT,
+                                                     on_heartbeat=app.extensions["pitrac_heartbeat"].observe)
     app.register_blueprint(viewfinder.bp)
+    if viewfinder_ws.sock is not None:
+        app.register_blueprint(viewfinder_ws.bp)
     app.register_blueprint(api.bp)
+    app.register_blueprint(metrics.bp)
     @app.route("/")
     def index():
         return render_template("app/home.html")
@@ -0,0 +1,106 @@
+"""
+PiTrac Clock Synchronization
+NTP-style estimate of the Pi's wall clock relative to ours, so timestamps taken on
+the Pi (capture_timestamp, ack_timestamp, message timestamps) can be compared with
+local time without the two clocks' drift showing up as latency.
+"""
+
+import threading
+import time
+from collections import deque
+from typing import NamedTuple, Optional
+
+# Exchanges kept; the one with the smallest round trip delay sets the offset
+SAMPLE_WINDOW = 16
+
+# Timestamps since epoch below this are milliseconds, above it microseconds
+_MILLISECONDS_LIMIT = 10 ** 14
+
+
+def is_us(timestamp: int) -> bool:
+    """Whether a timestamp since epoch is in microseconds (rather than ms, or unset)"""
+    return timestamp >= _MILLISECONDS_LIMIT
+
+
+def to_us(timestamp: int) -> int:
+    """Normalize a timestamp since epoch in ms or us to us"""
+    return timestamp * 1000 if 0 < timestamp < _MILLISECONDS_LIMIT else timestamp
+
+
+def now_us() -> int:
+    return time.time_ns() // 1000
+
+
+class ClockSample(NamedTuple):
+    offset_us: float  # remote clock minus local clock
+    delay_us: float  # round trip, excluding time spent on the remote side
+    local_us: int  # when the exchange completed
+
+
+class ClockSync:
+    """
+    Offset of a remote clock from four-timestamp exchanges: t1 local send,
+    t2 remote receive, t3 remote send, t4 local receive.
+
+        offset = ((t2 - t1) + (t3 - t4)) / 2
+        delay  = (t4 - t1) - (t3 - t2)
+
+    The error of each sample is bounded by half its delay, so the estimate is the
+    lowest-delay sample in a sliding window (NTP's clock filter) rather than an
+    average that queueing spikes would drag around.
+    """
+
+    def __init__(self, window: int = SAMPLE_WINDOW):
+        self._samples = deque(maxlen=window)
+        self._lock = threading.Lock()
+        self._best: Optional[ClockSample] = None
+        self.exchanges = 0
+
+    @property
+    def synchronized(self) -> bool:
+        return self._best is not None
+
+    @property
+    def offset_us(self) -> float:
+        """Remote clock minus local clock (0 until the first exchange)"""
+        best = self._best
+        return best.offset_us if best is not None else 0.0
+
+    def offset_ms(self) -> float:
+        return self.offset_us / 1000.0
+
+    @property
+    def delay_us(self) -> Optional[float]:
+        best = self._best
+        return best.delay_us if best is not None else None
+
+    def add_exchange(self, t1: int, t2: int, t3: int, t4: int) -> ClockSample:
+        """Record one exchange (timestamps in us; t2 == t3 when the remote stamps once)"""
+        sample = ClockSample(((t2 - t1) + (t3 - t4)) / 2.0, max(0.0, float((t4 - t1) - (t3 - t2))), t4)
+        with self._lock:
+            self._samples.append(sample)
+            self._best = min(self._samples, key=lambda s: s.delay_us)
+            self.exchanges += 1
+        return sample
+
+    def to_local_us(self, remote_us: int) -> int:
+        """A remote timestamp (ms or us) on the local clock, in us; 0 (unknown) stays 0"""
+        if not remote_us:
+            return 0
+        return int(to_us(remote_us) - self.offset_us)
+
+    def to_remote_us(self, local_us: int) -> int:
+        return int(local_us + self.offset_us)
+
+    def status(self) -> dict:
+        best = self._best
+        return {
+            "synchronized": best is not None,
+            "offset_ms": best.offset_us / 1000.0 if best is not None else None,
+            "delay_ms": best.delay_us / 1000.0 if best is not None else None,
+            "exchanges": self.exchanges,
+        }
+
+
+# The Pi's clock, shared by everything that compares Pi timestamps with ours
+PI_CLOCK = ClockSync()
@@ -8,6 +8,7 @@ try:
     from ..message_types import MessageType
 except ImportError:
     from ..message_interface import MessageBase, MessageType
+from ..msgpack_buffer import Buffer, packb
 
 
 
@@ -50,7 +51,7 @@ class AckStatus:
 
 
 
-@dataclass
+@dataclass(slots=True)
 class AckMessage(MessageBase):
     """Acknowledgment message that contains the original message data for confirmation"""
     
@@ -71,9 +72,12 @@ class AckMessage(MessageBase):
     metadata: Dict[str, str] = field(default_factory=dict)  # Additional acknowledgment metadata
     
     
+    _message_type_id = int(MessageType.AckMessage)
+    
     def __post_init__(self):
         """Initialize parent class after dataclass initialization"""
-        super().__init__()
+        # Explicit base call: zero-argument super() breaks in slots dataclasses
+        MessageBase.__init__(self)
     
     def get_message_type(self) -> MessageType:
         """Get the message type for this message"""
@@ -99,6 +103,41 @@ class AckMessage(MessageBase):
             
         ]
     
+    def serialize(self) -> bytes:
+        """Serialize straight from attributes as [type, timestamp_ms, fields...] (matching C++ field order)"""
+        return packb([
+            self._message_type_id,
+            self._timestamp_ms or 0,
+            self.ack_status,
+            self.original_message_type,
+            self.original_message_data,
+            self.original_timestamp,
+            self.ack_timestamp,
+            self.error_message,
+            self.metadata,
+        ])
+    
+    def deserialize(self, data: Buffer) -> None:
+        """Decode straight into the fields from [type, timestamp_ms, fields...] (matching C++ field order)"""
+        try:
+            (message_type, timestamp_ms, ack_status, original_message_type, original_message_data,
+             original_timestamp, ack_timestamp, error_message, metadata) = msgpack.unpackb(data, raw=False)
+        except Exception:
+            message_type = None
+        if message_type != self._message_type_id:
+            # Not a well-formed AckMessage; the generic path reports why
+            MessageBase.deserialize(self, data)
+            return
+        self._timestamp_ms = timestamp_ms
+        self._timestamp_cache = None
+        self.ack_status = ack_status
+        self.original_message_type = original_message_type
+        self.original_message_data = original_message_data
+        self.original_timestamp = original_timestamp
+        self.ack_timestamp = ack_timestamp
+        self.error_message = error_message
+        self.metadata = metadata
+    
     def _set_fields_data(self, fields_data: List[Any]) -> None:
         """Set field values from list during deserialization"""
         if len(fields_data) != 7:
@@ -8,9 +8,10 @@ try:
     from ..message_types import MessageType
 except ImportError:
     from ..message_interface import MessageBase, MessageType
+from ..msgpack_buffer import Buffer, packb, unpack_array
 
 
-@dataclass
+@dataclass(slots=True)
 class CameraFrameMsg(MessageBase):
     """Camera frame data with encoded image and metadata"""
     
@@ -28,10 +29,15 @@ class CameraFrameMsg(MessageBase):
     
     metadata: Dict[str, str] = field(default_factory=dict)  # Additional frame metadata (codec, quality, etc)
     
+    # image_data is received as a memoryview into the ZMQ frame instead of a copy
+    _buffer_fields = (4,)
+    
+    _message_type_id = int(MessageType.CameraFrame)
     
     def __post_init__(self):
         """Initialize parent class after dataclass initialization"""
-        super().__init__()
+        # Explicit base call: zero-argument super() breaks in slots dataclasses
+        MessageBase.__init__(self)
     
     def get_message_type(self) -> MessageType:
         """Get the message type for this message"""
@@ -55,6 +61,39 @@ class CameraFrameMsg(MessageBase):
             
         ]
     
+    def serialize(self) -> bytes:
+        """Serialize straight from attributes as [type, timestamp_ms, fields...] (matching C++ field order)"""
+        return packb([
+            self._message_type_id,
+            self._timestamp_ms or 0,
+            self.camera_id,
+            self.frame_number,
+            self.capture_timestamp,
+            self.fps,
+            self.image_data,
+            self.metadata,
+        ])
+    
+    def deserialize(self, data: Buffer) -> None:
+        """Decode straight into the fields, with image_data left as a view of data (matching C++ field order)"""
+        try:
+            (message_type, timestamp_ms, camera_id, frame_number, capture_timestamp, fps, image_data, metadata) = (
+                unpack_array(data, (6,)))  # image_data, after type and timestamp
+        except Exception:
+            message_type = None
+        if message_type != self._message_type_id:
+            # Not a well-formed CameraFrameMsg; the generic path reports why
+            MessageBase.deserialize(self, data)
+            return
+        self._timestamp_ms = timestamp_ms
+        self._timestamp_cache = None
+        self.camera_id = camera_id
+        self.frame_number = frame_number
+        self.capture_timestamp = capture_timestamp
+        self.fps = fps
+        self.image_data = image_data
+        self.metadata = metadata
+    
     def _set_fields_data(self, fields_data: List[Any]) -> None:
         """Set field values from list during deserialization"""
         if len(fields_data) != 6:
@@ -137,7 +176,7 @@ class CameraFrameMsg(MessageBase):
         
         
         # Handle binary data
-        if isinstance(self.image_data, bytes):
+        if isinstance(self.image_data, (bytes, memoryview)):
             import base64
             result['image_data'] = base64.b64encode(self.image_data).decode('utf-8')
         else:
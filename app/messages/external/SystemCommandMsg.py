@@ -8,6 +8,7 @@ try:
     from ..message_types import MessageType
 except ImportError:
     from ..message_interface import MessageBase, MessageType
+from ..msgpack_buffer import Buffer, packb
 
 
 
@@ -34,7 +35,7 @@ class CommandID:
 
 
 
-@dataclass
+@dataclass(slots=True)
 class SystemCommandMsg(MessageBase):
     """System command message for controlling application modes and operations"""
     
@@ -45,9 +46,12 @@ class SystemCommandMsg(MessageBase):
     command_params: Dict[str, str] = field(default_factory=dict)  # Additional command parameters for future extensibility
     
     
+    _message_type_id = int(MessageType.SystemCommand)
+    
     def __post_init__(self):
         """Initialize parent class after dataclass initialization"""
-        super().__init__()
+        # Explicit base call: zero-argument super() breaks in slots dataclasses
+        MessageBase.__init__(self)
     
     def get_message_type(self) -> MessageType:
         """Get the message type for this message"""
@@ -63,6 +67,30 @@ class SystemCommandMsg(MessageBase):
             
         ]
     
+    def serialize(self) -> bytes:
+        """Serialize straight from attributes as [type, timestamp_ms, fields...] (matching C++ field order)"""
+        return packb([
+            self._message_type_id,
+            self._timestamp_ms or 0,
+            self.command_id,
+            self.command_params,
+        ])
+    
+    def deserialize(self, data: Buffer) -> None:
+        """Decode straight into the fields from [type, timestamp_ms, fields...] (matching C++ field order)"""
+        try:
+            (message_type, timestamp_ms, command_id, command_params) = msgpack.unpackb(data, raw=False)
+        except Exception:
+            message_type = None
+        if message_type != self._message_type_id:
+            # Not a well-formed SystemCommandMsg; the generic path reports why
+            MessageBase.deserialize(self, data)
+            return
+        self._timestamp_ms = timestamp_ms
+        self._timestamp_cache = None
+        self.command_id = command_id
+        self.command_params = command_params
+    
     def _set_fields_data(self, fields_data: List[Any]) -> None:
         """Set field values from list during deserialization"""
         if len(fields_data) != 2:
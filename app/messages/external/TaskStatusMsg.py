@@ -8,9 +8,10 @@ try:
     from ..message_types import MessageType
 except ImportError:
     from ..message_interface import MessageBase, MessageType
+from ..msgpack_buffer import Buffer, packb
 
 
-@dataclass
+@dataclass(slots=True)
 class TaskStatusMsg(MessageBase):
     """Status update for a running task"""
     
@@ -27,9 +28,12 @@ class TaskStatusMsg(MessageBase):
     error_log: List[str] = field(default_factory=list)  # List of error messages if task failed
     
     
+    _message_type_id = int(MessageType.TaskStatus)
+    
     def __post_init__(self):
         """Initialize parent class after dataclass initialization"""
-        super().__init__()
+        # Explicit base call: zero-argument super() breaks in slots dataclasses
+        MessageBase.__init__(self)
     
     def get_message_type(self) -> MessageType:
         """Get the message type for this message"""
@@ -51,6 +55,37 @@ class TaskStatusMsg(MessageBase):
             
         ]
     
+    def serialize(self) -> bytes:
+        """Serialize straight from attributes as [type, timestamp_ms, fields...] (matching C++ field order)"""
+        return packb([
+            self._message_type_id,
+            self._timestamp_ms or 0,
+            self.task_id,
+            self.status,
+            self.progress,
+            self.details,
+            self.error_log,
+        ])
+    
+    def deserialize(self, data: Buffer) -> None:
+        """Decode straight into the fields from [type, timestamp_ms, fields...] (matching C++ field order)"""
+        try:
+            (message_type, timestamp_ms, task_id, status, progress, details, error_log) = (
+                msgpack.unpackb(data, raw=False))
+        except Exception:
+            message_type = None
+        if message_type != self._message_type_id:
+            # Not a well-formed TaskStatusMsg; the generic path reports why
+            MessageBase.deserialize(self, data)
+            return
+        self._timestamp_ms = timestamp_ms
+        self._timestamp_cache = None
+        self.task_id = task_id
+        self.status = status
+        self.progress = progress
+        self.details = details
+        self.error_log = error_log
+    
     def _set_fields_data(self, fields_data: List[Any]) -> None:
         """Set field values from list during deserialization"""
         if len(fields_data) != 5:
@@ -0,0 +1,278 @@
+from typing import Dict, List, Optional, Any
+from dataclasses import dataclass, field
+import msgpack
+import json
+from datetime import datetime
+try:
+    from ..message_interface import MessageBase
+    from ..message_types import MessageType
+except ImportError:
+    from ..message_interface import MessageBase, MessageType
+from ..msgpack_buffer import Buffer, packb
+
+
+
+
+@dataclass(slots=True)
+class HeartbeatMsg(MessageBase):
+    """Liveness and clock-synchronization exchange between the web app and Pi agents"""
+    
+    # Fields
+    
+    agent_id: str = ""  # Sending agent (e.g. "web", "pi")
+    
+    sequence: int = 0  # Incremented by the requester for every heartbeat
+    
+    origin_timestamp: int = 0  # Requester send time, microseconds since epoch (NTP t1)
+    
+    receive_timestamp: int = 0  # Responder receive time, microseconds since epoch (NTP t2, 0 in requests)
+    
+    transmit_timestamp: int = 0  # Responder send time, microseconds since epoch (NTP t3, 0 in requests)
+    
+    status: str = ""  # Free-form agent status (e.g. current mode)
+    
+    metadata: Dict[str, str] = field(default_factory=dict)  # Additional metadata for future extensibility
+    
+    
+    _message_type_id = int(MessageType.Heartbeat)
+    
+    def __post_init__(self):
+        """Initialize parent class after dataclass initialization"""
+        # Explicit base call: zero-argument super() breaks in slots dataclasses
+        MessageBase.__init__(self)
+    
+    def get_message_type(self) -> MessageType:
+        """Get the message type for this message"""
+        return MessageType.Heartbeat
+    
+    def _get_fields_data(self) -> List[Any]:
+        """Get field values as list for serialization (matching C++ field order)"""
+        return [
+            
+            self.agent_id,
+            
+            self.sequence,
+            
+            self.origin_timestamp,
+            
+            self.receive_timestamp,
+            
+            self.transmit_timestamp,
+            
+            self.status,
+            
+            self.metadata,
+            
+        ]
+    
+    def serialize(self) -> bytes:
+        """Serialize straight from attributes as [type, timestamp_ms, fields...] (matching C++ field order)"""
+        return packb([
+            self._message_type_id,
+            self._timestamp_ms or 0,
+            self.agent_id,
+            self.sequence,
+            self.origin_timestamp,
+            self.receive_timestamp,
+            self.transmit_timestamp,
+            self.status,
+            self.metadata,
+        ])
+    
+    def deserialize(self, data: Buffer) -> None:
+        """Decode straight into the fields from [type, timestamp_ms, fields...] (matching C++ field order)"""
+        try:
+            (message_type, timestamp_ms, agent_id, sequence, origin_timestamp, receive_timestamp,
+             transmit_timestamp, status, metadata) = msgpack.unpackb(data, raw=False)
+        except Exception:
+            message_type = None
+        if message_type != self._message_type_id:
+            # Not a well-formed HeartbeatMsg; the generic path reports why
+            MessageBase.deserialize(self, data)
+            return
+        self._timestamp_ms = timestamp_ms
+        self._timestamp_cache = None
+        self.agent_id = agent_id
+        self.sequence = sequence
+        self.origin_timestamp = origin_timestamp
+        self.receive_timestamp = receive_timestamp
+        self.transmit_timestamp = transmit_timestamp
+        self.status = status
+        self.metadata = metadata
+    
+    def _set_fields_data(self, fields_data: List[Any]) -> None:
+        """Set field values from list during deserialization"""
+        if len(fields_data) != 7:
+            raise ValueError(f"Expected 7 fields, got {len(fields_data)}")
+        
+        
+        self.agent_id = fields_data[0]
+        
+        self.sequence = fields_data[1]
+        
+        self.origin_timestamp = fields_data[2]
+        
+        self.receive_timestamp = fields_data[3]
+        
+        self.transmit_timestamp = fields_data[4]
+        
+        self.status = fields_data[5]
+        
+        self.metadata = fields_data[6]
+        
+    
+    @classmethod
+    def from_dict(cls, data: Dict[str, Any]) -> 'HeartbeatMsg':
+        """Create instance from dictionary"""
+        kwargs = {}
+        
+        if 'agent_id' in data:
+            
+            kwargs['agent_id'] = data['agent_id']
+            
+        
+        if 'sequence' in data:
+            
+            kwargs['sequence'] = data['sequence']
+            
+        
+        if 'origin_timestamp' in data:
+            
+            kwargs['origin_timestamp'] = data['origin_timestamp']
+            
+        
+        if 'receive_timestamp' in data:
+            
+            kwargs['receive_timestamp'] = data['receive_timestamp']
+            
+        
+        if 'transmit_timestamp' in data:
+            
+            kwargs['transmit_timestamp'] = data['transmit_timestamp']
+            
+        
+        if 'status' in data:
+            
+            kwargs['status'] = data['status']
+            
+        
+        if 'metadata' in data:
+            
+            kwargs['metadata'] = data['metadata']
+            
+        
+        return cls(**kwargs)
+    
+    def to_dict(self) -> Dict[str, Any]:
+        """Convert to dictionary"""
+        result = {}
+        
+        
+        result['agent_id'] = self.agent_id
+        
+        
+        
+        result['sequence'] = self.sequence
+        
+        
+        
+        result['origin_timestamp'] = self.origin_timestamp
+        
+        
+        
+        result['receive_timestamp'] = self.receive_timestamp
+        
+        
+        
+        result['transmit_timestamp'] = self.transmit_timestamp
+        
+        
+        
+        result['status'] = self.status
+        
+        
+        
+        result['metadata'] = self.metadata
+        
+        
+        return result
+    
+    # Field accessors (mirroring C++ style)
+    
+    def get_agent_id(self) -> str:
+        """Get agent_id"""
+        return self.agent_id
+    
+    def set_agent_id(self, value: str) -> None:
+        """Set agent_id"""
+        self.agent_id = value
+    
+    
+    def get_sequence(self) -> int:
+        """Get sequence"""
+        return self.sequence
+    
+    def set_sequence(self, value: int) -> None:
+        """Set sequence"""
+        self.sequence = value
+    
+    
+    def get_origin_timestamp(self) -> int:
+        """Get origin_timestamp"""
+        return self.origin_timestamp
+    
+    def set_origin_timestamp(self, value: int) -> None:
+        """Set origin_timestamp"""
+        self.origin_timestamp = value
+    
+    
+    def get_receive_timestamp(self) -> int:
+        """Get receive_timestamp"""
+        return self.receive_timestamp
+    
+    def set_receive_timestamp(self, value: int) -> None:
+        """Set receive_timestamp"""
+        self.receive_timestamp = value
+    
+    
+    def get_transmit_timestamp(self) -> int:
+        """Get transmit_timestamp"""
+        return self.transmit_timestamp
+    
+    def set_transmit_timestamp(self, value: int) -> None:
+        """Set transmit_timestamp"""
+        self.transmit_timestamp = value
+    
+    
+    def get_status(self) -> str:
+        """Get status"""
+        return self.status
+    
+    def set_status(self, value: str) -> None:
+        """Set status"""
+        self.status = value
+    
+    
+    def get_metadata(self) -> Dict[str, str]:
+        """Get metadata"""
+        return self.metadata
+    
+    def set_metadata(self, value: Dict[str, str]) -> None:
+        """Set metadata"""
+        self.metadata = value
+    
+    
+    
+    @classmethod
+    def from_msgpack(cls, data: bytes) -> 'HeartbeatMsg':
+        """Deserialize from msgpack"""
+        instance = cls()
+        instance.deserialize(data)
+        return instance
+    
+    def to_msgpack(self) -> bytes:
+        """Serialize to msgpack"""
+        return self.serialize()
+    
+    def __str__(self) -> str:
+        return f"HeartbeatMsg({', '.join(f'{k}={v}' for k, v in self.to_dict().items())})"
\ No newline at end of file
@@ -0,0 +1,10 @@
+"""
+PiTrac Message Classes
+Auto-generated Python message classes from JSON schemas
+"""
+
+from .HeartbeatMsg import HeartbeatMsg
+
+__all__ = [
+    "HeartbeatMsg",
+]
@@ -5,7 +5,7 @@ Mirrors the C++ MessageInterface and MessageBase implementation
 """
 
 from abc import ABC, abstractmethod
-from typing import Dict, Any, Optional, Union, Type, List
+from typing import Dict, Any, Optional, Union, Type, List, AsyncIterator, Callable
 from datetime import datetime
 import msgpack
 import json
@@ -13,11 +13,10 @@ import logging
 import time
 from enum import IntEnum
 import zmq    
-import msgpack
-import json
-import logging
-import time
-from enum import IntEnum
+import zmq.asyncio
+
+from .message_types import MessageType
+from .msgpack_buffer import Buffer, unpack_array, packb
 
 class SocketType(IntEnum):
     """ZMQ Socket types matching C++ SocketType"""
@@ -34,8 +33,12 @@ class MessageInterface(ABC):
     Mirrors the C++ MessageInterface class
     """
     
+    # The wire timestamp is kept as integer milliseconds; the datetime is built on demand
+    __slots__ = ('_timestamp_ms', '_timestamp_cache')
+    
     def __init__(self):
-        self._timestamp: Optional[datetime] = None
+        self._timestamp_ms: Optional[int] = None
+        self._timestamp_cache: Optional[datetime] = None
     
     # Abstract methods that must be implemented by subclasses
     @abstractmethod
@@ -45,11 +48,24 @@ class MessageInterface(ABC):
     
     def get_timestamp(self) -> Optional[datetime]:
         """Get message timestamp"""
-        return self._timestamp
+        if self._timestamp_ms is None:
+            return None
+        if self._timestamp_cache is None:
+            self._timestamp_cache = datetime.fromtimestamp(self._timestamp_ms / 1000.0)
+        return self._timestamp_cache
+    
+    def get_timestamp_ms(self) -> Optional[int]:
+        """Get message timestamp in milliseconds since epoch, as sent on the wire"""
+        return self._timestamp_ms
     
     def set_timestamp(self, timestamp: Optional[datetime] = None):
         """Set message timestamp (defaults to current time)"""
-        self._timestamp = timestamp or datetime.now()
+        if timestamp is None:
+            self._timestamp_ms = time.time_ns() // 1_000_000
+            self._timestamp_cache = None
+        else:
+            self._timestamp_ms = int(timestamp.timestamp() * 1000)
+            self._timestamp_cache = timestamp
     
     # Serialization interface - to be implemented by MessageBase
     @abstractmethod
@@ -89,42 +105,57 @@ class MessageBase(MessageInterface):
     Mirrors the C++ MessageBase class
     """
     
+    __slots__ = ()
+    
+    # Indices (into _get_fields_data) of binary fields deserialized without copying
+    _buffer_fields = ()
+    
+    # Integer message type; generated classes set it to skip the enum lookup
+    _message_type_id: Optional[int] = None
+    
     def __init__(self):
-        super().__init__()
-        self._timestamp = datetime.now()
+        self._timestamp_ms = time.time_ns() // 1_000_000
+        self._timestamp_cache = None
     
     def serialize(self) -> bytes:
         """Serialize message to msgpack bytes using array format like C++"""
         # Pack as array: [type, timestamp_ms, field1, field2, ...]
         fields_data = self._get_fields_data()
         
-        # Convert timestamp to milliseconds since epoch
-        timestamp_ms = int(self._timestamp.timestamp() * 1000) if self._timestamp else 0
-        
         # Create array with common fields + message fields
         array_data = [
             int(self.get_message_type()),  # Message type
-            timestamp_ms,                   # Timestamp in milliseconds
+            self._timestamp_ms or 0,        # Timestamp in milliseconds
         ] + fields_data
         
-        return msgpack.packb(array_data, use_bin_type=True)
+        return packb(array_data)
     
-    def deserialize(self, data: bytes) -> None:
-        """Deserialize message from msgpack bytes"""
+    def deserialize(self, data: Buffer) -> None:
+        """
+        Deserialize message from msgpack bytes, memoryview or zmq.Frame
+        Fields listed in _buffer_fields are left as memoryview slices of data
+        """
         try:
-            unpacked = msgpack.unpackb(data, raw=False)
+            if self._buffer_fields:
+                # Offset by 2 for the type and timestamp header
+                unpacked = unpack_array(data, (2 + index for index in self._buffer_fields))
+            else:
+                unpacked = msgpack.unpackb(data, raw=False)
             
             if not isinstance(unpacked, list) or len(unpacked) < 2:
                 raise ValueError("Invalid message format: expected array with at least 2 elements")
             
             # Extract and validate message type
             msg_type = unpacked[0]
-            if msg_type != int(self.get_message_type()):
+            expected_type = self._message_type_id
+            if expected_type is None:
+                expected_type = int(self.get_message_type())
+            if msg_type != expected_type:
                 raise ValueError(self._incorrect_message_type_string(msg_type))
             
             # Extract timestamp
-            timestamp_ms = unpacked[1]
-            self._timestamp = datetime.fromtimestamp(timestamp_ms / 1000.0)
+            self._timestamp_ms = unpacked[1]
+            self._timestamp_cache = None
             
             # Extract field data (skip type and timestamp)
             fields_data = unpacked[2:]
@@ -135,7 +166,8 @@ class MessageBase(MessageInterface):
     
     def to_string(self) -> str:
         """String representation of the message"""
-        timestamp_str = self._timestamp.isoformat() if self._timestamp else "None"
+        timestamp = self.get_timestamp()
+        timestamp_str = timestamp.isoformat() if timestamp else "None"
         return f"Message Type: {self.get_message_type().name}, Timestamp: {timestamp_str}"
     
     def clone(self) -> 'MessageBase':
@@ -166,7 +198,7 @@ class MessageBase(MessageInterface):
         """Convert message to JSON string"""
         data = {
             '_message_type': int(self.get_message_type()),
-            '_timestamp': self._timestamp.isoformat() if self._timestamp else None,
+            '_timestamp': self.get_timestamp().isoformat() if self._timestamp_ms is not None else None,
         }
         # Add field data as dictionary
         field_dict = self.to_dict()
@@ -217,9 +249,14 @@ class ZMQMessenger:
     """
     
     def __init__(self, context: Optional[zmq.Context] = None):
+        # Only a context created here is terminated by close_all; a shared one belongs to the caller
+        self._owns_context = context is None
         self._context = context or zmq.Context()
         self._sockets: Dict[str, zmq.Socket] = {}
         self._logger = logging.getLogger(self.__class__.__name__)
+        # Optional hook, called as receive_hook(socket_name, message, data, deserialize_seconds) with the
+        # received bytes, for instrumentation or for consumers that keep messages as they arrived
+        self.receive_hook: Optional[Callable[[str, MessageInterface, Buffer, float], None]] = None
     
     def create_socket(self, name: str, socket_type: SocketType, timeout_ms: int = 5000) -> zmq.Socket:
         """Create a new ZMQ socket"""
@@ -311,19 +348,16 @@ class ZMQMessenger:
             raise ValueError(f"Socket '{socket_name}' not found")
         
         try:
-            # Check if this is a multipart message (with topic)
-            if socket.getsockopt(zmq.RCVMORE):
-                parts = socket.recv_multipart(zmq.NOBLOCK)
-                if len(parts) >= 2:
-                    data = parts[1]  # Second part is the message data
-                else:
-                    data = parts[0]
+            # Messages sent with a topic arrive as [topic, data]
+            parts = socket.recv_multipart(zmq.NOBLOCK, copy=False)
+            if len(parts) >= 2:
+                data = parts[1]  # Second part is the message data
             else:
-                data = socket.recv(zmq.NOBLOCK)
+                data = parts[0]
             
             # Create and deserialize message
             message = message_class()
-            message.deserialize(data)
+            self._deserialize(socket_name, message, data)
             
             self._logger.debug(f"Received {message_class.__name__} via '{socket_name}'")
             return message
@@ -335,6 +369,58 @@ class ZMQMessenger:
             self._logger.error(f"Failed to receive message via '{socket_name}': {e}")
             return None
     
+    def receive_any_message(self, socket_name: str,
+                            accept: Optional[Callable[[Any], bool]] = None) -> Optional[MessageInterface]:
+        """
+        Receive a message of any registered type
+        The header is peeked first; messages rejected by accept (called with the
+        MessageHeader) or with no registered class are dropped without decoding
+        """
+        socket = self._sockets.get(socket_name)
+        if not socket:
+            raise ValueError(f"Socket '{socket_name}' not found")
+        
+        try:
+            # Messages sent with a topic arrive as [topic, data]
+            parts = socket.recv_multipart(zmq.NOBLOCK, copy=False)
+            return self._decode_any(socket_name, parts[-1], accept)
+            
+        except zmq.Again:
+            # No message available (timeout)
+            return None
+        except Exception as e:
+            self._logger.error(f"Failed to receive message via '{socket_name}': {e}")
+            return None
+    
+    def _decode_any(self, socket_name: str, data: Buffer,
+                    accept: Optional[Callable[[Any], bool]]) -> Optional[MessageInterface]:
+        """Peek, filter and decode a message of any registered type"""
+        from .message_registry import peek_header, get_message_class
+        
+        header = peek_header(data)
+        if accept is not None and not accept(header):
+            self._logger.debug(f"Dropped message type {header.message_type} via '{socket_name}'")
+            return None
+        message_class = get_message_class(header.message_type)
+        if message_class is None:
+            self._logger.warning(f"Dropped unregistered message type {header.message_type} via '{socket_name}'")
+            return None
+        
+        message = message_class()
+        self._deserialize(socket_name, message, data)
+        self._logger.debug(f"Received {message_class.__name__} via '{socket_name}'")
+        return message
+    
+    def _deserialize(self, socket_name: str, message: MessageInterface, data: Buffer) -> None:
+        """Deserialize into message, timing it only when a receive hook is installed"""
+        hook = self.receive_hook
+        if hook is None:
+            message.deserialize(data)
+            return
+        start = time.perf_counter()
+        message.deserialize(data)
+        hook(socket_name, message, data, time.perf_counter() - start)
+    
     def close_socket(self, name: str):
         """Close and remove socket"""
         if name in self._sockets:
@@ -343,11 +429,14 @@ class ZMQMessenger:
             self._logger.info(f"Closed socket '{name}'")
     
     def close_all(self):
-        """Close all sockets and context"""
+        """Close all sockets, and the context if this messenger created it"""
         for name in list(self._sockets.keys()):
             self.close_socket(name)
-        self._context.term()
-        self._logger.info("Closed all sockets and ZMQ context")
+        if self._owns_context:
+            self._context.term()
+            self._logger.info("Closed all sockets and ZMQ context")
+        else:
+            self._logger.info("Closed all sockets")
     
     def __del__(self):
         """Cleanup on destruction"""
@@ -357,7 +446,108 @@ class ZMQMessenger:
             pass
 
 
+class AsyncZMQMessenger(ZMQMessenger):
+    """
+    asyncio variant of ZMQMessenger built on zmq.asyncio
+    Socket management (create/bind/connect/subscribe/close) is inherited; sending and
+    receiving are coroutines, so one event loop can serve any number of sockets
+    """
+    
+    def __init__(self, context: Optional[zmq.asyncio.Context] = None):
+        super().__init__(context or zmq.asyncio.Context())
+        self._owns_context = context is None
+    
+    async def send_message(self, socket_name: str, message: MessageInterface, topic: str = "") -> bool:
+        """Send a message through the specified socket, waiting up to the socket's send timeout"""
+        socket = self._sockets.get(socket_name)
+        if not socket:
+            raise ValueError(f"Socket '{socket_name}' not found")
+        
+        try:
+            # Set timestamp if not already set
+            if message.get_timestamp() is None:
+                message.set_timestamp()
+            
+            # Serialize message
+            data = message.serialize()
+            
+            # Send with topic if specified (for PUB sockets)
+            if topic:
+                await socket.send_multipart([topic.encode('utf-8'), data])
+            else:
+                await socket.send(data)
+            
+            self._logger.debug(f"Sent {message.__class__.__name__} via '{socket_name}'")
+            return True
+            
+        except zmq.Again:
+            self._logger.warning(f"Send timeout on socket '{socket_name}'")
+            return False
+        except Exception as e:
+            self._logger.error(f"Failed to send message via '{socket_name}': {e}")
+            return False
+    
+    async def receive_message(self, socket_name: str, message_class: Type[MessageInterface]) -> Optional[MessageInterface]:
+        """Receive a message of the specified type, waiting up to the socket's receive timeout"""
+        socket = self._sockets.get(socket_name)
+        if not socket:
+            raise ValueError(f"Socket '{socket_name}' not found")
+        
+        try:
+            # Messages sent with a topic arrive as [topic, data]
+            parts = await socket.recv_multipart(copy=False)
+            if len(parts) >= 2:
+                data = parts[1]  # Second part is the message data
+            else:
+                data = parts[0]
+            
+            # Create and deserialize message
+            message = message_class()
+            self._deserialize(socket_name, message, data)
+            
+            self._logger.debug(f"Received {message_class.__name__} via '{socket_name}'")
+            return message
+            
+        except zmq.Again:
+            # No message available (timeout)
+            return None
+        except Exception as e:
+            self._logger.error(f"Failed to receive message via '{socket_name}': {e}")
+            return None
+    
+    async def receive_any_message(self, socket_name: str,
+                                  accept: Optional[Callable[[Any], bool]] = None) -> Optional[MessageInterface]:
+        """Receive a message of any registered type, dropping those rejected by accept before decoding"""
+        socket = self._sockets.get(socket_name)
+        if not socket:
+            raise ValueError(f"Socket '{socket_name}' not found")
+        
+        try:
+            # Messages sent with a topic arrive as [topic, data]
+            parts = await socket.recv_multipart(copy=False)
+            return self._decode_any(socket_name, parts[-1], accept)
+            
+        except zmq.Again:
+            # No message available (timeout)
+            return None
+        except Exception as e:
+            self._logger.error(f"Failed to receive message via '{socket_name}': {e}")
+            return None
+    
+    async def stream(self, socket_name: str, message_class: Type[MessageInterface]) -> AsyncIterator[MessageInterface]:
+        """Yield messages from the specified socket until it is closed"""
+        while socket_name in self._sockets:
+            message = await self.receive_message(socket_name, message_class)
+            if message is not None:
+                yield message
+
+
 # Convenience function to create a messenger instance
 def create_messenger(context: Optional[zmq.Context] = None) -> ZMQMessenger:
     """Create a new ZMQ messenger instance"""
     return ZMQMessenger(context)
+
+
+def create_async_messenger(context: Optional[zmq.asyncio.Context] = None) -> AsyncZMQMessenger:
+    """Create a new asyncio ZMQ messenger instance"""
+    return AsyncZMQMessenger(context)
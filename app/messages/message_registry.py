@@ -0,0 +1,89 @@
+"""
+PiTrac Message Registry
+Maps MessageType values to message classes and peeks at message headers,
+so mixed message streams can be routed or filtered before the payload is decoded
+"""
+
+import time
+from typing import Callable, Dict, Iterable, NamedTuple, Optional, Type
+
+from .message_interface import MessageBase
+from .msgpack_buffer import Buffer, as_buffer, read_array_header, unpack_object
+from .common import AckMessage
+from .external import CameraFrameMsg, SystemCommandMsg, TaskStatusMsg
+from .internal import HeartbeatMsg
+
+
+class MessageHeader(NamedTuple):
+    """Common [type, timestamp_ms] prefix shared by every PiTrac message"""
+    message_type: int
+    timestamp_ms: int
+    field_count: int
+
+
+_MESSAGE_CLASSES: Dict[int, Type[MessageBase]] = {}
+
+
+def register_message_class(message_class: Type[MessageBase]) -> Type[MessageBase]:
+    """Register a message class for its message type (usable as a class decorator)"""
+    message_type = message_class._message_type_id
+    if message_type is None:
+        message_type = int(message_class().get_message_type())
+    _MESSAGE_CLASSES[message_type] = message_class
+    return message_class
+
+
+def get_message_class(message_type: int) -> Optional[Type[MessageBase]]:
+    """Get the class registered for a message type"""
+    return _MESSAGE_CLASSES.get(int(message_type))
+
+
+def peek_header(data: Buffer) -> MessageHeader:
+    """Read only the array header, type and timestamp of a serialized message"""
+    buf = as_buffer(data)
+    count, offset = read_array_header(buf)
+    if count < 2:
+        raise ValueError("Invalid message format: expected array with at least 2 elements")
+    message_type, offset = unpack_object(buf, offset)
+    timestamp_ms, _ = unpack_object(buf, offset)
+    return MessageHeader(message_type, timestamp_ms, count - 2)
+
+
+def decode_message(data: Buffer, header: Optional[MessageHeader] = None) -> MessageBase:
+    """Deserialize a message of any registered type"""
+    if header is None:
+        header = peek_header(data)
+    message_class = get_message_class(header.message_type)
+    if message_class is None:
+        raise ValueError(f"No message class registered for type {header.message_type}")
+    message = message_class()
+    message.deserialize(data)
+    return message
+
+
+def accept_types(message_types: Iterable[int]) -> Callable[[MessageHeader], bool]:
+    """Header filter that only accepts the given message types"""
+    accepted = frozenset(int(message_type) for message_type in message_types)
+    return lambda header: header.message_type in accepted
+
+
+def max_age_filter(max_age_ms: int, message_types: Optional[Iterable[int]] = None,
+                   clock_offset_ms: Callable[[], float] = lambda: 0.0) -> Callable[[MessageHeader], bool]:
+    """
+    Header filter that drops messages older than max_age_ms.
+    Only messages of message_types are checked when given (e.g. just camera frames);
+    clock_offset_ms returns the sender clock minus the local clock.
+    """
+    checked = frozenset(int(message_type) for message_type in message_types) if message_types else None
+
+    def accept(header: MessageHeader) -> bool:
+        if checked is not None and header.message_type not in checked:
+            return True
+        now_ms = time.time() * 1000.0 + clock_offset_ms()
+        return now_ms - header.timestamp_ms <= max_age_ms
+
+    return accept
+
+
+for _message_class in (AckMessage, CameraFrameMsg, HeartbeatMsg, SystemCommandMsg, TaskStatusMsg):
+    register_message_class(_message_class)
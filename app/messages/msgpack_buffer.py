@@ -0,0 +1,145 @@
+"""
+PiTrac Msgpack Buffer Helpers
+Walks msgpack data in place so large binary fields can be exposed as memoryview
+slices of the receive buffer instead of being copied into new bytes objects,
+and packs through reusable per-thread Packers
+"""
+
+import threading
+from typing import Any, Iterable, List, Tuple, Union
+
+import msgpack
+import zmq
+
+Buffer = Union[bytes, bytearray, memoryview, zmq.Frame]
+
+# Type byte -> (length prefix size, extra bytes before payload) for str/bin/ext
+_LENGTH_PREFIXED = {
+    0xc4: (1, 0), 0xc5: (2, 0), 0xc6: (4, 0),  # bin 8/16/32
+    0xd9: (1, 0), 0xda: (2, 0), 0xdb: (4, 0),  # str 8/16/32
+    0xc7: (1, 1), 0xc8: (2, 1), 0xc9: (4, 1),  # ext 8/16/32
+}
+
+# Type byte -> total encoded size for fixed-width types
+_FIXED_SIZE = {
+    0xc0: 1, 0xc2: 1, 0xc3: 1,                       # nil, false, true
+    0xca: 5, 0xcb: 9,                                # float 32/64
+    0xcc: 2, 0xcd: 3, 0xce: 5, 0xcf: 9,              # uint 8/16/32/64
+    0xd0: 2, 0xd1: 3, 0xd2: 5, 0xd3: 9,              # int 8/16/32/64
+    0xd4: 3, 0xd5: 4, 0xd6: 6, 0xd7: 10, 0xd8: 18,   # fixext 1/2/4/8/16
+}
+
+# Type byte -> (length prefix size, objects per entry) for arrays and maps
+_CONTAINERS = {
+    0xdc: (2, 1), 0xdd: (4, 1),  # array 16/32
+    0xde: (2, 2), 0xdf: (4, 2),  # map 16/32
+}
+
+_BIN_TYPES = (0xc4, 0xc5, 0xc6)
+
+# Packers keep an internal buffer and are not thread-safe, so each thread gets its own
+_local = threading.local()
+
+
+def packb(obj: Any) -> bytes:
+    """Pack obj with a reusable per-thread Packer (same output as msgpack.packb(obj, use_bin_type=True))"""
+    packer = getattr(_local, 'packer', None)
+    if packer is None:
+        packer = _local.packer = msgpack.Packer(use_bin_type=True)
+    return packer.pack(obj)
+
+
+def as_buffer(data: Buffer) -> memoryview:
+    """Get a byte-oriented memoryview over bytes, memoryview or zmq.Frame data"""
+    if isinstance(data, zmq.Frame):
+        data = data.buffer
+    view = memoryview(data)
+    if view.format != 'B' or view.ndim != 1:
+        view = view.cast('B')
+    return view
+
+
+def _read_length(buf: memoryview, offset: int, size: int) -> int:
+    if offset + size > len(buf):
+        raise ValueError("Truncated msgpack data")
+    return int.from_bytes(buf[offset:offset + size], 'big')
+
+
+def skip_object(buf: memoryview, offset: int) -> int:
+    """Get the offset just past the msgpack object starting at offset"""
+    remaining = 1
+    while remaining:
+        remaining -= 1
+        if offset >= len(buf):
+            raise ValueError("Truncated msgpack data")
+        type_byte = buf[offset]
+        if type_byte <= 0x7f or type_byte >= 0xe0:
+            offset += 1                                  # positive/negative fixint
+        elif type_byte <= 0x8f:
+            remaining += 2 * (type_byte & 0x0f)          # fixmap
+            offset += 1
+        elif type_byte <= 0x9f:
+            remaining += type_byte & 0x0f                # fixarray
+            offset += 1
+        elif type_byte <= 0xbf:
+            offset += 1 + (type_byte & 0x1f)             # fixstr
+        elif type_byte in _FIXED_SIZE:
+            offset += _FIXED_SIZE[type_byte]
+        elif type_byte in _LENGTH_PREFIXED:
+            size, extra = _LENGTH_PREFIXED[type_byte]
+            length = _read_length(buf, offset + 1, size)
+            offset += 1 + size + extra + length
+        elif type_byte in _CONTAINERS:
+            size, per_entry = _CONTAINERS[type_byte]
+            remaining += per_entry * _read_length(buf, offset + 1, size)
+            offset += 1 + size
+        else:
+            raise ValueError(f"Invalid msgpack type byte 0x{type_byte:02x} at offset {offset}")
+    if offset > len(buf):
+        raise ValueError("Truncated msgpack data")
+    return offset
+
+
+def read_array_header(buf: memoryview, offset: int = 0) -> Tuple[int, int]:
+    """Read an array header, returning (element count, offset of first element)"""
+    if offset >= len(buf):
+        raise ValueError("Truncated msgpack data")
+    type_byte = buf[offset]
+    if 0x90 <= type_byte <= 0x9f:
+        return type_byte & 0x0f, offset + 1
+    if type_byte == 0xdc:
+        return _read_length(buf, offset + 1, 2), offset + 3
+    if type_byte == 0xdd:
+        return _read_length(buf, offset + 1, 4), offset + 5
+    raise ValueError(f"Expected msgpack array, got type byte 0x{type_byte:02x}")
+
+
+def unpack_object(buf: memoryview, offset: int) -> Tuple[Any, int]:
+    """Unpack the object at offset, returning (object, offset just past it)"""
+    end = skip_object(buf, offset)
+    return msgpack.unpackb(buf[offset:end], raw=False), end
+
+
+def unpack_array(data: Buffer, view_indices: Iterable[int] = ()) -> List[Any]:
+    """
+    Unpack a top-level msgpack array.
+    Binary elements at view_indices come back as memoryview slices of data (no copy);
+    everything else is unpacked as usual.
+    """
+    buf = as_buffer(data)
+    view_indices = frozenset(view_indices)
+    count, offset = read_array_header(buf)
+    result = []
+    for index in range(count):
+        if index in view_indices and offset < len(buf) and buf[offset] in _BIN_TYPES:
+            size, _ = _LENGTH_PREFIXED[buf[offset]]
+            length = _read_length(buf, offset + 1, size)
+            start = offset + 1 + size
+            if start + length > len(buf):
+                raise ValueError("Truncated msgpack data")
+            result.append(buf[start:start + length])
+            offset = start + length
+        else:
+            value, offset = unpack_object(buf, offset)
+            result.append(value)
+    return result
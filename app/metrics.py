@@ -0,0 +1,285 @@
+"""
+PiTrac Pipeline Metrics
+Minimal counters, gauges and histograms rendered in the Prometheus text format.
+Set PITRAC_METRICS=0 to disable; instrumentation sites check ENABLED first, so a
+disabled build pays one attribute lookup per hook.
+"""
+
+import bisect
+import os
+import threading
+import time
+from typing import Dict, List, Optional, Sequence, Tuple
+
+from app.clock import PI_CLOCK
+
+ENABLED = os.environ.get("PITRAC_METRICS", "1") != "0"
+
+LATENCY_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0)
+
+
+def _format_value(value: float) -> str:
+    if value == float('inf'):
+        return "+Inf"
+    if float(value).is_integer():
+        return str(int(value))
+    return repr(float(value))
+
+
+def _format_labels(names: Sequence[str], values: Sequence[str], extra: str = "") -> str:
+    pairs = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+def _escape(value: str) -> str:
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+class _Metric:
+    """Base for a metric family with optional labels"""
+    type_name = ""
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = ()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._children: Dict[Tuple[str, ...], object] = {}
+        self._lock = threading.Lock()
+        REGISTRY.register(self)
+
+    def labels(self, *values):
+        """Get the child series for the given label values"""
+        key = tuple(str(value) for value in values)
+        child = self._children.get(key)
+        if child is None:
+            with self._lock:
+                child = self._children.get(key)
+                if child is None:
+                    child = self._children[key] = self._new_child()
+        return child
+
+    def remove(self, *values) -> None:
+        """Drop a child series (e.g. when a client disconnects)"""
+        with self._lock:
+            self._children.pop(tuple(str(value) for value in values), None)
+
+    def render(self) -> List[str]:
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.type_name}"]
+        with self._lock:
+            children = list(self._children.items())
+        for values, child in children:
+            lines.extend(self._render_child(values, child))
+        return lines
+
+    def _new_child(self):
+        raise NotImplementedError
+
+    def _render_child(self, values, child) -> List[str]:
+        raise NotImplementedError
+
+
+class _Value:
+    def __init__(self):
+        self.value = 0.0
+        self.lock = threading.Lock()
+
+    def inc(self, amount: float = 1.0) -> None:
+        with self.lock:
+            self.value += amount
+
+    def dec(self, amount: float = 1.0) -> None:
+        with self.lock:
+            self.value -= amount
+
+    def set(self, value: float) -> None:
+        self.value = value
+
+
+class Counter(_Metric):
+    type_name = "counter"
+
+    def _new_child(self):
+        return _Value()
+
+    def _render_child(self, values, child) -> List[str]:
+        return [f"{self.name}{_format_labels(self.labelnames, values)} {_format_value(child.value)}"]
+
+
+class Gauge(Counter):
+    type_name = "gauge"
+
+
+class _HistogramValue:
+    def __init__(self, buckets: Sequence[float]):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.sum = 0.0
+        self.lock = threading.Lock()
+
+    def observe(self, value: float) -> None:
+        index = bisect.bisect_left(self.buckets, value)
+        with self.lock:
+            self.counts[index] += 1
+            self.sum += value
+
+
+class Histogram(_Metric):
+    type_name = "histogram"
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = (),
+                 buckets: Sequence[float] = LATENCY_BUCKETS):
+        self.buckets = tuple(sorted(buckets))
+        super().__init__(name, documentation, labelnames)
+
+    def _new_child(self):
+        return _HistogramValue(self.buckets)
+
+    def _render_child(self, values, child) -> List[str]:
+        with child.lock:
+            counts = list(child.counts)
+            total = child.sum
+        lines = []
+        cumulative = 0
+        for bound, count in zip(self.buckets + (float('inf'),), counts):
+            cumulative += count
+            le = f'le="{_format_value(bound)}"'
+            lines.append(f"{self.name}_bucket{_format_labels(self.labelnames, values, le)} {cumulative}")
+        labels = _format_labels(self.labelnames, values)
+        lines.append(f"{self.name}_sum{labels} {_format_value(total)}")
+        lines.append(f"{self.name}_count{labels} {cumulative}")
+        return lines
+
+
+class Registry:
+    def __init__(self):
+        self._metrics: List[_Metric] = []
+
+    def register(self, metric: _Metric) -> None:
+        self._metrics.append(metric)
+
+    def render(self) -> str:
+        lines = []
+        for metric in self._metrics:
+            lines.extend(metric.render())
+        return "\n".join(lines) + "\n"
+
+
+REGISTRY = Registry()
+
+# Pipeline stages, in frame order
+CAPTURE_TO_RECEIVE_SECONDS = Histogram(
+    "pitrac_frame_capture_to_receive_seconds",
+    "Time from CameraFrameMsg.capture_timestamp on the Pi to receipt here, clock offset corrected", ["camera"])
+CAPTURE_TO_SEND_SECONDS = Histogram(
+    "pitrac_frame_capture_to_send_seconds",
+    "Pi processing: capture_timestamp to the frame message's send timestamp, both on the Pi clock", ["camera"])
+SEND_TO_RECEIVE_SECONDS = Histogram(
+    "pitrac_frame_send_to_receive_seconds",
+    "Network and queueing: frame message send timestamp to receipt here, clock offset corrected", ["camera"])
+DESERIALIZE_SECONDS = Histogram(
+    "pitrac_message_deserialize_seconds", "Time to deserialize a received message", ["message"],
+    buckets=(0.00001, 0.000025, 0.00005, 0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.01))
+RECEIVED_BYTES = Counter(
+    "pitrac_message_received_bytes_total", "Bytes of message payload received", ["message"])
+FRAME_ENCODE_SECONDS = Histogram(
+    "pitrac_frame_encode_seconds", "Time to decode, transform and encode a frame for one stream variant",
+    ["camera", "variant"])
+FRAME_ANALYSIS_SECONDS = Histogram(
+    "pitrac_frame_analysis_seconds", "Time to decode and analyse a frame's grayscale copy", ["camera"])
+CAMERA_SKEW_SECONDS = Histogram(
+    "pitrac_camera_skew_seconds", "Capture time difference between the two frames of a composite pair",
+    buckets=(0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.015, 0.02, 0.033, 0.05))
+STREAM_FRAMES_SENT = Counter(
+    "pitrac_stream_frames_sent_total", "Frames sent to a viewer", ["camera", "transport", "client"])
+STREAM_BYTES_SENT = Counter(
+    "pitrac_stream_bytes_sent_total", "Bytes sent to a viewer", ["camera", "transport", "client"])
+STREAM_CLIENTS = Gauge(
+    "pitrac_stream_clients", "Connected viewers", ["camera", "transport"])
+FRAMES_DROPPED = Counter(
+    "pitrac_frames_dropped_total", "Frames not delivered, by reason", ["camera", "reason"])
+COMMAND_ROUND_TRIP_SECONDS = Histogram(
+    "pitrac_command_round_trip_seconds", "SystemCommandMsg round trip to the Pi", ["command"])
+COMMAND_TIMEOUTS = Counter(
+    "pitrac_command_timeouts_total", "SystemCommandMsg sends with no acknowledgment in time", ["command"])
+COMMAND_RETRIES = Counter(
+    "pitrac_command_retries_total", "Commands sent again after a retryable AckStatus", ["command", "status"])
+COMMAND_CIRCUIT_STATE = Gauge(
+    "pitrac_command_circuit_state", "Command circuit breaker state (0 closed, 1 half open, 2 open)")
+COMMAND_CIRCUIT_REJECTIONS = Counter(
+    "pitrac_command_circuit_rejections_total", "Commands rejected without contacting the Pi while the circuit is open")
+HEARTBEAT_RTT_SECONDS = Histogram(
+    "pitrac_heartbeat_round_trip_seconds", "HeartbeatMsg round trip, excluding time spent on the agent", ["agent"])
+HEARTBEAT_MISSES = Counter(
+    "pitrac_heartbeat_misses_total", "Heartbeats with no reply in time", ["agent"])
+AGENT_UP = Gauge(
+    "pitrac_agent_up", "1 while the agent answers heartbeats, 0 once it is considered dead", ["agent"])
+PI_CLOCK_OFFSET_SECONDS = Gauge(
+    "pitrac_pi_clock_offset_seconds", "Estimated Pi wall clock minus local wall clock")
+
+
+def observe_receive(socket_name: str, message, data, deserialize_seconds: float) -> None:
+    """ZMQMessenger receive hook"""
+    name = message.__class__.__name__
+    DESERIALIZE_SECONDS.labels(name).observe(deserialize_seconds)
+    RECEIVED_BYTES.labels(name).inc(len(data))
+    capture_timestamp = getattr(message, "capture_timestamp", 0)
+    if capture_timestamp:
+        camera = getattr(message, "camera_id", "") or socket_name
+        received_us = time.time_ns() // 1000
+        CAPTURE_TO_RECEIVE_SECONDS.labels(camera).observe(
+            (received_us - PI_CLOCK.to_local_us(capture_timestamp)) / 1_000_000)
+        # The send timestamp splits the latency into time on the Pi and time in transit
+        sent_ms = message.get_timestamp_ms()
+        if sent_ms:
+            # Send timestamps are whole milliseconds, so clamp the rounding below zero
+            CAPTURE_TO_SEND_SECONDS.labels(camera).observe(max(0, sent_ms * 1000 - capture_timestamp) / 1_000_000)
+            SEND_TO_RECEIVE_SECONDS.labels(camera).observe(
+                (received_us - PI_CLOCK.to_local_us(sent_ms * 1000)) / 1_000_000)
+
+
+class StreamStats:
+    """Per-viewer counters for one stream connection"""
+
+    def __init__(self, camera: int, transport: str, client: str):
+        self._labels = (camera, transport, client)
+        self._frames = STREAM_FRAMES_SENT.labels(*self._labels)
+        self._bytes = STREAM_BYTES_SENT.labels(*self._labels)
+        self._dropped = FRAMES_DROPPED.labels(camera, f"{transport}_skipped")
+        self._clients = STREAM_CLIENTS.labels(camera, transport)
+        self._clients.inc()
+
+    def sent(self, size: int) -> None:
+        self._frames.inc()
+        self._bytes.inc(size)
+
+    def dropped(self, count: int) -> None:
+        if count > 0:
+            self._dropped.inc(count)
+
+    def close(self) -> None:
+        self._clients.dec()
+        STREAM_FRAMES_SENT.remove(*self._labels)
+        STREAM_BYTES_SENT.remove(*self._labels)
+
+
+class _NullStreamStats:
+    def sent(self, size: int) -> None:
+        pass
+
+    def dropped(self, count: int) -> None:
+        pass
+
+    def close(self) -> None:
+        pass
+
+
+NULL_STREAM_STATS = _NullStreamStats()
+
+
+def stream_stats(camera: int, transport: str, client: Optional[str]):
+    """Stats for a new viewer connection (a no-op object when metrics are disabled)"""
+    if not ENABLED:
+        return NULL_STREAM_STATS
+    return StreamStats(camera, transport, client or "unknown")
@@ -1,51 +1,193 @@
 from flask import(
-    Blueprint, Flask, render_template, Response, request, jsonify, redirect, url_for, session
+    Blueprint, Flask, render_template, Response, request, jsonify, redirect, url_for, session, current_app
 )
-from app.messages.message_types import MessageType
-from app.messages.external import (
-    SystemCommandMsg
-)
-from app.messages.common import AckMessage
-from app import SystemMode
-from app.routes.messages.Common import PI_IP, ZMQ_CONTEXT
-import zmq
+import math
+import time
+
+from app.messages.external import SystemCommandMsg
+from app.messages.external.SystemCommandMsg import CommandID
+from app.messages.common.AckMessage import AckStatus
+from app.routes.command.client import CORRELATION_KEY, DEFAULT_TIMEOUT_MS, CommandTimeout
+from app.routes.command.dispatcher import CircuitOpen
+from app.routes.command.mode import MODE_NAMES, mode_name, parse_mode
+from app.routes.tasks.aggregator import iter_task_events
 
 bp = Blueprint('api', __name__, url_prefix='/api')
 
 
+@bp.route("/mode", methods=["GET"])
+def mode():
+    # Heartbeats keep the cached mode current
+    heartbeat_monitor()
+    return jsonify(mode_controller().status())
+
+
 @bp.route("/change_mode", methods=["POST"])
 def change_mode():
-    new_mode = request.json.get("mode")
-    if new_mode == "standby":
-        new_mode = SystemMode.STANDBY
-    elif new_mode == "viewfinder":
-        new_mode = SystemMode.VIEWFINDER
-    elif new_mode == "calibration":
-        new_mode = SystemMode.CALIBRATION
-    elif new_mode == "launch_monitor":
-        new_mode = SystemMode.LAUNCH_MONITOR
-    elif new_mode == "diagnostic":
-        new_mode = SystemMode.DIAGNOSTIC
-    else:
+    new_mode = MODE_NAMES.get(request.json.get("mode"))
+    if new_mode is None:
         return jsonify({"error": "Invalid mode"}), 400
-    # Create and send mode change message
-    cmd = SystemCommandMsg(MessageType.ChangeMode, {"mode": new_mode})
-    msg = cmd.serialize()
-    if msg is None:
-        return jsonify({"error": "Invalid mode"}), 400
-    socket = ZMQ_CONTEXT.socket(zmq.REQ)
-    socket.setsockopt(zmq.LINGER, 0)
-    socket.setsockopt(zmq.RCVTIMEO, 2000)  # 2 seconds timeout for recv
-    socket.connect(f"tcp://{PI_IP}:6000")
-    socket.send(msg)
+    # Skipped when already active, shared with identical requests in flight
     try:
-        response = socket.recv()
-        ack = AckMessage.deserialize(response)
-        if ack.get_status() == Status.Success:
-            return jsonify({"message": "Mode changed successfully"})
-        else:
-            return jsonify({"error": "Failed to change mode", "status": ack.get_status()}), 400
-    except zmq.Again:
+        ack, outcome = mode_controller().change(new_mode, force=bool(request.json.get("force")))
+    except CircuitOpen as e:
+        return circuit_open_response(e)
+    except CommandTimeout:
         return jsonify({"error": "No response from server"}), 504
-    finally:
-        socket.close()
\ No newline at end of file
+    if ack is None or ack.ack_status == AckStatus.Success:
+        return jsonify({"message": "Mode changed successfully", "mode": mode_name(new_mode), "outcome": outcome})
+    else:
+        return jsonify({"error": "Failed to change mode", "status": ack.ack_status}), 400
+
+
+# Batched commands: size and whole-batch timeout limits
+MAX_BATCH_COMMANDS = 64
+MAX_BATCH_TIMEOUT_MS = 30000
+COMMAND_IDS = {name: value for name, value in vars(CommandID).items() if isinstance(value, int)}
+
+
+def parse_command(spec):
+    """A SystemCommandMsg from {"command": name or id, "params": {...}}, or an error string"""
+    if not isinstance(spec, dict):
+        return "must be an object"
+    command_id = spec.get("command")
+    if isinstance(command_id, str):
+        command_id = COMMAND_IDS.get(command_id)
+    if not isinstance(command_id, int) or isinstance(command_id, bool) or command_id not in COMMAND_IDS.values():
+        return f"unknown command {spec.get('command')!r}"
+    params = spec.get("params") or {}
+    if not isinstance(params, dict):
+        return "params must be an object"
+    params = {str(key): str(value) for key, value in params.items()}
+    if command_id == CommandID.SetMode:
+        # Modes by name, as change_mode takes them, or by number
+        mode = MODE_NAMES.get(params.get("mode")) or parse_mode(params.get("mode", ""))
+        if mode is None:
+            return "SetMode needs a valid mode"
+        params["mode"] = str(int(mode))
+    return SystemCommandMsg(command_id=command_id, command_params=params)
+
+
+@bp.route("/commands", methods=["POST"])
+def commands():
+    body = request.get_json(silent=True)
+    if not isinstance(body, dict):
+        return jsonify({"error": "Request body must be a JSON object"}), 400
+    specs = body.get("commands")
+    if not isinstance(specs, list) or not specs:
+        return jsonify({"error": "commands must be a non-empty list"}), 400
+    if len(specs) > MAX_BATCH_COMMANDS:
+        return jsonify({"error": f"At most {MAX_BATCH_COMMANDS} commands per batch"}), 400
+    batch = []
+    for index, spec in enumerate(specs):
+        command = parse_command(spec)
+        if isinstance(command, str):
+            return jsonify({"error": f"Command {index}: {command}"}), 400
+        batch.append(command)
+    stop_on_failure = body.get("stop_on_failure", False)
+    if not isinstance(stop_on_failure, bool):
+        return jsonify({"error": "stop_on_failure must be true or false"}), 400
+    timeout_ms = body.get("timeout_ms", DEFAULT_TIMEOUT_MS)
+    if (not isinstance(timeout_ms, (int, float)) or isinstance(timeout_ms, bool)
+            or not 0 < timeout_ms <= MAX_BATCH_TIMEOUT_MS):
+        return jsonify({"error": f"timeout_ms must be a number of milliseconds from 1 to {MAX_BATCH_TIMEOUT_MS}"}), 400
+    timeout_ms = max(1, int(timeout_ms))
+
+    start = time.perf_counter()
+    try:
+        outcomes = current_app.extensions["pitrac_dispatcher"].send_batch(batch, timeout_ms, stop_on_failure)
+    except CircuitOpen as e:
+        return circuit_open_response(e)
+    elapsed = time.perf_counter() - start
+
+    results = []
+    for index, (command, outcome) in enumerate(zip(batch, outcomes)):
+        ack = outcome.ack
+        result = {
+            "index": index,
+            "command": CommandID.get_name(command.command_id),
+            "status": AckStatus.get_name(ack.ack_status) if ack is not None else None,
+            "status_code": ack.ack_status if ack is not None else None,
+            "error_message": (ack.error_message if ack is not None else outcome.error) or None,
+            "metadata": {key: value for key, value in ack.metadata.items() if key != CORRELATION_KEY}
+                        if ack is not None else {},
+            "round_trip_ms": outcome.seconds * 1000 if outcome.seconds is not None else None,
+        }
+        results.append(result)
+        if ack is not None and ack.ack_status == AckStatus.Success and command.command_id == CommandID.SetMode:
+            mode_controller().update(parse_mode(command.command_params["mode"]), "ack")
+    return jsonify({
+        "results": results,
+        "succeeded": sum(result["status_code"] == AckStatus.Success for result in results),
+        "pipelined": not stop_on_failure,
+        "elapsed_ms": elapsed * 1000,
+    })
+
+
+def mode_controller():
+    return current_app.extensions["pitrac_mode"]
+
+
+def circuit_open_response(error: CircuitOpen):
+    response = jsonify({"error": "Pi unavailable", "retry_after": error.retry_after})
+    response.status_code = 503
+    response.headers["Retry-After"] = str(max(1, round(error.retry_after)))
+    return response
+
+
+def heartbeat_monitor():
+    monitor = current_app.extensions["pitrac_heartbeat"]
+    monitor.start()
+    return monitor
+
+
+@bp.route("/heartbeat", methods=["GET"])
+def heartbeat():
+    status = heartbeat_monitor().status()
+    status["circuit"] = current_app.extensions["pitrac_dispatcher"].status()
+    return jsonify(status)
+
+
+# Task stream pacing: at most one delta per interval per client, whatever the Pi's update rate
+TASK_STREAM_MIN_INTERVAL = 0.1
+TASK_STREAM_DEFAULT_INTERVAL = 0.5
+TASK_STREAM_KEEPALIVE = 15.0
+# The stream sleeps for the interval between deltas, so keep it well inside the keepalive
+TASK_STREAM_MAX_INTERVAL = 10.0
+
+
+def task_service():
+    service = current_app.extensions["pitrac_tasks"]
+    service.start()
+    return service
+
+
+@bp.route("/tasks", methods=["GET"])
+def tasks():
+    version, tasks = task_service().index.snapshot()
+    return jsonify({"version": version, "tasks": tasks})
+
+
+@bp.route("/tasks/<task_id>", methods=["GET"])
+def task(task_id):
+    state = task_service().index.get(task_id)
+    if state is None:
+        return jsonify({"error": "Unknown task"}), 404
+    return jsonify(state)
+
+
+@bp.route("/tasks/stream", methods=["GET"])
+def task_stream():
+    interval = request.args.get("interval", TASK_STREAM_DEFAULT_INTERVAL, type=float)
+    if not math.isfinite(interval):
+        return jsonify({"error": "interval must be a finite number of seconds"}), 400
+    interval = min(max(interval, TASK_STREAM_MIN_INTERVAL), TASK_STREAM_MAX_INTERVAL)
+    index = task_service().index
+    # Browsers resend the last event id when an EventSource reconnects
+    last_event_id = request.headers.get("Last-Event-ID", type=int)
+    response = Response(iter_task_events(index, interval, TASK_STREAM_KEEPALIVE, last_event_id),
+                        mimetype="text/event-stream")
+    response.headers["Cache-Control"] = "no-cache"
+    response.headers["X-Accel-Buffering"] = "no"
+    return response
+
@@ -0,0 +1,321 @@
+"""
+PiTrac Command Client
+Long-lived, thread-safe command channel to the Pi's command socket
+"""
+
+import itertools
+import logging
+import threading
+import time
+import uuid
+from typing import Dict, List, Optional, Tuple
+
+import zmq
+
+from app import metrics
+from app.clock import PI_CLOCK, ClockSync, is_us, now_us
+from app.messages.message_interface import MessageBase
+from app.messages.message_registry import decode_message, peek_header
+from app.messages.message_types import MessageType
+from app.messages.external import SystemCommandMsg
+from app.messages.external.SystemCommandMsg import CommandID
+from app.messages.common import AckMessage
+from app.messages.internal import HeartbeatMsg
+
+# Key used to tag each command so its AckMessage can be matched to the caller
+CORRELATION_KEY = "correlation_id"
+# Where each echoable request type carries the correlation id
+_CORRELATION_FIELDS = {
+    int(MessageType.SystemCommand): (SystemCommandMsg, "command_params"),
+    int(MessageType.Heartbeat): (HeartbeatMsg, "metadata"),
+}
+
+DEFAULT_TIMEOUT_MS = 2000
+POLL_INTERVAL_MS = 100
+
+_client_ids = itertools.count()
+
+
+class CommandTimeout(Exception):
+    """Raised when the Pi does not acknowledge a command in time"""
+
+
+class PiUnavailable(CommandTimeout):
+    """Raised when a command is abandoned because the Pi stopped answering heartbeats"""
+
+
+class _PendingCommand:
+    """A request waiting for its reply (an AckMessage, or a HeartbeatMsg for heartbeats)"""
+
+    def __init__(self, correlation_id: str, message_type: int, timestamp_ms: int):
+        self.correlation_id = correlation_id
+        self.message_type = message_type
+        self.timestamp_ms = timestamp_ms
+        self.event = threading.Event()
+        self.reply: Optional[MessageBase] = None
+        self.error: Optional[str] = None
+        # Local wall clock (us) as the request left and the reply arrived, for clock sync
+        self.sent_us = 0
+        self.received_us = 0
+
+
+class CommandClient:
+    """
+    Command channel shared by all request threads.
+
+    A single DEALER socket stays connected to the Pi for the life of the app and
+    is only ever touched by the client's I/O thread. Callers hand their serialized
+    command to that thread over an inproc socket and block until the matching
+    AckMessage arrives, so any number of commands can be in flight at once.
+
+    Heartbeats use a second DEALER connection of their own. The Pi's REP socket
+    takes requests from each connection in turn, so a heartbeat waits at most for
+    the command being handled, not for every command queued behind it.
+    """
+
+    def __init__(self, endpoint: str, context: Optional[zmq.Context] = None, clock: ClockSync = PI_CLOCK):
+        self._endpoint = endpoint
+        self._context = context or zmq.Context.instance()
+        self.clock = clock
+        self._wake_endpoint = f"inproc://pitrac-command-client-{next(_client_ids)}"
+        self._pending: Dict[str, _PendingCommand] = {}
+        self._lock = threading.Lock()
+        self._send_lock = threading.Lock()
+        self._sender: Optional[zmq.Socket] = None
+        self._thread: Optional[threading.Thread] = None
+        self._stop_event = threading.Event()
+        self._logger = logging.getLogger(self.__class__.__name__)
+
+    def start(self) -> None:
+        """Connect to the Pi and start the I/O thread (idempotent)"""
+        with self._lock:
+            if self._thread is not None:
+                return
+            # Bind the inproc side before anything can connect to it
+            receiver = self._context.socket(zmq.PULL)
+            receiver.setsockopt(zmq.LINGER, 0)
+            receiver.bind(self._wake_endpoint)
+            dealer = self._context.socket(zmq.DEALER)
+            dealer.setsockopt(zmq.LINGER, 0)
+            dealer.connect(self._endpoint)
+            heartbeat_dealer = self._context.socket(zmq.DEALER)
+            heartbeat_dealer.setsockopt(zmq.LINGER, 0)
+            heartbeat_dealer.connect(self._endpoint)
+            sender = self._context.socket(zmq.PUSH)
+            sender.setsockopt(zmq.LINGER, 0)
+            sender.connect(self._wake_endpoint)
+            self._sender = sender
+            self._stop_event.clear()
+            self._thread = threading.Thread(target=self._run, args=(dealer, heartbeat_dealer, receiver),
+                                            name="pitrac-command-client", daemon=True)
+            self._thread.start()
+            self._logger.info(f"Command client connected to {self._endpoint}")
+
+    def send_command(self, command: SystemCommandMsg, timeout_ms: int = DEFAULT_TIMEOUT_MS) -> AckMessage:
+        """Send a command to the Pi and wait for its AckMessage"""
+        try:
+            pending = self._exchange(command, command.command_params, timeout_ms,
+                                     f"command {command.command_id}")
+        except CommandTimeout:
+            if metrics.ENABLED:
+                metrics.COMMAND_TIMEOUTS.labels(CommandID.get_name(command.command_id)).inc()
+            raise
+        return self._acknowledged(command, pending)
+
+    def send_commands(self, commands: List[SystemCommandMsg],
+                      timeout_ms: int = DEFAULT_TIMEOUT_MS) -> List[Tuple[Optional[AckMessage], float]]:
+        """
+        Pipeline commands: all are sent back to back, in order, then their acks are
+        collected against one shared deadline. Returns (ack, round trip seconds) per
+        command; ack is None for commands not acknowledged in time.
+        """
+        deadline = time.monotonic() + timeout_ms / 1000.0
+        pending = []
+        try:
+            with self._send_lock:
+                for command in commands:
+                    pending.append(self._submit(command, command.command_params))
+            results = []
+            for command, request in zip(commands, pending):
+                try:
+                    self._await(request, max(0.0, deadline - time.monotonic()), f"command {command.command_id}")
+                except CommandTimeout:
+                    if metrics.ENABLED:
+                        metrics.COMMAND_TIMEOUTS.labels(CommandID.get_name(command.command_id)).inc()
+                    results.append((None, (now_us() - request.sent_us) / 1_000_000))
+                    continue
+                ack = self._acknowledged(command, request)
+                results.append((ack, (request.received_us - request.sent_us) / 1_000_000))
+            return results
+        finally:
+            with self._lock:
+                for request in pending:
+                    self._pending.pop(request.correlation_id, None)
+
+    def send_heartbeat(self, heartbeat: HeartbeatMsg, timeout_ms: int) -> Tuple[MessageBase, int]:
+        """
+        Exchange a heartbeat with the Pi, stamping its origin_timestamp as it is sent.
+        Returns the reply (a HeartbeatMsg, or an AckMessage from a Pi that only
+        acknowledges heartbeats) and the local time it arrived, in us.
+        """
+        pending = self._exchange(heartbeat, heartbeat.metadata, timeout_ms, f"heartbeat {heartbeat.sequence}",
+                                 stamp_origin=True)
+        return pending.reply, pending.received_us
+
+    def commands_in_flight(self) -> int:
+        """Commands (not heartbeats) sent and still waiting for their ack"""
+        heartbeat_type = int(MessageType.Heartbeat)
+        with self._lock:
+            return sum(pending.message_type != heartbeat_type for pending in self._pending.values())
+
+    def fail_pending(self, reason: str) -> int:
+        """Release every caller waiting for a reply with PiUnavailable; returns how many"""
+        with self._lock:
+            pending = list(self._pending.values())
+        for request in pending:
+            request.error = reason
+            request.event.set()
+        return len(pending)
+
+    def _acknowledged(self, command: SystemCommandMsg, pending: _PendingCommand) -> AckMessage:
+        if metrics.ENABLED:
+            metrics.COMMAND_ROUND_TRIP_SECONDS.labels(CommandID.get_name(command.command_id)).observe(
+                (pending.received_us - pending.sent_us) / 1_000_000)
+        ack = pending.reply
+        # Every ack is also a clock sample, though a coarse one: the Pi's processing time
+        # counts as delay. Millisecond ack timestamps are too coarse to be worth it.
+        if is_us(ack.ack_timestamp):
+            self.clock.add_exchange(pending.sent_us, ack.ack_timestamp, ack.ack_timestamp, pending.received_us)
+        return ack
+
+    def _exchange(self, message: MessageBase, params: Dict[str, str], timeout_ms: int, description: str,
+                  stamp_origin: bool = False) -> _PendingCommand:
+        """Tag message with a correlation id in params, send it and wait for the matching reply"""
+        with self._send_lock:
+            pending = self._submit(message, params, stamp_origin)
+        try:
+            return self._await(pending, timeout_ms / 1000.0, description)
+        finally:
+            with self._lock:
+                self._pending.pop(pending.correlation_id, None)
+
+    def _submit(self, message: MessageBase, params: Dict[str, str], stamp_origin: bool = False) -> _PendingCommand:
+        """Register and send a request (caller holds self._send_lock)"""
+        self.start()
+
+        correlation_id = uuid.uuid4().hex
+        params[CORRELATION_KEY] = correlation_id
+        message.set_timestamp()
+        pending = _PendingCommand(correlation_id, int(message.get_message_type()), message.get_timestamp_ms())
+
+        with self._lock:
+            self._pending[correlation_id] = pending
+        try:
+            pending.sent_us = now_us()
+            if stamp_origin:
+                message.origin_timestamp = pending.sent_us
+            self._sender.send(message.serialize())
+        except BaseException:
+            with self._lock:
+                self._pending.pop(correlation_id, None)
+            raise
+        return pending
+
+    def _await(self, pending: _PendingCommand, timeout: float, description: str) -> _PendingCommand:
+        if not pending.event.wait(timeout):
+            raise CommandTimeout(f"No acknowledgment for {description} within {timeout * 1000:.0f}ms")
+        if pending.reply is None:
+            raise PiUnavailable(f"No acknowledgment for {description}: {pending.error}")
+        return pending
+
+    def close(self) -> None:
+        """Stop the I/O thread and close all sockets"""
+        with self._lock:
+            thread = self._thread
+            self._thread = None
+        if thread is None:
+            return
+        self._stop_event.set()
+        thread.join()
+        with self._send_lock:
+            self._sender.close()
+            self._sender = None
+
+    def _run(self, dealer: zmq.Socket, heartbeat_dealer: zmq.Socket, receiver: zmq.Socket) -> None:
+        poller = zmq.Poller()
+        poller.register(dealer, zmq.POLLIN)
+        poller.register(heartbeat_dealer, zmq.POLLIN)
+        poller.register(receiver, zmq.POLLIN)
+        try:
+            while not self._stop_event.is_set():
+                events = dict(poller.poll(POLL_INTERVAL_MS))
+                if receiver in events:
+                    self._forward_commands(receiver, dealer, heartbeat_dealer)
+                if dealer in events:
+                    self._dispatch_replies(dealer)
+                if heartbeat_dealer in events:
+                    self._dispatch_replies(heartbeat_dealer)
+        finally:
+            dealer.close()
+            heartbeat_dealer.close()
+            receiver.close()
+
+    def _forward_commands(self, receiver: zmq.Socket, dealer: zmq.Socket, heartbeat_dealer: zmq.Socket) -> None:
+        heartbeat_type = int(MessageType.Heartbeat)
+        while True:
+            try:
+                data = receiver.recv(zmq.NOBLOCK)
+            except zmq.Again:
+                return
+            target = heartbeat_dealer if peek_header(data).message_type == heartbeat_type else dealer
+            # Empty delimiter frame so the Pi's REP socket sees a normal request
+            target.send_multipart([b"", data])
+
+    def _dispatch_replies(self, dealer: zmq.Socket) -> None:
+        while True:
+            try:
+                parts = dealer.recv_multipart(zmq.NOBLOCK)
+            except zmq.Again:
+                return
+            received_us = now_us()
+            try:
+                reply = decode_message(parts[-1])
+            except ValueError as e:
+                self._logger.error(f"Dropping malformed reply: {e}")
+                continue
+            with self._lock:
+                pending = self._match(reply)
+            if pending is None:
+                self._logger.warning(f"Dropping reply with no waiting request: {reply.to_string()}")
+                continue
+            pending.reply = reply
+            pending.received_us = received_us
+            pending.event.set()
+
+    def _match(self, reply: MessageBase) -> Optional[_PendingCommand]:
+        """Find the pending request a reply belongs to (caller holds self._lock)"""
+        if isinstance(reply, HeartbeatMsg):
+            correlation_id = reply.metadata.get(CORRELATION_KEY)
+            return self._pending.get(correlation_id) if correlation_id else None
+        if not isinstance(reply, AckMessage):
+            return None
+        ack = reply
+        correlation_id = ack.metadata.get(CORRELATION_KEY) if ack.metadata else None
+        if correlation_id is None and ack.original_message_type in _CORRELATION_FIELDS:
+            # The ack echoes the original request, which carries our correlation id
+            message_class, params = _CORRELATION_FIELDS[ack.original_message_type]
+            original = message_class()
+            try:
+                original.deserialize(ack.original_message_data)
+                correlation_id = getattr(original, params).get(CORRELATION_KEY)
+            except ValueError:
+                pass
+        if correlation_id is not None:
+            return self._pending.get(correlation_id)
+
+        # Fall back to the original type and timestamp (ms or us since epoch)
+        for pending in self._pending.values():
+            if (pending.message_type == ack.original_message_type and
+                    ack.original_timestamp in (pending.timestamp_ms, pending.timestamp_ms * 1000)):
+                return pending
+        return None
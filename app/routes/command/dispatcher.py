@@ -0,0 +1,288 @@
+"""
+PiTrac Command Dispatcher
+Fail-fast front end to the command channel: a circuit breaker that stops sending
+to an unreachable Pi, and a bounded, jittered retry policy driven by AckStatus.
+"""
+
+import logging
+import random
+import threading
+import time
+from typing import Dict, FrozenSet, Iterable, List, NamedTuple, Optional
+
+from app import metrics
+from app.messages.common import AckMessage
+from app.messages.common.AckMessage import AckStatus
+from app.messages.external import SystemCommandMsg
+from app.messages.external.SystemCommandMsg import CommandID
+from app.routes.command.client import DEFAULT_TIMEOUT_MS, CommandClient, CommandTimeout, PiUnavailable
+from app.routes.command.heartbeat import HeartbeatMonitor
+
+# Consecutive unacknowledged commands that open the circuit
+FAILURE_THRESHOLD = 3
+# Seconds an open circuit waits before letting a trial command through (jittered)
+OPEN_SECONDS = 5.0
+
+# Acks worth sending the command again for: the Pi is reachable but busy
+RETRY_STATUSES = frozenset((AckStatus.Retry, AckStatus.Partial, AckStatus.Timeout))
+MAX_ATTEMPTS = 3
+BACKOFF_BASE = 0.05
+BACKOFF_MAX = 1.0
+# Ack metadata key a Pi may use to ask for a minimum delay before the retry
+RETRY_AFTER_KEY = "retry_after_ms"
+
+logger = logging.getLogger(__name__)
+
+
+class CommandResult(NamedTuple):
+    """Outcome of one command in a batch"""
+    ack: Optional[AckMessage]  # None if unacknowledged or never sent
+    seconds: Optional[float]  # send to ack, or to giving up; None if never sent
+    error: Optional[str] = None
+
+
+class CircuitOpen(PiUnavailable):
+    """Raised without contacting the Pi while the circuit is open"""
+
+    def __init__(self, message: str, retry_after: float):
+        super().__init__(message)
+        self.retry_after = retry_after
+
+
+class CircuitBreaker:
+    """
+    Closed: commands flow. Open: commands are rejected at once. Half open: a single
+    trial command is let through, and its outcome closes or reopens the circuit.
+
+    Only reachability counts: an ack of any status is a success, a missing ack a
+    failure. Opening on heartbeat loss lets the first answered heartbeat send a
+    trial at once; otherwise, or if heartbeats never come back (a Pi that
+    doesn't answer them), the trial waits out the usual cooldown.
+    """
+
+    CLOSED = "closed"
+    OPEN = "open"
+    HALF_OPEN = "half_open"
+    _STATE_VALUES = {CLOSED: 0, HALF_OPEN: 1, OPEN: 2}
+
+    def __init__(self, failure_threshold: int = FAILURE_THRESHOLD, open_seconds: float = OPEN_SECONDS):
+        self.failure_threshold = failure_threshold
+        self.open_seconds = open_seconds
+        self._lock = threading.Lock()
+        self._state = self.CLOSED
+        self._failures = 0
+        self._retry_at = 0.0
+        self._held = False
+        self._trial_in_flight = False
+        self.opened = 0
+        self.rejected = 0
+        self._set_state(self.CLOSED)
+
+    @property
+    def state(self) -> str:
+        return self._state
+
+    def allow(self) -> None:
+        """Raise CircuitOpen unless a command may be sent now"""
+        with self._lock:
+            if self._state == self.CLOSED:
+                return
+            now = time.monotonic()
+            if self._state == self.OPEN and now >= self._retry_at:
+                self._set_state(self.HALF_OPEN)
+            if self._state == self.HALF_OPEN and not self._trial_in_flight:
+                self._trial_in_flight = True
+                return
+            self.rejected += 1
+            if metrics.ENABLED:
+                metrics.COMMAND_CIRCUIT_REJECTIONS.labels().inc()
+            retry_after = max(0.0, self._retry_at - now)
+        raise CircuitOpen(f"Pi unreachable; circuit {self._state}", retry_after)
+
+    def record_success(self) -> None:
+        with self._lock:
+            self._failures = 0
+            self._trial_in_flight = False
+            if self._state != self.CLOSED:
+                logger.info("Command circuit closed")
+                self._set_state(self.CLOSED)
+
+    def record_failure(self) -> None:
+        with self._lock:
+            self._failures += 1
+            self._trial_in_flight = False
+            if self._state == self.HALF_OPEN or (self._state == self.CLOSED and
+                                                 self._failures >= self.failure_threshold):
+                self._open(held=False)
+
+    def trip(self) -> None:
+        """Open now, until probe_succeeded() or the cooldown lets a trial through"""
+        with self._lock:
+            if self._state != self.OPEN or not self._held:
+                self._open(held=True)
+
+    def probe_succeeded(self) -> None:
+        """The background probe reached the Pi: let the next command through as a trial"""
+        with self._lock:
+            self._held = False
+            if self._state == self.OPEN:
+                self._retry_at = time.monotonic()
+
+    def status(self) -> Dict[str, object]:
+        with self._lock:
+            return {
+                "state": self._state,
+                "consecutive_failures": self._failures,
+                "opened": self.opened,
+                "rejected": self.rejected,
+                "held_open": self._held,
+                "retry_in_s": max(0.0, self._retry_at - time.monotonic()) if self._state == self.OPEN else None,
+            }
+
+    def _open(self, held: bool) -> None:
+        # Jitter so several workers don't all send their trial at the same moment
+        self._retry_at = time.monotonic() + self.open_seconds * random.uniform(0.8, 1.2)
+        self._held = held
+        self._trial_in_flight = False
+        self.opened += 1
+        if held:
+            logger.warning("Command circuit open: Pi stopped answering heartbeats")
+        elif self._state != self.OPEN:
+            logger.warning(f"Command circuit open after {self._failures} unacknowledged commands")
+        self._set_state(self.OPEN)
+
+    def _set_state(self, state: str) -> None:
+        self._state = state
+        if metrics.ENABLED:
+            metrics.COMMAND_CIRCUIT_STATE.labels().set(self._STATE_VALUES[state])
+
+
+class RetryPolicy:
+    """Bounded retries with full-jitter exponential backoff"""
+
+    def __init__(self, max_attempts: int = MAX_ATTEMPTS, base_delay: float = BACKOFF_BASE,
+                 max_delay: float = BACKOFF_MAX, retry_statuses: Iterable[int] = RETRY_STATUSES):
+        self.max_attempts = max_attempts
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.retry_statuses: FrozenSet[int] = frozenset(retry_statuses)
+
+    def should_retry(self, ack: AckMessage, attempt: int) -> bool:
+        return ack.ack_status in self.retry_statuses and attempt < self.max_attempts
+
+    def delay(self, ack: AckMessage, attempt: int) -> float:
+        """Seconds to wait before attempt + 1"""
+        delay = random.uniform(0, min(self.max_delay, self.base_delay * 2 ** (attempt - 1)))
+        hint = ack.metadata.get(RETRY_AFTER_KEY) if ack.metadata else None
+        if hint:
+            try:
+                delay = max(delay, float(hint) / 1000.0)
+            except ValueError:
+                pass
+        return delay
+
+
+class CommandDispatcher:
+    """
+    Sends commands through the circuit breaker and retry policy. The heartbeat
+    monitor is the background probe: losing the Pi trips the circuit, and the
+    first answered heartbeat lets a trial command through.
+    """
+
+    def __init__(self, client: CommandClient, monitor: HeartbeatMonitor,
+                 breaker: Optional[CircuitBreaker] = None, policy: Optional[RetryPolicy] = None):
+        self.client = client
+        self.monitor = monitor
+        self.breaker = breaker or CircuitBreaker()
+        self.policy = policy or RetryPolicy()
+        monitor.add_listener(self._on_liveness)
+
+    def send(self, command: SystemCommandMsg, timeout_ms: int = DEFAULT_TIMEOUT_MS) -> AckMessage:
+        """
+        Send a command, retrying acks with a retryable status, all within timeout_ms.
+        Raises CircuitOpen at once while the Pi is unreachable, CommandTimeout if it
+        doesn't answer; the last ack is returned once retries run out.
+        """
+        self.monitor.start()
+        deadline = time.monotonic() + timeout_ms / 1000.0
+        attempt = 0
+        while True:
+            attempt += 1
+            self.breaker.allow()
+            remaining_ms = int((deadline - time.monotonic()) * 1000)
+            try:
+                ack = self.client.send_command(command, max(1, remaining_ms))
+            except BaseException:
+                # Anything short of an ack (timeout, socket or decode error) settles a trial as failed
+                self.breaker.record_failure()
+                raise
+            self.breaker.record_success()
+            if not self.policy.should_retry(ack, attempt):
+                return ack
+            delay = self.policy.delay(ack, attempt)
+            if time.monotonic() + delay >= deadline:
+                return ack
+            if metrics.ENABLED:
+                metrics.COMMAND_RETRIES.labels(CommandID.get_name(command.command_id),
+                                               AckStatus.get_name(ack.ack_status)).inc()
+            time.sleep(delay)
+
+    def send_batch(self, commands: List[SystemCommandMsg], timeout_ms: int = DEFAULT_TIMEOUT_MS,
+                   stop_on_failure: bool = False) -> List[CommandResult]:
+        """
+        Run commands in order, within timeout_ms for the whole batch.
+
+        Normally they are pipelined: sent back to back over the one connection and
+        their acks collected afterwards, so the batch costs about one round trip.
+        Stopping at the first failure needs each ack before the next command goes
+        out, so with stop_on_failure they run one at a time (with retries) and the
+        rest are skipped. Raises CircuitOpen if nothing could be sent.
+        """
+        self.monitor.start()
+        if not stop_on_failure:
+            self.breaker.allow()
+            try:
+                sent = self.client.send_commands(commands, timeout_ms)
+            except BaseException:
+                self.breaker.record_failure()
+                raise
+            if any(ack is not None for ack, _ in sent):
+                self.breaker.record_success()
+            else:
+                self.breaker.record_failure()
+            return [CommandResult(ack, seconds, None if ack is not None else "No acknowledgment")
+                    for ack, seconds in sent]
+
+        deadline = time.monotonic() + timeout_ms / 1000.0
+        results: List[CommandResult] = []
+        for command in commands:
+            remaining_ms = int((deadline - time.monotonic()) * 1000)
+            if remaining_ms <= 0:
+                results.append(CommandResult(None, None, f"Batch timeout of {timeout_ms}ms reached"))
+                break
+            start = time.perf_counter()
+            try:
+                ack = self.send(command, remaining_ms)
+            except CircuitOpen as e:
+                if not results:
+                    raise
+                results.append(CommandResult(None, None, str(e)))
+                break
+            except CommandTimeout as e:
+                results.append(CommandResult(None, time.perf_counter() - start, str(e)))
+                break
+            results.append(CommandResult(ack, time.perf_counter() - start))
+            if ack.ack_status != AckStatus.Success:
+                break
+        results.extend(CommandResult(None, None, "Skipped after an earlier failure")
+                       for _ in commands[len(results):])
+        return results
+
+    def status(self) -> Dict[str, object]:
+        return self.breaker.status()
+
+    def _on_liveness(self, agent_id: str, alive: bool) -> None:
+        if alive:
+            self.breaker.probe_succeeded()
+        else:
+            self.breaker.trip()
@@ -0,0 +1,324 @@
+"""
+PiTrac Heartbeat Monitor
+Exchanges HeartbeatMsg with the Pi over the command channel twice a second,
+tracking round trip time, liveness and the Pi's clock offset, and follows heartbeats
+other agents publish. A Pi that stops answering while no command is in flight is
+declared dead, and commands sent to it afterwards are released at once rather
+than each timing out.
+"""
+
+import logging
+import os
+import threading
+import time
+from typing import Callable, Dict, List, Optional
+
+from app import metrics
+from app.clock import ClockSync, to_us
+from app.messages.common import AckMessage
+from app.messages.internal import HeartbeatMsg
+from app.routes.command.client import CommandClient, CommandTimeout
+
+HEARTBEAT_INTERVAL = 0.5
+# Far shorter than a command's timeout; a heartbeat held up behind a command isn't counted as missed
+HEARTBEAT_TIMEOUT_MS = 250
+# Consecutive unanswered heartbeats, with no command in flight, before the Pi is declared dead
+MISSES_BEFORE_DEAD = 2
+# A Pi that has never answered this many heartbeats is taken not to understand them;
+# the monitor then stops polling and only follows heartbeats the Pi publishes
+UNANSWERED_BEFORE_PASSIVE = 3
+# PITRAC_HEARTBEAT_POLL=0 never sends heartbeats, for Pis known not to answer them
+HEARTBEAT_POLL = os.environ.get("PITRAC_HEARTBEAT_POLL", "1") != "0"
+# Agents that only publish heartbeats are dead once silent this long
+PUBLISHED_STALE_AFTER = 3.0
+# Weight of the newest round trip in the smoothed average
+RTT_SMOOTHING = 0.2
+
+logger = logging.getLogger(__name__)
+
+
+class AgentHealth:
+    """Liveness and round trip statistics for one agent"""
+    __slots__ = ('agent_id', 'polled', 'responding', 'last_seen', 'last_seen_us', 'sequence', 'status',
+                 'rtt_ms', 'rtt_min_ms', 'rtt_avg_ms', 'misses', 'total_misses', 'replies')
+
+    def __init__(self, agent_id: str, polled: bool):
+        self.agent_id = agent_id
+        self.polled = polled
+        # None until the first reply or declared death
+        self.responding: Optional[bool] = None
+        self.last_seen = 0.0  # monotonic
+        self.last_seen_us = 0  # wall clock, for display
+        self.sequence = 0
+        self.status = ""
+        self.rtt_ms: Optional[float] = None
+        self.rtt_min_ms: Optional[float] = None
+        self.rtt_avg_ms: Optional[float] = None
+        self.misses = 0
+        self.total_misses = 0
+        self.replies = 0
+
+    @property
+    def alive(self) -> bool:
+        if self.polled:
+            return self.responding is True
+        return self.last_seen > 0 and time.monotonic() - self.last_seen < PUBLISHED_STALE_AFTER
+
+    def seen(self, sequence: int, status: str) -> None:
+        self.last_seen = time.monotonic()
+        self.last_seen_us = time.time_ns() // 1000
+        self.sequence = sequence
+        self.status = status
+        self.replies += 1
+
+    def record_rtt(self, rtt_ms: float) -> None:
+        self.rtt_ms = rtt_ms
+        self.rtt_min_ms = rtt_ms if self.rtt_min_ms is None else min(self.rtt_min_ms, rtt_ms)
+        self.rtt_avg_ms = (rtt_ms if self.rtt_avg_ms is None
+                           else self.rtt_avg_ms + RTT_SMOOTHING * (rtt_ms - self.rtt_avg_ms))
+
+    def to_dict(self) -> Dict[str, object]:
+        return {
+            "agent_id": self.agent_id,
+            "alive": self.alive,
+            "down": self.polled and self.responding is False,
+            "polled": self.polled,
+            "last_seen_ms": self.last_seen_us // 1000 if self.last_seen_us else None,
+            "age_ms": (time.monotonic() - self.last_seen) * 1000 if self.last_seen else None,
+            "sequence": self.sequence,
+            "status": self.status,
+            "rtt_ms": self.rtt_ms,
+            "rtt_min_ms": self.rtt_min_ms,
+            "rtt_avg_ms": self.rtt_avg_ms,
+            "misses": self.misses,
+            "total_misses": self.total_misses,
+        }
+
+
+class HeartbeatMonitor:
+    """
+    Polls the Pi with HeartbeatMsg on a background thread.
+
+    Each exchange carries four timestamps (our send, Pi receive, Pi send, our
+    receive), giving the round trip with the Pi's own processing time removed and
+    a sample for the shared clock offset estimate. A Pi that only acknowledges
+    heartbeats still counts as alive, and its ack_timestamp is a coarser sample.
+
+    Missed heartbeats only count against the Pi while no command is in flight: a
+    Pi busy with a slow command is not dead, and the command's own timeout
+    decides. A Pi that never answers a heartbeat is not declared dead either;
+    polling stops, and its liveness comes from heartbeats it publishes, if any.
+
+    An idle Pi that dies is declared dead within misses_before_dead * interval
+    + timeout_ms of its last reply: 1.25 s with the defaults, against 2 s for a
+    single command to time out.
+    """
+
+    def __init__(self, client: CommandClient, agent_id: str = "web", target: str = "pi",
+                 interval: float = HEARTBEAT_INTERVAL, timeout_ms: int = HEARTBEAT_TIMEOUT_MS,
+                 misses_before_dead: int = MISSES_BEFORE_DEAD, poll: bool = HEARTBEAT_POLL):
+        self._client = client
+        self.agent_id = agent_id
+        self.target = target
+        self.interval = interval
+        self.timeout_ms = timeout_ms
+        self.misses_before_dead = misses_before_dead
+        self._polling = poll
+        # Whether the target has ever answered a heartbeat we sent
+        self._answered = False
+        self._agents: Dict[str, AgentHealth] = {target: AgentHealth(target, polled=poll)}
+        self._agents_lock = threading.Lock()
+        self._lock = threading.Lock()
+        self._thread: Optional[threading.Thread] = None
+        self._stop_event = threading.Event()
+        self._sequence = 0
+        self._listeners: List[Callable[[str, bool], None]] = []
+        self._status_listeners: List[Callable[[str, str], None]] = []
+
+    @property
+    def clock(self) -> ClockSync:
+        return self._client.clock
+
+    @property
+    def polling(self) -> bool:
+        """Whether heartbeats are being sent (False once the Pi proved not to answer them)"""
+        return self._polling
+
+    @property
+    def pi_alive(self) -> bool:
+        return self._agents[self.target].alive
+
+    @property
+    def pi_down(self) -> bool:
+        """Declared dead after missed heartbeats (False while still unknown)"""
+        return self._agents[self.target].responding is False
+
+    def add_listener(self, listener: Callable[[str, bool], None]) -> None:
+        """Call listener(agent_id, alive) whenever the Pi is declared dead or answers again"""
+        self._listeners.append(listener)
+
+    def add_status_listener(self, listener: Callable[[str, str], None]) -> None:
+        """Call listener(agent_id, status) for every heartbeat carrying a status"""
+        self._status_listeners.append(listener)
+
+    def start(self) -> None:
+        """Start polling the Pi (idempotent)"""
+        with self._lock:
+            if self._thread is not None:
+                return
+            self._stop_event.clear()
+            self._thread = threading.Thread(target=self._run, name="pitrac-heartbeat", daemon=True)
+            self._thread.start()
+
+    def close(self) -> None:
+        with self._lock:
+            thread = self._thread
+            self._thread = None
+        if thread is not None:
+            self._stop_event.set()
+            thread.join()
+
+    def observe(self, heartbeat: HeartbeatMsg) -> None:
+        """Record a heartbeat an agent published on its own (e.g. on a status channel)"""
+        if not heartbeat.agent_id:
+            return
+        recovered = False
+        with self._agents_lock:
+            health = self._agents.get(heartbeat.agent_id)
+            if health is None:
+                health = self._agents[heartbeat.agent_id] = AgentHealth(heartbeat.agent_id, polled=False)
+            health.seen(heartbeat.sequence, heartbeat.status)
+            if heartbeat.agent_id == self.target and not health.polled:
+                # Published heartbeats are the target's liveness when it isn't polled
+                recovered = health.responding is not True
+                health.responding = True
+        if recovered:
+            logger.info(f"{self.target} is publishing heartbeats")
+            self._notify(True)
+            if metrics.ENABLED:
+                metrics.AGENT_UP.labels(self.target).set(1)
+        if heartbeat.status:
+            self._notify_status(heartbeat.agent_id, heartbeat.status)
+
+    def status(self) -> Dict[str, object]:
+        with self._agents_lock:
+            agents: List[Dict[str, object]] = [health.to_dict() for health in self._agents.values()]
+        return {"agents": agents, "clock": self.clock.status(), "interval_ms": self.interval * 1000,
+                "timeout_ms": self.timeout_ms, "polling": self._polling}
+
+    def _run(self) -> None:
+        if self._polling:
+            logger.info(f"Heartbeat monitor polling {self.target} every {self.interval * 1000:.0f}ms")
+        while not self._stop_event.is_set():
+            started = time.monotonic()
+            if self._polling:
+                self._beat()
+            else:
+                self._check_published()
+            self._stop_event.wait(max(0.0, self.interval - (time.monotonic() - started)))
+
+    def _beat(self) -> None:
+        self._sequence += 1
+        heartbeat = HeartbeatMsg(agent_id=self.agent_id, sequence=self._sequence)
+        # A command in flight at either end of the exchange may have held the heartbeat up
+        busy = self._client.commands_in_flight() > 0
+        try:
+            reply, received_us = self._client.send_heartbeat(heartbeat, self.timeout_ms)
+        except CommandTimeout:
+            self._missed(busy or self._client.commands_in_flight() > 0)
+            return
+        self._replied(heartbeat, reply, received_us)
+
+    def _replied(self, heartbeat: HeartbeatMsg, reply, received_us: int) -> None:
+        sent_us = heartbeat.origin_timestamp
+        status = ""
+        remote = None
+        if isinstance(reply, HeartbeatMsg):
+            status = reply.status
+            if reply.receive_timestamp and reply.transmit_timestamp:
+                remote = (to_us(reply.receive_timestamp), to_us(reply.transmit_timestamp))
+        elif isinstance(reply, AckMessage):
+            status = reply.metadata.get("mode", "") if reply.metadata else ""
+            if reply.ack_timestamp:
+                remote = (to_us(reply.ack_timestamp),) * 2
+        if remote is not None:
+            sample = self.clock.add_exchange(sent_us, remote[0], remote[1], received_us)
+            rtt_ms = sample.delay_us / 1000.0
+        else:
+            rtt_ms = (received_us - sent_us) / 1000.0
+
+        health = self._agents[self.target]
+        self._answered = True
+        with self._agents_lock:
+            recovered = health.responding is not True
+            health.responding = True
+            health.misses = 0
+            health.seen(heartbeat.sequence, status)
+            health.record_rtt(rtt_ms)
+        if recovered:
+            logger.info(f"{self.target} is answering heartbeats ({rtt_ms:.1f}ms round trip)")
+            self._notify(True)
+        if status:
+            self._notify_status(self.target, status)
+        if metrics.ENABLED:
+            metrics.HEARTBEAT_RTT_SECONDS.labels(self.target).observe(rtt_ms / 1000.0)
+            metrics.AGENT_UP.labels(self.target).set(1)
+            metrics.PI_CLOCK_OFFSET_SECONDS.labels().set(self.clock.offset_us / 1_000_000)
+
+    def _missed(self, busy: bool) -> None:
+        health = self._agents[self.target]
+        with self._agents_lock:
+            health.total_misses += 1
+            # Waiting behind a command is not a sign of death; the command's timeout decides
+            if not busy:
+                health.misses += 1
+            if not self._answered:
+                # Never answered: probably a Pi that doesn't know HeartbeatMsg, not a dead one
+                if health.misses >= UNANSWERED_BEFORE_PASSIVE:
+                    self._polling = False
+                    health.polled = False
+                    health.misses = 0
+                    logger.warning(f"{self.target} never answered a heartbeat; following published "
+                                   f"heartbeats only")
+                died = False
+            else:
+                died = health.responding is not False and health.misses >= self.misses_before_dead
+            if died:
+                health.responding = False
+        if metrics.ENABLED:
+            metrics.HEARTBEAT_MISSES.labels(self.target).inc()
+            if died:
+                metrics.AGENT_UP.labels(self.target).set(0)
+        if died:
+            # Nothing was in flight while it went quiet; release commands sent since
+            released = self._client.fail_pending(f"{self.target} stopped answering heartbeats")
+            logger.warning(f"{self.target} missed {health.misses} heartbeats; considered dead "
+                           f"({released} waiting commands released)")
+            self._notify(False)
+
+    def _check_published(self) -> None:
+        """Unpolled target: dead once its published heartbeats go stale"""
+        health = self._agents[self.target]
+        with self._agents_lock:
+            died = health.responding is True and not health.alive
+            if died:
+                health.responding = False
+        if died:
+            logger.warning(f"{self.target} stopped publishing heartbeats; considered dead")
+            if metrics.ENABLED:
+                metrics.AGENT_UP.labels(self.target).set(0)
+            self._notify(False)
+
+    def _notify(self, alive: bool) -> None:
+        for listener in self._listeners:
+            try:
+                listener(self.target, alive)
+            except Exception:
+                logger.exception("Heartbeat listener failed")
+
+    def _notify_status(self, agent_id: str, status: str) -> None:
+        for listener in self._status_listeners:
+            try:
+                listener(agent_id, status)
+            except Exception:
+                logger.exception("Heartbeat status listener failed")
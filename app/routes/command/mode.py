@@ -0,0 +1,167 @@
+"""
+PiTrac System Mode
+Last known SystemMode of the Pi, kept from successful SetMode acks and the mode the
+Pi reports in its heartbeats, so the mode can be read without a round trip and
+mode changes that would change nothing are never sent.
+"""
+
+import logging
+import threading
+import time
+from typing import Dict, Optional, Tuple
+
+from app.app import SystemMode
+from app.messages.common import AckMessage
+from app.messages.common.AckMessage import AckStatus
+from app.messages.external import SystemCommandMsg
+from app.messages.external.SystemCommandMsg import CommandID
+from app.routes.command.dispatcher import CommandDispatcher
+
+# Names the API accepts and reports
+MODE_NAMES = {
+    "standby": SystemMode.STANDBY,
+    "viewfinder": SystemMode.VIEWFINDER,
+    "calibration": SystemMode.CALIBRATION,
+    "launch_monitor": SystemMode.LAUNCH_MONITOR,
+    "diagnostic": SystemMode.DIAGNOSTIC,
+}
+
+logger = logging.getLogger(__name__)
+
+
+def mode_name(mode: SystemMode) -> str:
+    for name, value in MODE_NAMES.items():
+        if value == mode:
+            return name
+    return mode.name.lower()
+
+
+def parse_mode(value: str) -> Optional[SystemMode]:
+    """A mode as reported by the Pi: its number ("3") or name ("viewfinder", "VIEWFINDER")"""
+    value = value.strip()
+    try:
+        return SystemMode(int(value))
+    except ValueError:
+        pass
+    mode = MODE_NAMES.get(value.lower())
+    if mode is None:
+        mode = SystemMode.__members__.get(value.upper())
+    return mode
+
+
+class _ModeChange:
+    """One SetMode command in flight, shared by every request asking for the same mode"""
+
+    def __init__(self):
+        self.done = threading.Event()
+        self.ack: Optional[AckMessage] = None
+        self.error: Optional[BaseException] = None
+
+
+class ModeController:
+    """
+    Cached SystemMode plus the mode changes in flight.
+
+    A change to the mode already active returns at once; concurrent requests for
+    the same mode share one SetMode command and its ack. Losing the Pi forgets the
+    mode, since it may come back from a reboot in a different one.
+    """
+
+    def __init__(self, dispatcher: CommandDispatcher):
+        self._dispatcher = dispatcher
+        self._lock = threading.Lock()
+        self._mode: Optional[SystemMode] = None
+        self._source: Optional[str] = None
+        self._updated_ms = 0
+        self._ack_at = 0.0
+        self._in_flight: Dict[SystemMode, _ModeChange] = {}
+        self.sent = 0
+        self.unchanged = 0
+        self.coalesced = 0
+        monitor = dispatcher.monitor
+        monitor.add_listener(self._on_liveness)
+        monitor.add_status_listener(self._on_status)
+
+    @property
+    def mode(self) -> Optional[SystemMode]:
+        return self._mode
+
+    def update(self, mode: SystemMode, source: str) -> None:
+        with self._lock:
+            if mode != self._mode:
+                logger.info(f"Pi mode {mode_name(mode)} (from {source})")
+            self._mode = mode
+            self._source = source
+            self._updated_ms = int(time.time() * 1000)
+            if source == "ack":
+                self._ack_at = time.monotonic()
+
+    def change(self, mode: SystemMode, force: bool = False) -> Tuple[Optional[AckMessage], str]:
+        """
+        Switch the Pi to mode. Returns (ack, outcome): outcome is "unchanged" (no
+        command sent, ack None), "sent" or "coalesced" (shared another request's ack).
+        Raises what CommandDispatcher.send raises.
+        """
+        self._dispatcher.monitor.start()
+        with self._lock:
+            if not force and mode == self._mode:
+                self.unchanged += 1
+                return None, "unchanged"
+            change = self._in_flight.get(mode)
+            leader = change is None
+            if leader:
+                change = self._in_flight[mode] = _ModeChange()
+            else:
+                self.coalesced += 1
+        if not leader:
+            change.done.wait()
+            if change.error is not None:
+                raise change.error
+            return change.ack, "coalesced"
+
+        try:
+            command = SystemCommandMsg(command_id=CommandID.SetMode, command_params={"mode": str(int(mode))})
+            self.sent += 1
+            change.ack = self._dispatcher.send(command)
+            if change.ack.ack_status == AckStatus.Success:
+                reported = parse_mode(change.ack.metadata.get("mode", "")) if change.ack.metadata else None
+                self.update(reported if reported is not None else mode, "ack")
+            return change.ack, "sent"
+        except BaseException as e:
+            change.error = e
+            raise
+        finally:
+            with self._lock:
+                del self._in_flight[mode]
+            change.done.set()
+
+    def status(self) -> Dict[str, object]:
+        with self._lock:
+            return {
+                "mode": mode_name(self._mode) if self._mode is not None else None,
+                "value": int(self._mode) if self._mode is not None else None,
+                "source": self._source,
+                "updated_ms": self._updated_ms or None,
+                "pending": [mode_name(mode) for mode in self._in_flight],
+            }
+
+    def _on_status(self, agent_id: str, status: str) -> None:
+        if agent_id != self._dispatcher.monitor.target:
+            return
+        mode = parse_mode(status)
+        if mode is None:
+            return
+        # A heartbeat answered before a mode change completed can arrive after its
+        # ack; the ack wins until heartbeats sent after it come back
+        monitor = self._dispatcher.monitor
+        with self._lock:
+            if self._in_flight or time.monotonic() - self._ack_at < monitor.interval + monitor.timeout_ms / 1000.0:
+                return
+        self.update(mode, "heartbeat")
+
+    def _on_liveness(self, agent_id: str, alive: bool) -> None:
+        if not alive:
+            with self._lock:
+                self._mode = None
+                self._source = None
+                self._updated_ms = int(time.time() * 1000)
@@ -0,0 +1,16 @@
+from flask import(
+    Blueprint, Response, abort
+)
+
+from app import metrics
+
+bp = Blueprint('metrics', __name__)
+
+PROMETHEUS_MIMETYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+
+@bp.route("/metrics")
+def prometheus_metrics():
+    if not metrics.ENABLED:
+        abort(404)
+    return Response(metrics.REGISTRY.render(), mimetype=PROMETHEUS_MIMETYPE)
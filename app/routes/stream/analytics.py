@@ -0,0 +1,164 @@
+"""
+Viewfinder Frame Analytics
+Exposure and motion statistics computed once per new frame, on a small grayscale
+copy, for setting up the cameras: is the exposure clipped, and is anything moving
+in the hitting zone. The cost per frame is fixed, however many clients read it.
+"""
+
+import logging
+import threading
+import time
+from typing import Any, Dict, Iterator, Optional, Tuple
+
+import numpy as np
+
+from app import metrics
+from app.messages.external import CameraFrameMsg
+from app.routes.stream.broadcaster import FrameBroadcaster, decode_frame
+from app.routes.tasks.aggregator import sse_event
+
+# Width of the grayscale copy analysed; JPEGs are decoded straight to about this size
+ANALYSIS_WIDTH = 160
+HISTOGRAM_BINS = 32
+# Luminance at or beyond these counts as clipped shadows / highlights
+CLIP_LOW = 2
+CLIP_HIGH = 253
+# Per-pixel change (0-255) counted as motion, and the grid motion is also reported on
+MOTION_THRESHOLD = 16
+MOTION_GRID = 4
+
+logger = logging.getLogger(__name__)
+
+
+def analyze(gray: np.ndarray, previous: Optional[np.ndarray]) -> Dict[str, Any]:
+    """Statistics of one grayscale frame, with motion relative to previous (same shape) when given"""
+    pixels = gray.size
+    counts = np.bincount(gray.ravel(), minlength=256)
+    histogram = counts.reshape(HISTOGRAM_BINS, -1).sum(axis=1) / pixels
+    levels = np.arange(256)
+    mean = float(counts @ levels) / pixels
+    std = float(np.sqrt(max(0.0, float(counts @ (levels * levels)) / pixels - mean * mean)))
+    result = {
+        "width": gray.shape[1],
+        "height": gray.shape[0],
+        "mean": mean,
+        "std": std,
+        "histogram": np.round(histogram, 5).tolist(),
+        "clipped_low_pct": float(counts[:CLIP_LOW + 1].sum()) * 100.0 / pixels,
+        "clipped_high_pct": float(counts[CLIP_HIGH:].sum()) * 100.0 / pixels,
+        "motion": None,
+        "motion_pct": None,
+        "motion_grid": None,
+    }
+    if previous is not None and previous.shape == gray.shape:
+        difference = np.abs(gray.astype(np.int16) - previous.astype(np.int16))
+        moving = difference > MOTION_THRESHOLD
+        result["motion"] = float(difference.mean()) / 255.0
+        result["motion_pct"] = float(moving.mean()) * 100.0
+        # Share of moving pixels per cell, cropping the remainder so the grid divides evenly
+        rows, cols = gray.shape[0] // MOTION_GRID, gray.shape[1] // MOTION_GRID
+        if rows and cols:
+            cells = moving[:rows * MOTION_GRID, :cols * MOTION_GRID].reshape(MOTION_GRID, rows, MOTION_GRID, cols)
+            result["motion_grid"] = np.round(cells.mean(axis=(1, 3)) * 100.0, 2).tolist()
+    return result
+
+
+class FrameAnalyzer:
+    """
+    Analyses a camera's frames on its own thread. The frame listener only drops
+    the newest frame into a one-slot mailbox, so the receiver never waits, and a
+    frame that arrives while the previous one is still being analysed replaces
+    the one waiting rather than queueing behind it.
+    """
+
+    def __init__(self, cam_index: int, width: int = ANALYSIS_WIDTH):
+        self.cam_index = cam_index
+        self.width = width
+        self._changed = threading.Condition()
+        self._mailbox: Optional[CameraFrameMsg] = None
+        self._result: Optional[Dict[str, Any]] = None
+        self._version = 0
+        self._previous: Optional[np.ndarray] = None
+        self._thread: Optional[threading.Thread] = None
+        self.analyzed = 0
+        self.skipped = 0
+
+    def attach(self, broadcaster: FrameBroadcaster) -> None:
+        broadcaster.add_frame_listener(self.submit)
+
+    def submit(self, frame: CameraFrameMsg) -> None:
+        with self._changed:
+            if self._mailbox is not None:
+                self.skipped += 1
+                if metrics.ENABLED:
+                    metrics.FRAMES_DROPPED.labels(self.cam_index, "analytics_busy").inc()
+            self._mailbox = frame
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name=f"pitrac-analytics-{self.cam_index}",
+                                                daemon=True)
+                self._thread.start()
+            self._changed.notify_all()
+
+    def latest(self) -> Tuple[int, Optional[Dict[str, Any]]]:
+        """Current version and the newest result (None before the first frame)"""
+        with self._changed:
+            return self._version, self._result
+
+    def wait_for_result(self, version: int, timeout: Optional[float] = None) -> Tuple[int, Optional[Dict[str, Any]]]:
+        """Block until a result newer than version is available or timeout expires"""
+        with self._changed:
+            self._changed.wait_for(lambda: self._version != version, timeout)
+            return self._version, self._result
+
+    def _run(self) -> None:
+        while True:
+            with self._changed:
+                self._changed.wait_for(lambda: self._mailbox is not None)
+                frame, self._mailbox = self._mailbox, None
+            try:
+                result = self._analyze(frame)
+            except Exception as e:
+                logger.error(f"Camera {self.cam_index} analytics failed: {e}")
+                continue
+            if result is None:
+                continue
+            with self._changed:
+                self._version += 1
+                self._result = result
+                self._changed.notify_all()
+
+    def _analyze(self, frame: CameraFrameMsg) -> Optional[Dict[str, Any]]:
+        start = time.perf_counter()
+        gray = decode_frame(frame, self.width, grayscale=True)
+        if gray is None:
+            return None
+        result = analyze(gray, self._previous)
+        self._previous = gray
+        self.analyzed += 1
+        elapsed = time.perf_counter() - start
+        if metrics.ENABLED:
+            metrics.FRAME_ANALYSIS_SECONDS.labels(self.cam_index).observe(elapsed)
+        result.update({
+            "camera": self.cam_index,
+            "frame_number": frame.frame_number,
+            "capture_timestamp": frame.capture_timestamp,
+            "analysis_ms": elapsed * 1000,
+            "analyzed": self.analyzed,
+            "skipped": self.skipped,
+        })
+        return result
+
+
+def iter_analytics_events(analyzer: FrameAnalyzer, min_interval: float, keepalive: float) -> Iterator[str]:
+    """SSE stream of the newest result at most once per min_interval, with comments as keepalives when idle"""
+    version = -1
+    while True:
+        new_version, result = analyzer.wait_for_result(version, keepalive)
+        if new_version == version or result is None:
+            yield ": keepalive\n\n"
+            version = new_version
+            continue
+        version = new_version
+        yield sse_event("analytics", result, version)
+        # Rate limit: frames analysed meanwhile are skipped, only the newest is sent
+        time.sleep(min_interval)
@@ -0,0 +1,398 @@
+"""
+Viewfinder Frame Broadcaster
+Encodes each new camera frame once and shares the finished multipart chunk with every viewer
+"""
+
+import logging
+import threading
+import time
+from collections import OrderedDict
+from typing import Callable, Dict, List, NamedTuple, Optional, Tuple
+
+import cv2
+import numpy as np
+
+from app import metrics
+from app.clock import PI_CLOCK
+from app.messages.external import CameraFrameMsg
+from app.messages.msgpack_buffer import Buffer
+
+MJPEG_BOUNDARY = "frame"
+MJPEG_MIMETYPE = f"multipart/x-mixed-replace; boundary={MJPEG_BOUNDARY}"
+
+JPEG_CODECS = ("jpeg", "jpg", "mjpeg", "mjpg")
+JPEG_MAGIC = b'\xff\xd8'
+
+# JPEG start-of-frame markers carrying the image dimensions
+_SOF_MARKERS = frozenset(range(0xc0, 0xd0)) - {0xc4, 0xc8, 0xcc}
+
+# Scale factors cv2 can apply while decoding a JPEG
+_REDUCED_DECODE_FLAGS = ((8, cv2.IMREAD_REDUCED_COLOR_8), (4, cv2.IMREAD_REDUCED_COLOR_4),
+                         (2, cv2.IMREAD_REDUCED_COLOR_2))
+_REDUCED_GRAYSCALE_FLAGS = ((8, cv2.IMREAD_REDUCED_GRAYSCALE_8), (4, cv2.IMREAD_REDUCED_GRAYSCALE_4),
+                            (2, cv2.IMREAD_REDUCED_GRAYSCALE_2))
+
+
+class QualityTier(NamedTuple):
+    """A fixed stream variant; max_width None means native resolution"""
+    name: str
+    max_width: Optional[int]
+    jpeg_quality: int
+
+
+# Every viewer maps onto one of these, so encode work is bounded by the number of tiers
+QUALITY_TIERS = {
+    "full": QualityTier("full", None, 95),
+    "high": QualityTier("high", 1280, 85),
+    "medium": QualityTier("medium", 640, 75),
+    "low": QualityTier("low", 320, 60),
+}
+FULL_TIER = QUALITY_TIERS["full"]
+
+# Distinct regions of interest cached per camera before the least recently used is dropped
+MAX_ROI_CACHE = 16
+ROI_JPEG_QUALITY = 90
+
+
+class RegionOfInterest(NamedTuple):
+    """Crop rectangle in source pixels (before any flip), plus an output scale factor"""
+    x: int
+    y: int
+    w: int
+    h: int
+    scale: float = 1.0
+
+_blank_chunk: Optional[bytes] = None
+
+logger = logging.getLogger(__name__)
+
+
+_CHUNK_HEAD = b'--' + MJPEG_BOUNDARY.encode('ascii') + b'\r\nContent-Type: image/jpeg\r\n'
+
+
+def make_chunk(jpeg: bytes, capture_timestamp: int = 0) -> bytes:
+    """
+    Wrap JPEG bytes in a multipart/x-mixed-replace part. Content-Length lets
+    non-browser clients read parts without scanning for the boundary;
+    X-Timestamp carries the capture time (seconds since epoch, on the server's
+    clock) when known.
+    """
+    headers = b'Content-Length: %d\r\n' % len(jpeg)
+    if capture_timestamp:
+        seconds, micros = divmod(capture_timestamp, 1_000_000)
+        headers += b'X-Timestamp: %d.%06d\r\n' % (seconds, micros)
+    return _CHUNK_HEAD + headers + b'\r\n' + jpeg + b'\r\n'
+
+
+def chunk_payload(chunk: bytes) -> memoryview:
+    """The JPEG inside a chunk built by make_chunk, without copying it"""
+    return memoryview(chunk)[chunk.index(b'\r\n\r\n') + 4:-2]
+
+
+def blank_chunk() -> bytes:
+    """Placeholder chunk sent before a camera has produced its first frame"""
+    global _blank_chunk
+    if _blank_chunk is None:
+        ret, jpeg = cv2.imencode('.jpg', np.zeros((480, 640, 3), dtype=np.uint8))
+        _blank_chunk = make_chunk(jpeg.tobytes()) if ret else b''
+    return _blank_chunk
+
+
+def is_jpeg(frame: CameraFrameMsg) -> bool:
+    """Check whether a frame's image_data is already JPEG encoded"""
+    codec = frame.metadata.get("codec", "") if frame.metadata else ""
+    if codec:
+        return codec.lower() in JPEG_CODECS
+    # Older publishers don't fill in the codec, so sniff the SOI marker
+    return bytes(frame.image_data[:2]) == JPEG_MAGIC
+
+
+def select_tier(width: Optional[int] = None, quality: Optional[str] = None) -> QualityTier:
+    """Map ?width= / ?quality= onto a tier: a named tier wins, else the smallest tier at least width wide"""
+    if quality in QUALITY_TIERS:
+        return QUALITY_TIERS[quality]
+    if width:
+        scaled = sorted((tier for tier in QUALITY_TIERS.values() if tier.max_width), key=lambda tier: tier.max_width)
+        for tier in scaled:
+            if tier.max_width >= width:
+                return tier
+    return FULL_TIER
+
+
+def jpeg_size(data: bytes) -> Optional[Tuple[int, int]]:
+    """Read (width, height) from a JPEG's SOF header without decoding it"""
+    view = memoryview(data)
+    i = 2
+    while i + 9 <= len(view):
+        if view[i] != 0xff:
+            return None
+        marker = view[i + 1]
+        if marker == 0xff:
+            i += 1  # Fill byte
+        elif marker in _SOF_MARKERS:
+            return (view[i + 7] << 8 | view[i + 8], view[i + 5] << 8 | view[i + 6])
+        elif marker == 0x01 or 0xd0 <= marker <= 0xd8:
+            i += 2  # Markers without a length
+        else:
+            i += 2 + (view[i + 2] << 8 | view[i + 3])
+    return None
+
+
+def decode_frame(frame: CameraFrameMsg, max_width: Optional[int] = None,
+                 grayscale: bool = False) -> Optional[np.ndarray]:
+    """
+    Decode a frame's image_data into a BGR (or single channel grayscale) image,
+    no wider than max_width. JPEGs are decoded at a reduced scale when that still
+    covers max_width.
+    """
+    buffer = np.frombuffer(frame.image_data, dtype=np.uint8)
+    if buffer.size == 0:
+        return None
+    flags = cv2.IMREAD_GRAYSCALE if grayscale else cv2.IMREAD_COLOR
+    if max_width and is_jpeg(frame):
+        size = jpeg_size(frame.image_data)
+        if size is not None:
+            for factor, reduced_flags in _REDUCED_GRAYSCALE_FLAGS if grayscale else _REDUCED_DECODE_FLAGS:
+                if size[0] // factor >= max_width:
+                    flags = reduced_flags
+                    break
+    image = cv2.imdecode(buffer, flags)
+    if image is not None and max_width and image.shape[1] > max_width:
+        height = max(1, round(image.shape[0] * max_width / image.shape[1]))
+        image = cv2.resize(image, (max_width, height), interpolation=cv2.INTER_AREA)
+    return image
+
+
+class _TierCache:
+    """Chunk most recently built for one quality tier"""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.source: Optional[CameraFrameMsg] = None
+        self.chunk: Optional[bytes] = None
+
+
+class FrameBroadcaster:
+    """
+    Per-camera encoder shared by all viewers of a stream.
+
+    The first viewer to see a new frame builds its chunk; everyone else reuses it.
+    Chunks are immutable bytes, so subscribers can write them out without holding
+    any lock. JPEG frames that need no server-side transform are passed through
+    as-is. Upside-down cameras are flipped here unless a viewer asks for
+    client_flip and flips the image itself (the viewfinder page does, with CSS).
+    Reduced quality tiers are built at most once per frame and flip, on first request.
+
+    Each new frame_number bumps a generation counter and wakes every viewer
+    blocked in wait_for_frame, so streams run at the camera's own rate.
+    """
+
+    def __init__(self, cam_index: int, flip: bool = False):
+        self.cam_index = cam_index
+        self._flip = flip
+        self._new_frame = threading.Condition()
+        self._generation = 0
+        self._finished = False
+        self._frame: Optional[CameraFrameMsg] = None
+        self._tiers: Dict[Tuple[str, bool], _TierCache] = {(name, flipped): _TierCache()
+                                                           for name in QUALITY_TIERS for flipped in (False, True)}
+        self._rois: "OrderedDict[RegionOfInterest, _TierCache]" = OrderedDict()
+        self._rois_lock = threading.Lock()
+        self._decode_lock = threading.Lock()
+        self._decoded_source: Optional[CameraFrameMsg] = None
+        self._decoded: Optional[np.ndarray] = None
+        self._listeners: List[Callable[[CameraFrameMsg], None]] = []
+        self._wire_listeners: List[Callable[[CameraFrameMsg, Optional[Buffer]], None]] = []
+
+    @property
+    def flip(self) -> bool:
+        """Whether this camera's image is upside down"""
+        return self._flip
+
+    @property
+    def finished(self) -> bool:
+        """Whether the source has ended and no further frames will be published"""
+        return self._finished
+
+    def finish(self) -> None:
+        """Mark the stream as ended (e.g. a replay ran out of frames) and wake waiting viewers"""
+        with self._new_frame:
+            self._finished = True
+            self._new_frame.notify_all()
+
+    def add_frame_listener(self, listener: Callable[[CameraFrameMsg], None]) -> None:
+        """Call listener with every new frame (on the receiver thread, so keep it quick)"""
+        self._listeners.append(listener)
+
+    def add_wire_listener(self, listener: Callable[[CameraFrameMsg, Optional[Buffer]], None]) -> None:
+        """
+        Like add_frame_listener, but listener also gets the frame's serialized bytes as
+        received (None for frames that weren't received off the wire)
+        """
+        self._wire_listeners.append(listener)
+
+    def publish(self, frame: CameraFrameMsg, wire: Optional[Buffer] = None) -> None:
+        """
+        Make frame the newest frame for this camera and wake waiting viewers.
+        wire is the frame's serialized bytes as received, when the caller has them.
+        """
+        with self._new_frame:
+            current = self._frame
+            # frame_number 0 means the publisher doesn't number its frames
+            if current is not None and frame.frame_number and frame.frame_number == current.frame_number:
+                return
+            self._frame = frame
+            self._generation += 1
+            self._new_frame.notify_all()
+        for listener in self._listeners:
+            try:
+                listener(frame)
+            except Exception as e:
+                logger.error(f"Camera {self.cam_index} frame listener failed: {e}")
+        for listener in self._wire_listeners:
+            try:
+                listener(frame, wire)
+            except Exception as e:
+                logger.error(f"Camera {self.cam_index} frame listener failed: {e}")
+
+    def wait_for_frame(self, after_generation: int, timeout: Optional[float] = None,
+                       tier: QualityTier = FULL_TIER, roi: Optional[RegionOfInterest] = None,
+                       client_flip: bool = False) -> Tuple[int, Optional[bytes]]:
+        """
+        Block until a frame newer than after_generation is published or timeout expires.
+        Returns the current generation and its chunk for tier, or for roi when given
+        (None if there is no frame).
+        """
+        generation, frame = self.wait_for_new_frame(after_generation, timeout)
+        if roi is not None:
+            return generation, self.latest_roi_chunk(roi, frame)
+        return generation, self.latest_chunk(tier, frame, client_flip)
+
+    def wait_for_new_frame(self, after_generation: int,
+                           timeout: Optional[float] = None) -> Tuple[int, Optional[CameraFrameMsg]]:
+        """Like wait_for_frame, but returns the frame itself rather than an encoded chunk"""
+        with self._new_frame:
+            self._new_frame.wait_for(lambda: self._generation != after_generation or self._finished, timeout)
+            return self._generation, self._frame
+
+    def latest_frame(self) -> Optional[CameraFrameMsg]:
+        """Get the newest frame received for this camera"""
+        return self._frame
+
+    def latest_chunk(self, tier: QualityTier = FULL_TIER, frame: Optional[CameraFrameMsg] = None,
+                     client_flip: bool = False) -> Optional[bytes]:
+        """
+        Get the encoded chunk for the newest frame (or the given one) at tier,
+        or None if there is no frame yet. With client_flip an upside-down camera's
+        frame is left as captured, for a viewer that flips it itself.
+        """
+        if frame is None:
+            frame = self._frame
+        if frame is None:
+            return None
+        flipped = self._flip and not client_flip
+        cache = self._tiers[tier.name, flipped]
+        if frame is cache.source:
+            return cache.chunk
+
+        with cache.lock:
+            # Another viewer may have encoded this frame while we waited for the lock
+            if frame is not cache.source:
+                chunk = self._timed_encode(tier.name, self._encode, frame, tier, flipped)
+                if chunk is not None:
+                    cache.chunk = chunk
+                    cache.source = frame
+            return cache.chunk
+
+    def latest_roi_chunk(self, roi: RegionOfInterest,
+                         frame: Optional[CameraFrameMsg] = None) -> Optional[bytes]:
+        """Get the encoded crop of the newest frame (or the given one), shared by every viewer of the same roi"""
+        if frame is None:
+            frame = self._frame
+        if frame is None:
+            return None
+        with self._rois_lock:
+            cache = self._rois.get(roi)
+            if cache is None:
+                cache = self._rois[roi] = _TierCache()
+                if len(self._rois) > MAX_ROI_CACHE:
+                    self._rois.popitem(last=False)
+            else:
+                self._rois.move_to_end(roi)
+        if frame is cache.source:
+            return cache.chunk
+
+        with cache.lock:
+            if frame is not cache.source:
+                chunk = self._timed_encode("roi", self._encode_roi, frame, roi)
+                if chunk is not None:
+                    cache.chunk = chunk
+                    cache.source = frame
+            return cache.chunk
+
+    def reset(self) -> None:
+        """Drop the current frame and cached chunks"""
+        with self._new_frame:
+            self._frame = None
+            self._finished = False
+            for cache in self._tiers.values():
+                with cache.lock:
+                    cache.source = None
+                    cache.chunk = None
+            with self._rois_lock:
+                self._rois.clear()
+            with self._decode_lock:
+                self._decoded_source = None
+                self._decoded = None
+            self._generation += 1
+            self._new_frame.notify_all()
+
+    def _timed_encode(self, variant: str, encode, *args) -> Optional[bytes]:
+        if not metrics.ENABLED:
+            return encode(*args)
+        start = time.perf_counter()
+        chunk = encode(*args)
+        metrics.FRAME_ENCODE_SECONDS.labels(self.cam_index, variant).observe(time.perf_counter() - start)
+        return chunk
+
+    def _decoded_frame(self, frame: CameraFrameMsg) -> Optional[np.ndarray]:
+        """Full-resolution decode of frame, shared by all regions of interest"""
+        with self._decode_lock:
+            if frame is not self._decoded_source:
+                self._decoded = decode_frame(frame)
+                self._decoded_source = frame
+            return self._decoded
+
+    def _encode_roi(self, frame: CameraFrameMsg, roi: RegionOfInterest) -> Optional[bytes]:
+        image = self._decoded_frame(frame)
+        if image is None:
+            return None
+        # Slicing gives a view; only the crop is ever resized or encoded
+        crop = image[roi.y:roi.y + roi.h, roi.x:roi.x + roi.w]
+        if crop.size == 0:
+            return None
+        if roi.scale != 1.0:
+            width = max(1, round(crop.shape[1] * roi.scale))
+            height = max(1, round(crop.shape[0] * roi.scale))
+            interpolation = cv2.INTER_AREA if roi.scale < 1.0 else cv2.INTER_LINEAR
+            crop = cv2.resize(crop, (width, height), interpolation=interpolation)
+        if self._flip:
+            crop = cv2.flip(crop, 0)
+        ret, jpeg = cv2.imencode('.jpg', crop, [cv2.IMWRITE_JPEG_QUALITY, ROI_JPEG_QUALITY])
+        if not ret:
+            return None
+        return make_chunk(jpeg.tobytes(), PI_CLOCK.to_local_us(frame.capture_timestamp))
+
+    def _encode(self, frame: CameraFrameMsg, tier: QualityTier, flipped: bool) -> Optional[bytes]:
+        if tier.max_width is None and not flipped and is_jpeg(frame):
+            return make_chunk(frame.image_data, PI_CLOCK.to_local_us(frame.capture_timestamp))
+
+        image = decode_frame(frame, tier.max_width)
+        if image is None:
+            return None
+        if flipped:
+            image = cv2.flip(image, 0)
+        ret, jpeg = cv2.imencode('.jpg', image, [cv2.IMWRITE_JPEG_QUALITY, tier.jpeg_quality])
+        if not ret:
+            return None
+        return make_chunk(jpeg.tobytes(), PI_CLOCK.to_local_us(frame.capture_timestamp))
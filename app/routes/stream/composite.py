@@ -0,0 +1,228 @@
+"""
+Viewfinder Dual-Camera Composite
+Pairs the two cameras' frames by nearest capture_timestamp and publishes each pair
+as one side-by-side frame, encoded once for every viewer, together with the
+measured inter-camera skew.
+"""
+
+import logging
+import threading
+import time
+from collections import deque
+from typing import Callable, Deque, Dict, List, Optional, Sequence
+
+import cv2
+import numpy as np
+
+from app import metrics
+from app.messages.external import CameraFrameMsg
+from app.routes.stream.broadcaster import FrameBroadcaster, decode_frame
+
+# Frames further apart than this are never paired
+DEFAULT_TOLERANCE_MS = 20.0
+# How far back each camera's frames are kept for pairing
+PAIRING_WINDOW_MS = 250.0
+# Width of each camera's half of the composite
+SIDE_WIDTH = 728
+COMPOSITE_JPEG_QUALITY = 80
+# Pairs averaged into the reported skew
+SKEW_HISTORY = 120
+
+logger = logging.getLogger(__name__)
+
+
+class _Entry:
+    __slots__ = ('timestamp', 'frame', 'paired')
+
+    def __init__(self, frame: CameraFrameMsg):
+        self.timestamp = frame.capture_timestamp
+        self.frame = frame
+        self.paired = False
+
+
+class FramePairer:
+    """
+    Buffers a short window of frames per camera and pairs each new frame with the
+    nearest unpaired frame from the other camera within tolerance. Decisions are
+    made as frames arrive, so a pair never waits for a possibly closer frame; pairs
+    only move forward in time on both sides.
+    """
+
+    def __init__(self, on_pair: Callable[[CameraFrameMsg, CameraFrameMsg], None],
+                 tolerance_ms: float = DEFAULT_TOLERANCE_MS, window_ms: float = PAIRING_WINDOW_MS):
+        self._on_pair = on_pair
+        self.tolerance_us = int(tolerance_ms * 1000)
+        self.window_us = int(window_ms * 1000)
+        self._buffers: List[Deque[_Entry]] = [deque(), deque()]
+        self._last_paired = [0, 0]
+        self._lock = threading.Lock()
+        self.pairs = 0
+        self.unpaired = [0, 0]
+
+    def listener(self, side: int) -> Callable[[CameraFrameMsg], None]:
+        return lambda frame: self.add(side, frame)
+
+    def reset(self) -> None:
+        """Forget buffered frames, e.g. when a camera unsubscribes"""
+        with self._lock:
+            for buffer in self._buffers:
+                buffer.clear()
+            self._last_paired = [0, 0]
+
+    def add(self, side: int, frame: CameraFrameMsg) -> None:
+        if not frame.capture_timestamp:
+            return
+        entry = _Entry(frame)
+        with self._lock:
+            self._buffers[side].append(entry)
+            oldest = entry.timestamp - self.window_us
+            for index, buffer in enumerate(self._buffers):
+                while buffer and buffer[0].timestamp < oldest:
+                    if not buffer.popleft().paired:
+                        self.unpaired[index] += 1
+            other = 1 - side
+            candidates = [candidate for candidate in self._buffers[other]
+                          if not candidate.paired and candidate.timestamp > self._last_paired[other]]
+            if not candidates:
+                return
+            best = min(candidates, key=lambda candidate: abs(candidate.timestamp - entry.timestamp))
+            if abs(best.timestamp - entry.timestamp) > self.tolerance_us:
+                return
+            entry.paired = best.paired = True
+            self._last_paired[side] = entry.timestamp
+            self._last_paired[other] = best.timestamp
+            self.pairs += 1
+        frames = (entry.frame, best.frame) if side == 0 else (best.frame, entry.frame)
+        self._on_pair(*frames)
+
+
+class CompositeStream:
+    """
+    Side-by-side stream of two cameras. Pairs are composed on their own thread
+    from a one-slot mailbox and published to a FrameBroadcaster as ready-made
+    JPEG frames, so every viewer, tier and region of interest works as for a
+    single camera. Each source's flip is applied before composing.
+
+    Skew is measured for every pair, but pairs are only decoded and encoded
+    while the composite has viewers (see acquire/release).
+    """
+
+    def __init__(self, sources: Sequence[FrameBroadcaster], tolerance_ms: float = DEFAULT_TOLERANCE_MS,
+                 side_width: int = SIDE_WIDTH):
+        self._flips = [source.flip for source in sources]
+        self.side_width = side_width
+        self.broadcaster = FrameBroadcaster(len(sources))
+        self.pairer = FramePairer(self._submit, tolerance_ms)
+        for side, source in enumerate(sources[:2]):
+            source.add_frame_listener(self.pairer.listener(side))
+        self._changed = threading.Condition()
+        self._mailbox: Optional[tuple] = None
+        self._thread: Optional[threading.Thread] = None
+        self._viewers = 0
+        # Bumped by reset, so a pair composed from before it is never published
+        self._epoch = 0
+        # Appended to on receiver threads, read by status requests
+        self._skews: Deque[int] = deque(maxlen=SKEW_HISTORY)
+        self._skews_lock = threading.Lock()
+        self._frame_number = 0
+        self.skipped = 0
+
+    @property
+    def viewers(self) -> int:
+        return self._viewers
+
+    def acquire(self) -> None:
+        """Register a viewer; pairs are composed while there is at least one"""
+        with self._changed:
+            self._viewers += 1
+
+    def release(self) -> None:
+        with self._changed:
+            self._viewers = max(0, self._viewers - 1)
+            if self._viewers == 0:
+                self._mailbox = None
+
+    def reset(self) -> None:
+        """Drop pending pairs and the composed frame (when a source camera unsubscribes)"""
+        self.pairer.reset()
+        with self._changed:
+            self._epoch += 1
+            self._mailbox = None
+            self.broadcaster.reset()
+
+    def status(self) -> Dict[str, object]:
+        with self._skews_lock:
+            history = list(self._skews)
+        skews = np.abs(np.array(history, dtype=np.int64)) / 1000.0
+        return {
+            "pairs": self.pairer.pairs,
+            "composed": self._frame_number,
+            "skipped": self.skipped,
+            "viewers": self._viewers,
+            "unpaired": list(self.pairer.unpaired),
+            "tolerance_ms": self.pairer.tolerance_us / 1000.0,
+            "skew_ms": {
+                "last": history[-1] / 1000.0 if history else None,
+                "mean": float(skews.mean()) if skews.size else None,
+                "max": float(skews.max()) if skews.size else None,
+            },
+        }
+
+    def _submit(self, first: CameraFrameMsg, second: CameraFrameMsg) -> None:
+        skew = second.capture_timestamp - first.capture_timestamp
+        with self._skews_lock:
+            self._skews.append(skew)
+        if metrics.ENABLED:
+            metrics.CAMERA_SKEW_SECONDS.labels().observe(abs(skew) / 1_000_000)
+        with self._changed:
+            if not self._viewers:
+                return
+            if self._mailbox is not None:
+                self.skipped += 1
+            self._mailbox = (first, second, skew, self._epoch)
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name="pitrac-composite", daemon=True)
+                self._thread.start()
+            self._changed.notify_all()
+
+    def _run(self) -> None:
+        while True:
+            with self._changed:
+                self._changed.wait_for(lambda: self._mailbox is not None)
+                (first, second, skew, epoch), self._mailbox = self._mailbox, None
+            start = time.perf_counter()
+            try:
+                frame = self._compose(first, second, skew)
+            except Exception as e:
+                logger.error(f"Composite of frames {first.frame_number}/{second.frame_number} failed: {e}")
+                continue
+            if frame is None:
+                continue
+            if metrics.ENABLED:
+                metrics.FRAME_ENCODE_SECONDS.labels(self.broadcaster.cam_index, "composite").observe(
+                    time.perf_counter() - start)
+            with self._changed:
+                if epoch == self._epoch:
+                    self.broadcaster.publish(frame)
+
+    def _compose(self, first: CameraFrameMsg, second: CameraFrameMsg, skew: int) -> Optional[CameraFrameMsg]:
+        images = []
+        for frame, flip in zip((first, second), self._flips):
+            image = decode_frame(frame, self.side_width)
+            if image is None:
+                return None
+            images.append(cv2.flip(image, 0) if flip else image)
+        height = min(image.shape[0] for image in images)
+        images = [image if image.shape[0] == height else
+                  cv2.resize(image, (max(1, round(image.shape[1] * height / image.shape[0])), height),
+                             interpolation=cv2.INTER_AREA)
+                  for image in images]
+        ret, jpeg = cv2.imencode('.jpg', np.hstack(images), [cv2.IMWRITE_JPEG_QUALITY, COMPOSITE_JPEG_QUALITY])
+        if not ret:
+            return None
+        self._frame_number += 1
+        return CameraFrameMsg(camera_id="composite", frame_number=self._frame_number,
+                              capture_timestamp=min(first.capture_timestamp, second.capture_timestamp),
+                              fps=first.fps, image_data=jpeg.tobytes(),
+                              metadata={"codec": "jpeg", "skew_us": str(skew),
+                                        "frame_numbers": f"{first.frame_number},{second.frame_number}"})
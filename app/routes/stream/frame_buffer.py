@@ -0,0 +1,169 @@
+"""
+Viewfinder Replay Buffer
+Memory-bounded ring of encoded camera frames, frozen into clips for instant replay
+"""
+
+import json
+import threading
+import time
+import zipfile
+from collections import deque
+from typing import Deque, Dict, Iterator, List, NamedTuple, Optional
+
+import cv2
+
+from app.messages.external import CameraFrameMsg
+from app.routes.stream.broadcaster import is_jpeg, decode_frame, make_chunk
+
+
+class BufferedFrame(NamedTuple):
+    """An encoded frame as received from the Pi"""
+    frame_number: int
+    capture_timestamp: int  # microseconds since epoch
+    fps: float
+    codec: str
+    image_data: bytes
+
+
+def buffered_frame(frame: CameraFrameMsg) -> BufferedFrame:
+    """Keep just what replay needs from a CameraFrameMsg (image_data is not copied)"""
+    codec = "jpeg" if is_jpeg(frame) else (frame.metadata or {}).get("codec", "bin").lower()
+    # Fall back to receive time for publishers that don't stamp captures
+    capture_timestamp = frame.capture_timestamp or time.time_ns() // 1000
+    return BufferedFrame(frame.frame_number, capture_timestamp, frame.fps, codec, frame.image_data)
+
+
+class FrameRingBuffer:
+    """
+    Pre-trigger buffer holding the last max_seconds of frames for one camera,
+    never more than max_bytes of image data. Oldest frames are evicted first.
+    """
+
+    def __init__(self, max_seconds: float = 5.0, max_bytes: int = 64 * 1024 * 1024):
+        self.max_seconds = max_seconds
+        self.max_bytes = max_bytes
+        self._frames: Deque[BufferedFrame] = deque()
+        self._bytes = 0
+        self._lock = threading.Lock()
+
+    def append(self, frame: CameraFrameMsg) -> None:
+        """Add a frame (usable directly as a FrameBroadcaster listener)"""
+        entry = buffered_frame(frame)
+        size = len(entry.image_data)
+        if size > self.max_bytes:
+            return
+        oldest_allowed = entry.capture_timestamp - int(self.max_seconds * 1_000_000)
+        with self._lock:
+            self._frames.append(entry)
+            self._bytes += size
+            frames = self._frames
+            while frames and (self._bytes > self.max_bytes or frames[0].capture_timestamp < oldest_allowed):
+                self._bytes -= len(frames.popleft().image_data)
+
+    def freeze(self) -> List[BufferedFrame]:
+        """Snapshot the current window; frames are immutable so no image data is copied"""
+        with self._lock:
+            return list(self._frames)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._frames.clear()
+            self._bytes = 0
+
+    @property
+    def size_bytes(self) -> int:
+        return self._bytes
+
+    def __len__(self) -> int:
+        return len(self._frames)
+
+
+def clip_info(frames: List[BufferedFrame]) -> Dict[str, object]:
+    """Summary of a frozen clip"""
+    if not frames:
+        return {"frames": 0, "bytes": 0, "duration_s": 0.0}
+    return {
+        "frames": len(frames),
+        "bytes": sum(len(frame.image_data) for frame in frames),
+        "first_frame": frames[0].frame_number,
+        "last_frame": frames[-1].frame_number,
+        "duration_s": (frames[-1].capture_timestamp - frames[0].capture_timestamp) / 1_000_000,
+    }
+
+
+def jpeg_bytes(frame: BufferedFrame, flip: bool = False) -> Optional[bytes]:
+    """Get a frame as JPEG, re-encoding only when the Pi sent another codec or it must be flipped"""
+    if frame.codec == "jpeg" and not flip:
+        return frame.image_data
+    image = decode_frame(CameraFrameMsg(image_data=frame.image_data))
+    if image is None:
+        return None
+    if flip:
+        image = cv2.flip(image, 0)
+    ret, jpeg = cv2.imencode('.jpg', image)
+    return jpeg.tobytes() if ret else None
+
+
+def iter_multipart(frames: List[BufferedFrame], speed: float = 1.0, flip: bool = False) -> Iterator[bytes]:
+    """Stream a clip as MJPEG chunks, paced by the original capture timestamps"""
+    start_wall = time.monotonic()
+    start_capture = frames[0].capture_timestamp if frames else 0
+    for frame in frames:
+        due = start_wall + (frame.capture_timestamp - start_capture) / 1_000_000 / speed
+        delay = due - time.monotonic()
+        if delay > 0:
+            time.sleep(delay)
+        jpeg = jpeg_bytes(frame, flip)
+        if jpeg is not None:
+            yield make_chunk(jpeg, frame.capture_timestamp)
+
+
+_ZIP_EPOCH = (1980, 1, 1, 0, 0, 0)
+
+
+class _ChunkWriter:
+    """Write-only, unseekable sink so zipfile streams instead of buffering"""
+
+    def __init__(self):
+        self._chunks: List[bytes] = []
+
+    def write(self, data: bytes) -> int:
+        self._chunks.append(data)
+        return len(data)
+
+    def flush(self) -> None:
+        pass
+
+    def drain(self) -> bytes:
+        data = b''.join(self._chunks)
+        self._chunks.clear()
+        return data
+
+
+def iter_zip(frames: List[BufferedFrame], prefix: str = "frame", flip: bool = False) -> Iterator[bytes]:
+    """
+    Stream a clip as a ZIP archive, one frame at a time, plus a frames.json index.
+    Frames are stored as sent unless they must be flipped, which re-encodes them as JPEG.
+    """
+    sink = _ChunkWriter()
+    index = []
+    with zipfile.ZipFile(sink, mode='w', compression=zipfile.ZIP_STORED) as archive:
+        for frame in frames:
+            data, codec = frame.image_data, frame.codec
+            if flip:
+                data, codec = jpeg_bytes(frame, flip), "jpeg"
+                if data is None:
+                    continue
+            name = f"{prefix}_{frame.frame_number:08d}_{frame.capture_timestamp}.{codec}"
+            # ZIP can't date files before 1980, which a Pi clock counting from boot would be
+            info = zipfile.ZipInfo(name, max(time.localtime(frame.capture_timestamp / 1_000_000)[:6], _ZIP_EPOCH))
+            archive.writestr(info, data)
+            index.append({
+                "file": name,
+                "frame_number": frame.frame_number,
+                "capture_timestamp": frame.capture_timestamp,
+                "fps": frame.fps,
+            })
+            yield sink.drain()
+        archive.writestr("frames.json", json.dumps(index, indent=2))
+    yield sink.drain()
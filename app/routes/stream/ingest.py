@@ -0,0 +1,100 @@
+"""
+Viewfinder Frame Ingest
+The one process that subscribes to the Pi's camera publishers. Every received
+frame is copied, still serialized, into the shared frame store, so web workers
+(gunicorn, uwsgi, ...) serve viewers without opening ZMQ connections of their own.
+
+    python -m app.routes.stream.ingest
+    PITRAC_FRAME_STORE=pitrac_frames gunicorn -w 4 --threads 16 'app:create_app()'
+"""
+
+import argparse
+import logging
+import signal
+import threading
+from typing import List, Optional
+
+import zmq
+
+from app.messages.message_registry import peek_header
+from app.messages.message_types import MessageType
+from app.routes.stream.receiver import CAMERA_PORTS, POLL_TIMEOUT_MS
+from app.routes.stream.shared_store import (
+    DEFAULT_SLOT_CAPACITY, DEFAULT_STORE_NAME, SharedFrameStore, notify_endpoint
+)
+
+# Only the newest frames matter; don't let a stalled ingest queue old ones. A full
+# SUB queue drops new messages, so the queue is drained and only its last frame stored
+RECEIVE_HWM = 2
+
+logger = logging.getLogger(__name__)
+
+
+def ingest_camera(context: zmq.Context, store: SharedFrameStore, cam_index: int, endpoint: str,
+                  stop_event: threading.Event) -> None:
+    """Copy frames from endpoint into store slot cam_index until stop_event is set"""
+    socket = context.socket(zmq.SUB)
+    socket.setsockopt(zmq.RCVHWM, RECEIVE_HWM)
+    socket.setsockopt(zmq.SUBSCRIBE, b"")
+    socket.connect(endpoint)
+    # One byte per frame tells waiting workers to read the store
+    notify = context.socket(zmq.PUB)
+    notify.setsockopt(zmq.SNDHWM, 1)
+    notify.bind(notify_endpoint(store.name, cam_index))
+    frame_type = int(MessageType.CameraFrame)
+    try:
+        while not stop_event.is_set():
+            if not socket.poll(POLL_TIMEOUT_MS):
+                continue
+            # Messages sent with a topic arrive as [topic, data]
+            data = socket.recv_multipart(copy=False)[-1].buffer
+            while socket.poll(0):
+                data = socket.recv_multipart(copy=False)[-1].buffer
+            try:
+                if peek_header(data).message_type != frame_type:
+                    continue
+            except ValueError as e:
+                logger.warning(f"Camera {cam_index} dropped malformed message: {e}")
+                continue
+            if store.write(cam_index, data):
+                notify.send(b"\x01", zmq.NOBLOCK)
+    finally:
+        socket.close(linger=0)
+        notify.close(linger=0)
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    from app.routes.messages.Common import PI_IP
+
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--name", default=DEFAULT_STORE_NAME, help="shared memory name (PITRAC_FRAME_STORE)")
+    parser.add_argument("--capacity", type=int, default=DEFAULT_SLOT_CAPACITY, help="max frame bytes per camera")
+    parser.add_argument("--pi", default=PI_IP, help="Pi address")
+    args = parser.parse_args(argv)
+
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s %(name)s %(message)s")
+    stop_event = threading.Event()
+    signal.signal(signal.SIGINT, lambda *_: stop_event.set())
+    signal.signal(signal.SIGTERM, lambda *_: stop_event.set())
+
+    context = zmq.Context()
+    store = SharedFrameStore.create(args.name, len(CAMERA_PORTS), args.capacity)
+    threads = [threading.Thread(target=ingest_camera, name=f"pitrac-ingest-{cam_index}",
+                                args=(context, store, cam_index, f"tcp://{args.pi}:{port}", stop_event))
+               for cam_index, port in enumerate(CAMERA_PORTS)]
+    for thread in threads:
+        thread.start()
+    logger.info(f"Ingesting {len(threads)} cameras from {args.pi} into shared store '{args.name}'")
+    try:
+        stop_event.wait()
+    finally:
+        stop_event.set()
+        for thread in threads:
+            thread.join()
+        store.close()
+        context.term()
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
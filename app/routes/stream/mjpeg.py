@@ -0,0 +1,45 @@
+"""
+Viewfinder MJPEG Generator
+Per-viewer multipart stream over a FrameBroadcaster, paced by new frames
+"""
+
+import time
+
+from app import metrics
+from app.routes.stream.broadcaster import FULL_TIER, blank_chunk
+
+# Seconds without a new frame before the current one is resent to idle viewers
+KEEPALIVE_INTERVAL = 5.0
+
+
+def generate_mjpeg(broadcaster, min_interval=0.0, tier=FULL_TIER, roi=None, stats=metrics.NULL_STREAM_STATS,
+                   client_flip=False):
+    generation = -1
+    last_chunk = None
+    next_send = 0.0
+    while True:
+        if min_interval:
+            delay = next_send - time.monotonic()
+            if delay > 0:
+                time.sleep(delay)
+        new_generation, chunk = broadcaster.wait_for_frame(generation, timeout=KEEPALIVE_INTERVAL, tier=tier, roi=roi,
+                                                           client_flip=client_flip)
+        if new_generation == generation and broadcaster.finished:
+            # A replay that ran out of frames; ending the response closes it for the client
+            return
+        if generation >= 0:
+            # Frames published while this client was sending or throttled
+            stats.dropped(new_generation - generation - 1)
+        # If no image yet, send a blank frame
+        if chunk is None:
+            chunk = blank_chunk()
+        if new_generation != generation and chunk is last_chunk:
+            # Already sent this frame
+            generation = new_generation
+            continue
+        # On timeout the last frame is resent so dead connections get noticed
+        generation = new_generation
+        last_chunk = chunk
+        next_send = time.monotonic() + min_interval
+        stats.sent(len(chunk))
+        yield chunk
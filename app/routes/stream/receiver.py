@@ -0,0 +1,121 @@
+"""
+Viewfinder Camera Receiver
+Subscribes to a PiTrac camera publisher and hands each CameraFrameMsg to its broadcaster
+"""
+
+import logging
+import os
+import threading
+
+import zmq
+
+from app import metrics
+from app.messages.message_interface import ZMQMessenger, SocketType
+from app.messages.external import CameraFrameMsg
+from app.routes.stream.broadcaster import FrameBroadcaster
+from app.routes.stream.shared_store import SharedFrameStore, notify_endpoint
+
+# Pi camera publishers, indexed by camera
+CAMERA_PORTS = (5555, 5556)
+
+# Poll interval so receivers notice stop requests promptly
+POLL_TIMEOUT_MS = 100
+# How often workers retry attaching to the store while the ingest process is down
+STORE_ATTACH_INTERVAL = 1.0
+
+# Subscriber queue depth. A full SUB queue drops *new* messages and keeps the old
+# ones, so the queue is kept short and drained on every wakeup, publishing only
+# the newest frame it held
+RECEIVE_HWM = 2
+# ZMQ_CONFLATE keeps exactly the newest frame, but only works with single-part
+# messages, so enable it only when the Pi publishes without a topic frame
+CONFLATE = os.environ.get("PITRAC_CONFLATE") == "1"
+
+logger = logging.getLogger(__name__)
+
+
+def camera_receiver(broadcaster: FrameBroadcaster, endpoint: str, stop_event: threading.Event):
+    """Receive camera frames from endpoint until stop_event is set"""
+    # Receivers come and go with viewers, so share one context rather than leak one per start
+    messenger = ZMQMessenger(zmq.Context.instance())
+    # The bytes each frame was decoded from, handed on with it so it can be kept as received
+    received = {}
+
+    def on_receive(socket_name, message, data, deserialize_seconds):
+        received[id(message)] = data
+        if metrics.ENABLED:
+            metrics.observe_receive(socket_name, message, data, deserialize_seconds)
+    messenger.receive_hook = on_receive
+    name = f"camera_{broadcaster.cam_index}"
+    socket = messenger.create_socket(name, SocketType.Subscriber, timeout_ms=POLL_TIMEOUT_MS)
+    socket.setsockopt(zmq.RCVHWM, RECEIVE_HWM)
+    if CONFLATE:
+        socket.setsockopt(zmq.CONFLATE, 1)
+    socket.setsockopt(zmq.LINGER, 0)
+    messenger.connect(name, endpoint)
+    messenger.subscribe(name)
+    try:
+        while not stop_event.is_set():
+            if not socket.poll(POLL_TIMEOUT_MS):
+                continue
+            frame = messenger.receive_message(name, CameraFrameMsg)
+            # Frames queued behind it are newer; skip straight to the last one
+            while socket.poll(0):
+                newer = messenger.receive_message(name, CameraFrameMsg)
+                if newer is None:
+                    break
+                if frame is not None and metrics.ENABLED:
+                    metrics.FRAMES_DROPPED.labels(broadcaster.cam_index, "stale").inc()
+                frame = newer
+            wire = received.pop(id(frame), None) if frame is not None else None
+            received.clear()
+            if frame is not None and not stop_event.is_set():
+                broadcaster.publish(frame, wire)
+    finally:
+        messenger.close_all()
+        logger.info(f"Camera {broadcaster.cam_index} receiver stopped")
+
+
+def shared_store_receiver(broadcaster: FrameBroadcaster, store_name: str, stop_event: threading.Event):
+    """
+    Feed broadcaster from the ingest process's shared frame store until stop_event is set.
+    Waits for the ingest process's notification of a new frame; without one the store
+    is still checked every POLL_TIMEOUT_MS.
+    """
+    store = None
+    generation = -1
+    notify = zmq.Context.instance().socket(zmq.SUB)
+    # Only whether something arrived matters, not how many
+    notify.setsockopt(zmq.CONFLATE, 1)
+    notify.setsockopt(zmq.SUBSCRIBE, b"")
+    notify.setsockopt(zmq.LINGER, 0)
+    notify.connect(notify_endpoint(store_name, broadcaster.cam_index))
+    try:
+        while not stop_event.is_set():
+            if store is None:
+                try:
+                    store = SharedFrameStore.attach(store_name)
+                except FileNotFoundError:
+                    stop_event.wait(STORE_ATTACH_INTERVAL)
+                    continue
+                logger.info(f"Camera {broadcaster.cam_index} reading from shared store '{store_name}'")
+            latest = store.read(broadcaster.cam_index, generation)
+            if latest is None:
+                # A notification sent since the read is kept, so this returns at once
+                if notify.poll(POLL_TIMEOUT_MS):
+                    notify.recv(zmq.NOBLOCK)
+                continue
+            generation, data = latest
+            frame = CameraFrameMsg()
+            try:
+                frame.deserialize(data)
+            except ValueError as e:
+                logger.error(f"Camera {broadcaster.cam_index} bad frame in shared store: {e}")
+                continue
+            if not stop_event.is_set():
+                broadcaster.publish(frame, data)
+    finally:
+        notify.close()
+        if store is not None:
+            store.close()
+        logger.info(f"Camera {broadcaster.cam_index} shared store reader stopped")
@@ -0,0 +1,305 @@
+"""
+Viewfinder Frame Recorder
+Append-only on-disk recording of camera streams with a memory-mapped, fixed-width
+index for seekable replay
+
+Layout of a session directory:
+    cam<N>_<segment>.seg   serialized CameraFrameMsg bytes, back to back
+    cam<N>.idx             one INDEX_DTYPE record per frame, in arrival order
+"""
+
+import logging
+import mmap
+import os
+import queue
+import re
+import threading
+import time
+import uuid
+from typing import Callable, Dict, List, Optional
+
+import numpy as np
+
+from app import metrics
+from app.messages.external import CameraFrameMsg
+from app.messages.msgpack_buffer import Buffer, as_buffer
+from app.routes.stream.broadcaster import FrameBroadcaster
+
+# Fixed-width index record; capture_timestamp is monotonic per camera so it can be bisected
+INDEX_DTYPE = np.dtype([
+    ('frame_number', '<i8'),
+    ('capture_timestamp', '<i8'),  # microseconds since epoch
+    ('offset', '<u8'),             # byte offset within the segment file
+    ('segment', '<u4'),
+    ('length', '<u4'),
+])
+
+SEGMENT_BYTES = 256 * 1024 * 1024
+WRITE_QUEUE_SIZE = 256
+FLUSH_INTERVAL = 0.5
+
+_SESSION_ID = re.compile(r'^[0-9A-Za-z_-]+$')
+
+logger = logging.getLogger(__name__)
+
+
+def segment_path(session_dir: str, cam_index: int, segment: int) -> str:
+    return os.path.join(session_dir, f"cam{cam_index}_{segment:05d}.seg")
+
+
+def index_path(session_dir: str, cam_index: int) -> str:
+    return os.path.join(session_dir, f"cam{cam_index}.idx")
+
+
+class CameraRecorder:
+    """Writes one camera's frames to rotating segment files plus its index"""
+
+    def __init__(self, session_dir: str, cam_index: int, segment_bytes: int = SEGMENT_BYTES):
+        self._session_dir = session_dir
+        self._cam_index = cam_index
+        self._segment_bytes = segment_bytes
+        self._segment = 0
+        self._offset = 0
+        # Exclusive create: offsets start at 0, so appending to an existing file would corrupt the index
+        self._data = open(segment_path(session_dir, cam_index, 0), 'xb')
+        self._index = open(index_path(session_dir, cam_index), 'xb')
+        self._record = np.zeros(1, dtype=INDEX_DTYPE)
+        self.frames = 0
+
+    def write(self, data: Buffer, frame_number: int, capture_timestamp: int) -> None:
+        if self._offset and self._offset + len(data) > self._segment_bytes:
+            self._data.close()
+            self._segment += 1
+            self._offset = 0
+            self._data = open(segment_path(self._session_dir, self._cam_index, self._segment), 'xb')
+        self._data.write(data)
+        record = self._record[0]
+        record['frame_number'] = frame_number
+        record['capture_timestamp'] = capture_timestamp
+        record['offset'] = self._offset
+        record['segment'] = self._segment
+        record['length'] = len(data)
+        # Index after data, so an index entry never points past the end of a segment
+        self._index.write(self._record.tobytes())
+        self._offset += len(data)
+        self.frames += 1
+
+    def flush(self) -> None:
+        self._data.flush()
+        self._index.flush()
+
+    def close(self) -> None:
+        self._data.close()
+        self._index.close()
+
+
+class SessionRecorder:
+    """
+    Records every camera into a session directory.
+
+    Frame listeners only enqueue, so receiver threads never wait on the disk;
+    a single writer thread appends each frame's bytes as received, serializing
+    only frames that didn't come off the wire. If the disk falls behind far
+    enough to fill the queue, frames are counted in dropped rather than blocking.
+    Each session has its own queue, so frames that race a stop are discarded
+    with it rather than carried into the next session.
+    """
+
+    def __init__(self, root_dir: str, queue_size: int = WRITE_QUEUE_SIZE):
+        self.root_dir = root_dir
+        self._queue_size = queue_size
+        self._queue: Optional["queue.Queue"] = None
+        self._lock = threading.Lock()
+        self._session_id: Optional[str] = None
+        self._thread: Optional[threading.Thread] = None
+        self.dropped = 0
+
+    @property
+    def session_id(self) -> Optional[str]:
+        return self._session_id
+
+    def attach(self, broadcaster: FrameBroadcaster) -> None:
+        """Record frames published by broadcaster whenever a session is active"""
+        broadcaster.add_wire_listener(self._listener(broadcaster.cam_index))
+
+    def start(self) -> str:
+        """Start a new session (or return the active one)"""
+        with self._lock:
+            if self._session_id is not None:
+                return self._session_id
+            # Readable and sortable, with a random suffix so sessions started within the same second differ
+            session_id = f"{time.strftime('%Y%m%d-%H%M%S')}-{uuid.uuid4().hex[:8]}"
+            session_dir = os.path.join(self.root_dir, session_id)
+            os.makedirs(self.root_dir, exist_ok=True)
+            os.mkdir(session_dir)
+            self.dropped = 0
+            self._queue = queue.Queue(maxsize=self._queue_size)
+            self._thread = threading.Thread(target=self._write_loop, args=(session_dir, self._queue),
+                                            name="pitrac-recorder", daemon=True)
+            self._session_id = session_id
+            self._thread.start()
+            logger.info(f"Recording session {session_id} to {session_dir}")
+            return session_id
+
+    def stop(self) -> Optional[str]:
+        """Stop the active session, waiting for queued frames to be written"""
+        with self._lock:
+            session_id, thread, frames = self._session_id, self._thread, self._queue
+            self._session_id = None
+            self._thread = None
+            self._queue = None
+        if thread is not None:
+            frames.put((None, None, None))
+            thread.join()
+            logger.info(f"Recording session {session_id} stopped ({self.dropped} frames dropped)")
+        return session_id
+
+    def _listener(self, cam_index: int) -> Callable[[CameraFrameMsg, Optional[Buffer]], None]:
+        def on_frame(frame: CameraFrameMsg, wire: Optional[Buffer]) -> None:
+            frames = self._queue
+            if frames is None:
+                return
+            try:
+                frames.put_nowait((cam_index, frame, wire))
+            except queue.Full:
+                # Both cameras' receiver threads land here
+                with self._lock:
+                    self.dropped += 1
+                if metrics.ENABLED:
+                    metrics.FRAMES_DROPPED.labels(cam_index, "recorder_queue_full").inc()
+        return on_frame
+
+    def _write_loop(self, session_dir: str, frames: "queue.Queue") -> None:
+        cameras: Dict[int, CameraRecorder] = {}
+        last_flush = time.monotonic()
+        try:
+            while True:
+                try:
+                    cam_index, frame, wire = frames.get(timeout=FLUSH_INTERVAL)
+                except queue.Empty:
+                    cam_index, frame, wire = -1, None, None
+                if cam_index is None:
+                    break
+                if frame is not None:
+                    camera = cameras.get(cam_index)
+                    if camera is None:
+                        camera = cameras[cam_index] = CameraRecorder(session_dir, cam_index)
+                    # Written as received; only frames made locally are serialized here
+                    data = as_buffer(wire) if wire is not None else frame.serialize()
+                    camera.write(data, frame.frame_number, frame.capture_timestamp or time.time_ns() // 1000)
+                if time.monotonic() - last_flush >= FLUSH_INTERVAL:
+                    for camera in cameras.values():
+                        camera.flush()
+                    last_flush = time.monotonic()
+        finally:
+            for camera in cameras.values():
+                camera.close()
+
+
+class RecordingReader:
+    """Random access to one camera of a recorded session through mmap"""
+
+    def __init__(self, session_dir: str, cam_index: int):
+        self._session_dir = session_dir
+        self._cam_index = cam_index
+        self._maps: Dict[int, mmap.mmap] = {}
+        self._index_file = open(index_path(session_dir, cam_index), 'rb')
+        size = os.fstat(self._index_file.fileno()).st_size
+        # Ignore a partially written trailing record from a live session
+        count = size // INDEX_DTYPE.itemsize
+        if count:
+            self._index_map = mmap.mmap(self._index_file.fileno(), count * INDEX_DTYPE.itemsize,
+                                        access=mmap.ACCESS_READ)
+            self.index = np.frombuffer(self._index_map, dtype=INDEX_DTYPE)
+        else:
+            self._index_map = None
+            self.index = np.zeros(0, dtype=INDEX_DTYPE)
+
+    def __len__(self) -> int:
+        return len(self.index)
+
+    def seek(self, capture_timestamp: int) -> int:
+        """Position of the first frame captured at or after capture_timestamp (binary search)"""
+        return int(np.searchsorted(self.index['capture_timestamp'], capture_timestamp, side='left'))
+
+    def read_frame(self, position: int) -> CameraFrameMsg:
+        """Deserialize the frame at position; image_data is a view into the mapped segment"""
+        record = self.index[position]
+        segment = int(record['segment'])
+        segment_map = self._maps.get(segment)
+        if segment_map is None:
+            with open(segment_path(self._session_dir, self._cam_index, segment), 'rb') as f:
+                segment_map = self._maps[segment] = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        offset = int(record['offset'])
+        frame = CameraFrameMsg()
+        frame.deserialize(memoryview(segment_map)[offset:offset + int(record['length'])])
+        return frame
+
+    def info(self) -> Dict[str, object]:
+        if not len(self.index):
+            return {"frames": 0, "duration_s": 0.0}
+        timestamps = self.index['capture_timestamp']
+        return {
+            "frames": len(self.index),
+            "first_capture_timestamp": int(timestamps[0]),
+            "duration_s": (int(timestamps[-1]) - int(timestamps[0])) / 1_000_000,
+        }
+
+    def close(self) -> None:
+        # Views handed out by read_frame keep a map alive; let GC reclaim those
+        self.index = np.zeros(0, dtype=INDEX_DTYPE)
+        for segment_map in list(self._maps.values()) + [self._index_map]:
+            if segment_map is None:
+                continue
+            try:
+                segment_map.close()
+            except BufferError:
+                pass
+        self._maps.clear()
+        self._index_file.close()
+
+
+def list_sessions(root_dir: str) -> List[str]:
+    if not os.path.isdir(root_dir):
+        return []
+    return sorted(name for name in os.listdir(root_dir)
+                  if _SESSION_ID.match(name) and os.path.isdir(os.path.join(root_dir, name)))
+
+
+def session_dir(root_dir: str, session_id: str) -> Optional[str]:
+    """Resolve a session id to its directory, rejecting anything that could escape root_dir"""
+    if not _SESSION_ID.match(session_id):
+        return None
+    path = os.path.join(root_dir, session_id)
+    return path if os.path.isdir(path) else None
+
+
+def session_cameras(path: str) -> List[int]:
+    return sorted(int(name[3:-4]) for name in os.listdir(path)
+                  if name.startswith("cam") and name.endswith(".idx") and name[3:-4].isdigit())
+
+
+def play_recording(reader: RecordingReader, broadcaster: FrameBroadcaster, stop_event: threading.Event,
+                   speed: float = 1.0, start_position: int = 0) -> None:
+    """
+    Publish recorded frames to broadcaster at speed times their original pacing,
+    then mark it finished so viewers' responses end after the last frame
+    """
+    try:
+        _play(reader, broadcaster, stop_event, speed, start_position)
+    finally:
+        broadcaster.finish()
+
+
+def _play(reader: RecordingReader, broadcaster: FrameBroadcaster, stop_event: threading.Event,
+          speed: float, start_position: int) -> None:
+    if start_position >= len(reader):
+        return
+    timestamps = reader.index['capture_timestamp']
+    start_wall = time.monotonic()
+    start_capture = int(timestamps[start_position])
+    for position in range(start_position, len(reader)):
+        due = start_wall + (int(timestamps[position]) - start_capture) / 1_000_000 / speed
+        if stop_event.wait(max(0.0, due - time.monotonic())):
+            return
+        broadcaster.publish(reader.read_frame(position))
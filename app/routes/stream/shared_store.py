@@ -0,0 +1,155 @@
+"""
+Viewfinder Shared Frame Store
+Latest serialized CameraFrameMsg per camera in one shared memory segment, written
+by a single ingest process and read by any number of web worker processes.
+
+Each camera slot is guarded by a seqlock: the writer makes the sequence odd, fills in
+the length, timestamp and frame, then makes it even again as a separate, final write.
+Readers copy the frame out and retry if the sequence was odd or changed underneath
+them, so neither side ever blocks the other.
+
+After each write the ingest process pings the camera's notify_endpoint(), so workers
+wait on a socket rather than polling the store.
+
+Layout:
+    store header   magic u32, version u16, cameras u16, capacity u32, pad to 16
+    per camera     sequence u64, written_ns i64, length u32, pad to 32, data[capacity]
+"""
+
+import logging
+import os
+import struct
+import tempfile
+import time
+from multiprocessing import resource_tracker, shared_memory
+from typing import Optional, Tuple
+
+from app.messages.msgpack_buffer import Buffer
+
+DEFAULT_STORE_NAME = "pitrac_frames"
+# Large enough for a full-resolution JPEG or PNG frame plus message fields
+DEFAULT_SLOT_CAPACITY = 8 * 1024 * 1024
+
+_MAGIC = 0x50545246  # "PTRF"
+_VERSION = 1
+_STORE_HEADER = struct.Struct('<IHHI4x')
+_SLOT_HEADER = struct.Struct('<QqI12x')
+_SEQUENCE = struct.Struct('<Q')
+# written_ns and length, following the sequence in the slot header
+_SLOT_FIELDS = struct.Struct('<qI')
+
+# A read racing the writer retries; after this many it gives up until the next poll
+MAX_READ_RETRIES = 8
+
+logger = logging.getLogger(__name__)
+
+
+def notify_endpoint(name: str, cam_index: int) -> str:
+    """IPC endpoint where the ingest process announces each new frame for cam_index"""
+    return f"ipc://{os.path.join(tempfile.gettempdir(), f'{name}-cam{cam_index}.notify')}"
+
+
+class SharedFrameStore:
+    """
+    One slot per camera holding the newest serialized frame.
+    Use create() in the ingest process and attach() in workers.
+    """
+
+    def __init__(self, memory: shared_memory.SharedMemory, owner: bool):
+        self._memory = memory
+        self._owner = owner
+        self._buf = memory.buf
+        magic, version, self.cameras, self.capacity = _STORE_HEADER.unpack_from(self._buf, 0)
+        if magic != _MAGIC or version != _VERSION:
+            raise ValueError(f"Shared memory '{memory.name}' is not a version {_VERSION} frame store")
+        self._slot_size = _SLOT_HEADER.size + self.capacity
+        self._sequences = [0] * self.cameras
+
+    @classmethod
+    def create(cls, name: str = DEFAULT_STORE_NAME, cameras: int = 2,
+               capacity: int = DEFAULT_SLOT_CAPACITY) -> 'SharedFrameStore':
+        """Create the store, replacing one left behind by a previous ingest process"""
+        size = _STORE_HEADER.size + cameras * (_SLOT_HEADER.size + capacity)
+        try:
+            memory = shared_memory.SharedMemory(name, create=True, size=size)
+        except FileExistsError:
+            stale = shared_memory.SharedMemory(name)
+            stale.close()
+            stale.unlink()
+            memory = shared_memory.SharedMemory(name, create=True, size=size)
+        memory.buf[:size] = bytes(size)
+        _STORE_HEADER.pack_into(memory.buf, 0, _MAGIC, _VERSION, cameras, capacity)
+        return cls(memory, owner=True)
+
+    @classmethod
+    def attach(cls, name: str = DEFAULT_STORE_NAME) -> 'SharedFrameStore':
+        """Attach to a store created by the ingest process (FileNotFoundError if it isn't running)"""
+        memory = shared_memory.SharedMemory(name)
+        # Readers must not unlink the segment when they exit; only the ingest process owns it
+        resource_tracker.unregister(memory._name, "shared_memory")
+        return cls(memory, owner=False)
+
+    @property
+    def name(self) -> str:
+        return self._memory.name
+
+    def _offset(self, cam_index: int) -> int:
+        if not 0 <= cam_index < self.cameras:
+            raise IndexError(f"Camera {cam_index} not in store ({self.cameras} cameras)")
+        return _STORE_HEADER.size + cam_index * self._slot_size
+
+    def write(self, cam_index: int, data: Buffer) -> bool:
+        """Publish data as the newest frame for cam_index (single writer per camera)"""
+        length = len(data)
+        if length > self.capacity:
+            logger.warning(f"Camera {cam_index} frame of {length} bytes exceeds store capacity {self.capacity}")
+            return False
+        offset = self._offset(cam_index)
+        sequence = self._sequences[cam_index] + 1
+        _SEQUENCE.pack_into(self._buf, offset, sequence)
+        # Everything a reader uses is written while the sequence is odd; the even
+        # sequence goes last, on its own, so it can never be seen with a stale length
+        _SLOT_FIELDS.pack_into(self._buf, offset + _SEQUENCE.size, time.time_ns(), length)
+        start = offset + _SLOT_HEADER.size
+        self._buf[start:start + length] = data
+        sequence += 1
+        _SEQUENCE.pack_into(self._buf, offset, sequence)
+        self._sequences[cam_index] = sequence
+        return True
+
+    def generation(self, cam_index: int) -> int:
+        """Number of frames written for cam_index; changes whenever a new frame lands"""
+        return _SEQUENCE.unpack_from(self._buf, self._offset(cam_index))[0] >> 1
+
+    def read(self, cam_index: int, after_generation: int = -1) -> Optional[Tuple[int, bytes]]:
+        """
+        Copy out the newest frame if its generation differs from after_generation.
+        Returns (generation, data), or None if there is nothing new or the writer
+        kept racing the read.
+        """
+        offset = self._offset(cam_index)
+        start = offset + _SLOT_HEADER.size
+        for _ in range(MAX_READ_RETRIES):
+            sequence, _, length = _SLOT_HEADER.unpack_from(self._buf, offset)
+            if sequence & 1:
+                time.sleep(0)
+                continue
+            generation = sequence >> 1
+            if generation == after_generation or generation == 0:
+                return None
+            if length > self.capacity:
+                continue
+            data = bytes(self._buf[start:start + length])
+            if _SEQUENCE.unpack_from(self._buf, offset)[0] == sequence:
+                return generation, data
+        return None
+
+    def written_ns(self, cam_index: int) -> int:
+        """Wall-clock time of the last write to cam_index"""
+        return _SLOT_HEADER.unpack_from(self._buf, self._offset(cam_index))[1]
+
+    def close(self) -> None:
+        self._buf = None
+        self._memory.close()
+        if self._owner:
+            self._memory.unlink()
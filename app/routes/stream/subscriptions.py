@@ -0,0 +1,172 @@
+"""
+Viewfinder Camera Subscriptions
+Reference-counted, demand-driven receivers: a camera is subscribed while at least
+one viewer is watching, and for a grace period after the last one leaves so page
+reloads and quick tab switches don't reconnect to the Pi.
+"""
+
+import logging
+import threading
+from contextlib import contextmanager
+from typing import Callable, Dict, Iterator, List, Optional, Sequence
+
+from app.routes.stream.broadcaster import FrameBroadcaster
+
+# Seconds a camera stays subscribed after its last viewer leaves
+DEFAULT_GRACE_PERIOD = 10.0
+# Sources notice their stop event within a poll interval; don't hang forever on one that doesn't
+STOP_TIMEOUT = 2.0
+
+# Runs until its stop event is set, publishing frames to the broadcaster
+FrameSource = Callable[[FrameBroadcaster, threading.Event], None]
+
+logger = logging.getLogger(__name__)
+
+
+class CameraSubscription:
+    """
+    Runs source on its own thread while the camera has viewers. Every start gets a
+    fresh thread and stop event, so the subscription can stop and restart any
+    number of times. Stopping waits for the receiver to exit (about one poll
+    interval) before clearing the broadcaster, so it can't publish a stale frame.
+    """
+
+    def __init__(self, broadcaster: FrameBroadcaster, source: FrameSource,
+                 grace_period: float = DEFAULT_GRACE_PERIOD, on_stop: Optional[Callable[[], None]] = None):
+        self.broadcaster = broadcaster
+        self.grace_period = grace_period
+        self._source = source
+        self._on_stop = on_stop
+        self._lock = threading.Lock()
+        self._viewers = 0
+        self._thread: Optional[threading.Thread] = None
+        self._stop_event: Optional[threading.Event] = None
+        self._idle_timer: Optional[threading.Timer] = None
+        self.starts = 0
+
+    @property
+    def viewers(self) -> int:
+        return self._viewers
+
+    @property
+    def active(self) -> bool:
+        thread = self._thread
+        return thread is not None and thread.is_alive()
+
+    def acquire(self) -> None:
+        """Register a viewer, subscribing if this is the first"""
+        with self._lock:
+            self._viewers += 1
+            self._cancel_idle_timer()
+            if not self.active:
+                self._start()
+
+    def release(self) -> None:
+        """Unregister a viewer; the last one out schedules the unsubscribe"""
+        with self._lock:
+            if self._viewers == 0:
+                return
+            self._viewers -= 1
+            if self._viewers == 0 and self._thread is not None:
+                self._cancel_idle_timer()
+                timer = threading.Timer(self.grace_period, self._stop_if_idle)
+                timer.daemon = True
+                self._idle_timer = timer
+                timer.start()
+
+    @contextmanager
+    def viewer(self) -> Iterator[None]:
+        self.acquire()
+        try:
+            yield
+        finally:
+            self.release()
+
+    def stop(self) -> None:
+        """Unsubscribe now, regardless of viewers (e.g. on shutdown)"""
+        with self._lock:
+            self._cancel_idle_timer()
+            self._stop()
+
+    def _start(self) -> None:
+        stop_event = threading.Event()
+        thread = threading.Thread(target=self._source, args=(self.broadcaster, stop_event),
+                                  name=f"pitrac-camera-{self.broadcaster.cam_index}", daemon=True)
+        self._stop_event = stop_event
+        self._thread = thread
+        self.starts += 1
+        thread.start()
+        logger.info(f"Camera {self.broadcaster.cam_index} subscribed")
+
+    def _stop(self) -> None:
+        if self._thread is None:
+            return
+        thread = self._thread
+        self._stop_event.set()
+        self._thread = None
+        self._stop_event = None
+        # The receiver may be mid-publish; wait for it so no frame lands after the reset
+        if thread is not threading.current_thread():
+            thread.join(STOP_TIMEOUT)
+            if thread.is_alive():
+                logger.warning(f"Camera {self.broadcaster.cam_index} receiver did not stop within {STOP_TIMEOUT}s")
+        # Viewers arriving later should not be shown a stale frame
+        self.broadcaster.reset()
+        if self._on_stop is not None:
+            self._on_stop()
+        logger.info(f"Camera {self.broadcaster.cam_index} unsubscribed")
+
+    def _stop_if_idle(self) -> None:
+        with self._lock:
+            if self._idle_timer is not threading.current_thread():
+                return
+            self._idle_timer = None
+            if self._viewers == 0:
+                self._stop()
+
+    def _cancel_idle_timer(self) -> None:
+        if self._idle_timer is not None:
+            self._idle_timer.cancel()
+            self._idle_timer = None
+
+
+class SubscriptionManager:
+    """
+    One CameraSubscription per broadcaster, addressed by camera index. Dependents are
+    streams built from several cameras (anything with a reset method, such as the
+    composite); they are reset along with any camera that unsubscribes.
+    """
+
+    def __init__(self, broadcasters: List[FrameBroadcaster], sources: List[FrameSource],
+                 grace_period: float = DEFAULT_GRACE_PERIOD, dependents: Sequence[object] = ()):
+        self._dependents = list(dependents)
+        self._subscriptions = [CameraSubscription(broadcaster, source, grace_period, self._reset_dependents)
+                               for broadcaster, source in zip(broadcasters, sources)]
+
+    def __getitem__(self, cam_index: int) -> CameraSubscription:
+        return self._subscriptions[cam_index]
+
+    def acquire(self, cam_index: int) -> None:
+        self._subscriptions[cam_index].acquire()
+
+    def release(self, cam_index: int) -> None:
+        self._subscriptions[cam_index].release()
+
+    def viewer(self, cam_index: int):
+        return self._subscriptions[cam_index].viewer()
+
+    def _reset_dependents(self) -> None:
+        for dependent in self._dependents:
+            dependent.reset()
+
+    def stop_all(self) -> None:
+        for subscription in self._subscriptions:
+            subscription.stop()
+
+    def status(self) -> List[Dict[str, object]]:
+        return [{
+            "camera": subscription.broadcaster.cam_index,
+            "viewers": subscription.viewers,
+            "subscribed": subscription.active,
+            "starts": subscription.starts,
+        } for subscription in self._subscriptions]
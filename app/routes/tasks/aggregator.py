@@ -0,0 +1,240 @@
+"""
+PiTrac Task Status Aggregator
+Keeps the latest TaskStatusMsg state per task_id and hands out per-field deltas,
+so any number of dashboards can follow tasks however fast the Pi reports progress.
+"""
+
+import json
+import logging
+import threading
+import time
+from typing import Any, Callable, Dict, Iterator, List, Optional, Tuple
+
+import zmq
+
+from app.messages.external import TaskStatusMsg
+from app.messages.internal import HeartbeatMsg
+from app.messages.message_interface import SocketType, ZMQMessenger
+from app.messages.message_registry import accept_types
+from app.messages.message_types import MessageType
+
+TASK_FIELDS = ("status", "progress", "details", "error_log")
+# Statuses after which a task will not change again
+FINISHED_STATUSES = frozenset(("completed", "complete", "succeeded", "success", "failed", "error", "cancelled",
+                               "canceled", "aborted"))
+
+# Tasks kept in the index; finished tasks are evicted first, oldest first
+MAX_TASKS = 256
+# Removed task ids remembered for clients catching up; older clients get a snapshot
+MAX_TOMBSTONES = 1024
+
+POLL_TIMEOUT_MS = 100
+
+logger = logging.getLogger(__name__)
+
+
+class _TaskEntry:
+    """Latest state of one task, with the index version at which each field last changed"""
+    __slots__ = ('task_id', 'fields', 'field_versions', 'version', 'updated_ms')
+
+    def __init__(self, task_id: str):
+        self.task_id = task_id
+        self.fields: Dict[str, Any] = {}
+        self.field_versions: Dict[str, int] = {}
+        self.version = 0
+        self.updated_ms = 0
+
+    def to_dict(self, fields: Optional[List[str]] = None) -> Dict[str, Any]:
+        data = {"task_id": self.task_id, "updated_ms": self.updated_ms}
+        for name in fields if fields is not None else TASK_FIELDS:
+            data[name] = self.fields.get(name)
+        return data
+
+
+class TaskIndex:
+    """
+    In-memory index of tasks by task_id.
+
+    Every change bumps a single version counter. Updates that change nothing are
+    ignored, and any number of updates between two reads collapse into one delta
+    carrying only the fields that changed since the reader's version.
+    """
+
+    def __init__(self, max_tasks: int = MAX_TASKS):
+        self.max_tasks = max_tasks
+        self._tasks: Dict[str, _TaskEntry] = {}
+        self._tombstones: Dict[str, int] = {}
+        # Deltas from before this version can't be reconstructed (tombstones were pruned)
+        self._floor = 0
+        self._version = 0
+        self._changed = threading.Condition()
+        self.updates = 0
+        self.coalesced = 0
+
+    @property
+    def version(self) -> int:
+        return self._version
+
+    def update(self, message: TaskStatusMsg) -> bool:
+        """Apply a status message; returns whether anything changed"""
+        with self._changed:
+            self.updates += 1
+            entry = self._tasks.get(message.task_id)
+            if entry is None:
+                entry = self._tasks[message.task_id] = _TaskEntry(message.task_id)
+                self._tombstones.pop(message.task_id, None)
+            changed = [name for name in TASK_FIELDS
+                       if name not in entry.field_versions or entry.fields[name] != getattr(message, name)]
+            if not changed:
+                self.coalesced += 1
+                return False
+            self._version += 1
+            for name in changed:
+                entry.fields[name] = getattr(message, name)
+                entry.field_versions[name] = self._version
+            entry.version = self._version
+            entry.updated_ms = message.get_timestamp_ms() or int(time.time() * 1000)
+            if len(self._tasks) > self.max_tasks:
+                self._evict()
+            self._changed.notify_all()
+            return True
+
+    def get(self, task_id: str) -> Optional[Dict[str, Any]]:
+        with self._changed:
+            entry = self._tasks.get(task_id)
+            return entry.to_dict() if entry is not None else None
+
+    def snapshot(self) -> Tuple[int, List[Dict[str, Any]]]:
+        """Current version and every task's full state"""
+        with self._changed:
+            return self._version, [entry.to_dict() for entry in self._tasks.values()]
+
+    def changes_since(self, version: int) -> Optional[Tuple[int, List[Dict[str, Any]], List[str]]]:
+        """
+        (new version, changed tasks with only their changed fields, removed task ids)
+        since version, or None if version is too old to diff against
+        """
+        with self._changed:
+            if version < self._floor:
+                return None
+            changed = []
+            for entry in self._tasks.values():
+                if entry.version > version:
+                    fields = [name for name, field_version in entry.field_versions.items() if field_version > version]
+                    changed.append(entry.to_dict(fields))
+            removed = [task_id for task_id, removed_version in self._tombstones.items() if removed_version > version]
+            return self._version, changed, removed
+
+    def wait_for_change(self, version: int, timeout: Optional[float] = None) -> bool:
+        """Block until the index moves past version or timeout expires"""
+        with self._changed:
+            return self._changed.wait_for(lambda: self._version != version, timeout)
+
+    def _evict(self) -> None:
+        # Finished tasks first, then the least recently updated
+        victims = sorted(self._tasks.values(),
+                         key=lambda entry: (entry.fields.get("status") not in FINISHED_STATUSES, entry.version))
+        self._version += 1
+        for entry in victims[:len(self._tasks) - self.max_tasks]:
+            del self._tasks[entry.task_id]
+            self._tombstones[entry.task_id] = self._version
+        if len(self._tombstones) > MAX_TOMBSTONES:
+            oldest = sorted(self._tombstones.items(), key=lambda item: item[1])
+            for task_id, removed_version in oldest[:len(self._tombstones) - MAX_TOMBSTONES]:
+                del self._tombstones[task_id]
+                self._floor = max(self._floor, removed_version)
+
+
+def sse_event(event: str, data: Any, event_id: Optional[int] = None) -> str:
+    """Format one Server-Sent Event"""
+    lines = [f"event: {event}"]
+    if event_id is not None:
+        lines.append(f"id: {event_id}")
+    lines.append(f"data: {json.dumps(data, separators=(',', ':'))}")
+    return "\n".join(lines) + "\n\n"
+
+
+def iter_task_events(index: TaskIndex, min_interval: float, keepalive: float,
+                     last_event_id: Optional[int] = None) -> Iterator[str]:
+    """
+    SSE stream: a snapshot (or the delta since last_event_id when resuming), then
+    deltas at most once per min_interval, with comments as keepalives when idle
+    """
+    version = None
+    if last_event_id is not None:
+        delta = index.changes_since(last_event_id)
+        if delta is not None:
+            version, changed, removed = delta
+            yield sse_event("update", {"version": version, "tasks": changed, "removed": removed}, version)
+    if version is None:
+        version, tasks = index.snapshot()
+        yield sse_event("snapshot", {"version": version, "tasks": tasks}, version)
+    while True:
+        if not index.wait_for_change(version, keepalive):
+            yield ": keepalive\n\n"
+            continue
+        delta = index.changes_since(version)
+        if delta is None:
+            version, tasks = index.snapshot()
+            yield sse_event("snapshot", {"version": version, "tasks": tasks}, version)
+        else:
+            version, changed, removed = delta
+            if changed or removed:
+                yield sse_event("update", {"version": version, "tasks": changed, "removed": removed}, version)
+        # Rate limit: everything arriving meanwhile is merged into the next delta
+        time.sleep(min_interval)
+
+
+class TaskStatusService:
+    """
+    Background subscriber feeding TaskStatusMsg from the Pi into a TaskIndex.
+    HeartbeatMsg published on the same channel is passed to on_heartbeat.
+    """
+
+    def __init__(self, endpoint: str, context: Optional[zmq.Context] = None, max_tasks: int = MAX_TASKS,
+                 on_heartbeat: Optional[Callable[[HeartbeatMsg], None]] = None):
+        self._endpoint = endpoint
+        self._on_heartbeat = on_heartbeat
+        self._context = context or zmq.Context.instance()
+        self.index = TaskIndex(max_tasks)
+        self._lock = threading.Lock()
+        self._thread: Optional[threading.Thread] = None
+        self._stop_event = threading.Event()
+
+    def start(self) -> None:
+        """Subscribe and start the receiver thread (idempotent)"""
+        with self._lock:
+            if self._thread is not None:
+                return
+            self._stop_event.clear()
+            self._thread = threading.Thread(target=self._run, name="pitrac-task-status", daemon=True)
+            self._thread.start()
+
+    def close(self) -> None:
+        with self._lock:
+            thread = self._thread
+            self._thread = None
+        if thread is not None:
+            self._stop_event.set()
+            thread.join()
+
+    def _run(self) -> None:
+        messenger = ZMQMessenger(self._context)
+        socket = messenger.create_socket("tasks", SocketType.Subscriber, timeout_ms=POLL_TIMEOUT_MS)
+        socket.setsockopt(zmq.LINGER, 0)
+        messenger.connect("tasks", self._endpoint)
+        messenger.subscribe("tasks")
+        logger.info(f"Task status subscribed to {self._endpoint}")
+        accept = accept_types((MessageType.TaskStatus, MessageType.Heartbeat))
+        try:
+            while not self._stop_event.is_set():
+                if not socket.poll(POLL_TIMEOUT_MS):
+                    continue
+                message = messenger.receive_any_message("tasks", accept)
+                if isinstance(message, TaskStatusMsg):
+                    if message.task_id:
+                        self.index.update(message)
+                elif isinstance(message, HeartbeatMsg) and self._on_heartbeat is not None:
+                    self._on_heartbeat(message)
+        finally:
+            messenger.close_all()
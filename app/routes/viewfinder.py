@@ -1,63 +1,317 @@
 from flask import(
-    Blueprint, Flask, render_template, Response, request, jsonify, redirect, url_for, session
+    Blueprint, Flask, render_template, Response, request, jsonify, redirect, url_for, session, abort, current_app
 )
 import threading
 import cv2
 import numpy as np
+import math
 import time
 import os
+import uuid
+from collections import OrderedDict
 
-from app.routes.stream.viewfinder import zmq_receiver, latest_images, stop_event
+from app.routes.stream.broadcaster import (
+    FrameBroadcaster, RegionOfInterest, select_tier, MJPEG_MIMETYPE
+)
+from app.routes.stream.mjpeg import KEEPALIVE_INTERVAL, generate_mjpeg
+from app.routes.stream.analytics import FrameAnalyzer, iter_analytics_events
+from app.routes.stream.composite import DEFAULT_TOLERANCE_MS, CompositeStream
+from app.routes.stream.receiver import CAMERA_PORTS, camera_receiver, shared_store_receiver
+from app.routes.stream.subscriptions import SubscriptionManager
+from app.routes.stream.frame_buffer import FrameRingBuffer, clip_info, iter_multipart, iter_zip
+from app.routes.stream.recorder import (
+    SessionRecorder, RecordingReader, list_sessions, session_dir, session_cameras, play_recording
+)
 from app.routes.messages.Common import PI_IP
+from app import BASE_DIR, metrics
 
 bp = Blueprint('viewfinder', __name__, url_prefix='/viewfinder')
 
-stream_1_receiver_thread = threading.Thread(target=zmq_receiver, args=(0, f"tcp://{PI_IP}:5555"), daemon=False)
-stream_2_receiver_thread = threading.Thread(target=zmq_receiver, args=(1, f"tcp://{PI_IP}:5556"), daemon=False)
+# One shared encoder per camera; stream 0 is mounted upside down and flipped before
+# encoding, unless a viewer passes ?client_flip=1 and flips it itself
+broadcasters = [FrameBroadcaster(0, flip=True), FrameBroadcaster(1)]
+
+# Pre-trigger replay window kept per camera, bounded by time and by memory
+REPLAY_BUFFER_SECONDS = 5.0
+REPLAY_BUFFER_BYTES = 64 * 1024 * 1024
+# Frozen clips keep their frames alive, so only the newest few are retained
+MAX_FROZEN_CLIPS = 4
+
+# Clips are frozen after unattended shots, so the replay buffer keeps every camera
+# subscribed; PITRAC_REPLAY_BUFFER=0 turns it off, and cameras then follow viewers
+REPLAY_BUFFER_ENABLED = os.environ.get("PITRAC_REPLAY_BUFFER", "1") != "0"
+
+replay_buffers = [FrameRingBuffer(REPLAY_BUFFER_SECONDS, REPLAY_BUFFER_BYTES) for _ in broadcasters]
+if REPLAY_BUFFER_ENABLED:
+    for broadcaster, replay_buffer in zip(broadcasters, replay_buffers):
+        broadcaster.add_frame_listener(replay_buffer.append)
+
+frozen_clips = OrderedDict()
+frozen_clips_lock = threading.Lock()
+
+# Full-rate recordings of both cameras for after-the-fact debugging
+RECORDINGS_DIR = os.environ.get("PITRAC_RECORDINGS_DIR", os.path.join(os.path.dirname(BASE_DIR), "recordings"))
+recorder = SessionRecorder(RECORDINGS_DIR)
+for broadcaster in broadcasters:
+    recorder.attach(broadcaster)
+
+# Exposure and motion statistics, computed once per frame whoever is watching, while the
+# camera is subscribed; PITRAC_ANALYTICS=always keeps the cameras subscribed for them
+ANALYTICS_MODE = os.environ.get("PITRAC_ANALYTICS", "1")
+ANALYTICS_ENABLED = ANALYTICS_MODE != "0"
+analyzers = [FrameAnalyzer(broadcaster.cam_index) for broadcaster in broadcasters]
+if ANALYTICS_ENABLED:
+    for broadcaster, analyzer in zip(broadcasters, analyzers):
+        analyzer.attach(broadcaster)
+ANALYTICS_MIN_INTERVAL = 0.1
+ANALYTICS_DEFAULT_INTERVAL = 0.5
+# Results are sent after sleeping the interval, so it's no longer than the keepalive
+ANALYTICS_MAX_INTERVAL = KEEPALIVE_INTERVAL
+
+# Both cameras side by side, paired by capture time and encoded once for every viewer
+COMPOSITE_TOLERANCE_MS = float(os.environ.get("PITRAC_COMPOSITE_TOLERANCE_MS", DEFAULT_TOLERANCE_MS))
+composite = CompositeStream(broadcasters, COMPOSITE_TOLERANCE_MS)
+
+# Set in web workers when a separate ingest process owns the camera subscriptions
+# (python -m app.routes.stream.ingest); workers then read frames from shared memory
+FRAME_STORE = os.environ.get("PITRAC_FRAME_STORE")
+
+# Seconds a camera stays subscribed after its last viewer leaves
+SUBSCRIPTION_GRACE_PERIOD = float(os.environ.get("PITRAC_SUBSCRIPTION_GRACE", "10"))
+
+def frame_source(port):
+    if FRAME_STORE:
+        return lambda broadcaster, stop: shared_store_receiver(broadcaster, FRAME_STORE, stop)
+    endpoint = f"tcp://{PI_IP}:{port}"
+    return lambda broadcaster, stop: camera_receiver(broadcaster, endpoint, stop)
+
+# Cameras are only subscribed while someone is watching or recording, or a background
+# consumer below needs their frames
+subscriptions = SubscriptionManager(broadcasters, [frame_source(port) for port in CAMERA_PORTS],
+                                    SUBSCRIPTION_GRACE_PERIOD, dependents=[composite])
+
+# Consumers that need frames with nobody watching; each holds its own subscription to every camera
+background_consumers = [name for name, enabled in (("replay_buffer", REPLAY_BUFFER_ENABLED),
+                                                    ("analytics", ANALYTICS_MODE == "always")) if enabled]
+for _ in background_consumers:
+    for cam_index in range(len(broadcasters)):
+        subscriptions.acquire(cam_index)
+
+def live_stream(cam_index, frames, stats):
+    # Subscribed for as long as the response is open; call_on_close also runs
+    # when the client disconnects before the first frame
+    subscriptions.acquire(cam_index)
+    response = Response(frames, mimetype=MJPEG_MIMETYPE)
+    response.call_on_close(lambda: subscriptions.release(cam_index))
+    response.call_on_close(stats.close)
+    return response
 
 # For now redirect to viewfinder
 @bp.route("/")
 def viewfinder():
-    if os.environ.get("WERKZEUG_RUN_MAIN") == "true":
-        if not stream_1_receiver_thread.is_alive():
-            stream_1_receiver_thread.start()
-        if not stream_2_receiver_thread.is_alive():
-            stream_2_receiver_thread.start()
-        return render_template("viewfinder/viewfinder.html")
+    return render_template("viewfinder/viewfinder.html",
+                           client_flip=[broadcaster.flip for broadcaster in broadcasters],
+                           websocket="viewfinder_ws" in current_app.blueprints)
+
+def client_id():
+    # Viewer identity for per-client metrics
+    return f"{request.remote_addr}:{request.environ.get('REMOTE_PORT', '')}"
+
+def get_min_interval():
+    # Optional per-client frame cap; frames arriving in between are skipped
+    max_fps = request.args.get("max_fps", type=float)
+    return 1.0 / max_fps if max_fps and max_fps > 0 else 0.0
+
+def get_client_flip():
+    # ?client_flip=1: the viewer flips upside-down cameras itself, so frames can pass through
+    return request.args.get("client_flip", "0") not in ("0", "", "false")
+
+def get_bounded_float(name, default, low, high):
+    # Clamped to [low, high]; None when the argument isn't a finite number
+    value = request.args.get(name, default, type=float)
+    if not math.isfinite(value):
+        return None
+    return min(max(value, low), high)
+
+def get_tier():
+    # ?width= / ?quality= pick one of the shared quality tiers
+    return select_tier(request.args.get("width", type=int), request.args.get("quality"))
 
 @bp.route("/stream/<int:cam_index>")
 def stream(cam_index):
-    def generate():
-        while True:
-            if latest_images[cam_index] is not None:
-                if cam_index == 0:
-                    # Flip stream 1 vertically
-                    latest_images[cam_index] = cv2.flip(latest_images[cam_index], 0)
-                ret, jpeg = cv2.imencode('.jpg', latest_images[cam_index])
-                if ret:
-                    yield (b'--frame\r\n'
-                           b'Content-Type: image/jpeg\r\n\r\n' + jpeg.tobytes() + b'\r\n')
-            else:
-                # If no image yet, send a blank frame or wait
-                blank_image = np.zeros((480, 640, 3), dtype=np.uint8)
-                ret, jpeg = cv2.imencode('.jpg', blank_image)
-                if ret:
-                    yield (b'--frame\r\n'
-                           b'Content-Type: image/jpeg\r\n\r\n' + jpeg.tobytes() + b'\r\n')
-            time.sleep(0.1)  # Adjust frame rate as needed
-    return Response(generate(), mimetype='multipart/x-mixed-replace; boundary=frame')
+    if cam_index >= len(broadcasters):
+        abort(404)
+    stats = metrics.stream_stats(cam_index, "mjpeg", client_id())
+    return live_stream(cam_index, generate_mjpeg(broadcasters[cam_index], get_min_interval(), get_tier(), stats=stats,
+                                                 client_flip=get_client_flip()),
+                       stats)
     
-@bp.route("/stop_stream", methods=["POST"])
-def stop_stream():
-    stop_event.set()
-    latest_images[0] = None
-    latest_images[1] = None
-    if os.environ.get("WERKZEUG_RUN_MAIN") == "true":
-        if stream_1_receiver_thread.is_alive():
-            stream_1_receiver_thread.join()
-        if stream_2_receiver_thread.is_alive():
-            stream_2_receiver_thread.join()
-    return '', 204
+@bp.route("/stream/<int:cam_index>/roi")
+def stream_roi(cam_index):
+    if cam_index >= len(broadcasters):
+        abort(404)
+    x = request.args.get("x", type=int)
+    y = request.args.get("y", type=int)
+    w = request.args.get("w", type=int)
+    h = request.args.get("h", type=int)
+    scale = get_bounded_float("scale", 1.0, 0.1, 4.0)
+    if None in (x, y, w, h) or x < 0 or y < 0 or w <= 0 or h <= 0:
+        return jsonify({"error": "x, y, w and h are required and must be non-negative (w, h > 0)"}), 400
+    if scale is None:
+        return jsonify({"error": "scale must be a finite number"}), 400
+    roi = RegionOfInterest(x, y, w, h, scale)
+    stats = metrics.stream_stats(cam_index, "mjpeg_roi", client_id())
+    return live_stream(cam_index, generate_mjpeg(broadcasters[cam_index], get_min_interval(), roi=roi, stats=stats),
+                       stats)
+
+@bp.route("/stream/composite")
+def stream_composite():
+    # Composed only while both cameras are subscribed and frames pair within tolerance
+    stats = metrics.stream_stats(composite.broadcaster.cam_index, "mjpeg_composite", client_id())
+    composite.acquire()
+    for cam_index in range(len(broadcasters)):
+        subscriptions.acquire(cam_index)
+    response = Response(generate_mjpeg(composite.broadcaster, get_min_interval(), get_tier(), stats=stats),
+                        mimetype=MJPEG_MIMETYPE)
+    for cam_index in range(len(broadcasters)):
+        response.call_on_close(lambda cam_index=cam_index: subscriptions.release(cam_index))
+    response.call_on_close(composite.release)
+    response.call_on_close(stats.close)
+    return response
+
+@bp.route("/composite")
+def composite_status():
+    # Pairing counts and the measured inter-camera skew (camera 1 minus camera 0)
+    return jsonify(composite.status())
+
+@bp.route("/analytics/<int:cam_index>")
+def analytics(cam_index):
+    # Latest result only; the camera is analysed while something keeps it subscribed
+    if cam_index >= len(analyzers) or not ANALYTICS_ENABLED:
+        abort(404)
+    version, result = analyzers[cam_index].latest()
+    return jsonify({"version": version, "subscribed": subscriptions[cam_index].active, "analytics": result})
+
+@bp.route("/analytics/<int:cam_index>/stream")
+def analytics_stream(cam_index):
+    if cam_index >= len(analyzers) or not ANALYTICS_ENABLED:
+        abort(404)
+    interval = get_bounded_float("interval", ANALYTICS_DEFAULT_INTERVAL, ANALYTICS_MIN_INTERVAL, ANALYTICS_MAX_INTERVAL)
+    if interval is None:
+        return jsonify({"error": "interval must be a finite number of seconds"}), 400
+    subscriptions.acquire(cam_index)
+    response = Response(iter_analytics_events(analyzers[cam_index], interval, KEEPALIVE_INTERVAL),
+                        mimetype="text/event-stream")
+    response.call_on_close(lambda: subscriptions.release(cam_index))
+    response.headers["Cache-Control"] = "no-cache"
+    response.headers["X-Accel-Buffering"] = "no"
+    return response
+
+@bp.route("/clips", methods=["POST"])
+def freeze_clip():
+    if not REPLAY_BUFFER_ENABLED:
+        abort(404)
+    clip_id = uuid.uuid4().hex[:12]
+    clip = [replay_buffer.freeze() for replay_buffer in replay_buffers]
+    with frozen_clips_lock:
+        frozen_clips[clip_id] = clip
+        while len(frozen_clips) > MAX_FROZEN_CLIPS:
+            frozen_clips.popitem(last=False)
+    return jsonify({"clip_id": clip_id, "cameras": [clip_info(frames) for frames in clip]}), 201
+
+def get_clip_frames(clip_id, cam_index):
+    with frozen_clips_lock:
+        clip = frozen_clips.get(clip_id)
+    if clip is None or cam_index >= len(clip):
+        abort(404)
+    return clip[cam_index]
+
+@bp.route("/clips/<clip_id>/<int:cam_index>")
+def clip_stream(cam_index, clip_id):
+    frames = get_clip_frames(clip_id, cam_index)
+    speed = get_bounded_float("speed", 1.0, 0.25, 4.0)
+    if speed is None:
+        return jsonify({"error": "speed must be a finite number"}), 400
+    flip = broadcasters[cam_index].flip and not get_client_flip()
+    return Response(iter_multipart(frames, speed, flip), mimetype=MJPEG_MIMETYPE)
+
+@bp.route("/clips/<clip_id>/<int:cam_index>.zip")
+def clip_zip(cam_index, clip_id):
+    frames = get_clip_frames(clip_id, cam_index)
+    return Response(iter_zip(frames, prefix=f"cam{cam_index}", flip=broadcasters[cam_index].flip),
+                    mimetype="application/zip",
+                    headers={"Content-Disposition": f"attachment; filename=clip_{clip_id}_cam{cam_index}.zip"})
+
+@bp.route("/recordings", methods=["GET"])
+def recordings():
+    sessions = []
+    for session_id in list_sessions(RECORDINGS_DIR):
+        path = session_dir(RECORDINGS_DIR, session_id)
+        cameras = {}
+        for cam_index in session_cameras(path):
+            reader = RecordingReader(path, cam_index)
+            cameras[cam_index] = reader.info()
+            reader.close()
+        sessions.append({"session_id": session_id, "cameras": cameras})
+    return jsonify({"active": recorder.session_id, "sessions": sessions})
+
+recording_lock = threading.Lock()
+
+@bp.route("/recordings", methods=["POST"])
+def start_recording():
+    with recording_lock:
+        if recorder.session_id is None:
+            # A recording counts as a viewer of every camera
+            for cam_index in range(len(broadcasters)):
+                subscriptions.acquire(cam_index)
+        session_id = recorder.start()
+    return jsonify({"session_id": session_id}), 201
+
+@bp.route("/recordings/stop", methods=["POST"])
+def stop_recording():
+    with recording_lock:
+        session_id = recorder.stop()
+        if session_id is not None:
+            for cam_index in range(len(broadcasters)):
+                subscriptions.release(cam_index)
+    return jsonify({"session_id": session_id, "dropped": recorder.dropped})
+
+@bp.route("/recordings/<session_id>/<int:cam_index>")
+def replay_recording(session_id, cam_index):
+    path = session_dir(RECORDINGS_DIR, session_id)
+    if path is None or cam_index >= len(broadcasters) or cam_index not in session_cameras(path):
+        abort(404)
+    speed = get_bounded_float("speed", 1.0, 0.25, 4.0)
+    # Optional start offset in seconds from the beginning of the recording
+    start = request.args.get("start", 0.0, type=float)
+    if speed is None or not math.isfinite(start):
+        return jsonify({"error": "speed and start must be finite numbers"}), 400
+    min_interval = get_min_interval()
+    tier = get_tier()
+    client_flip = get_client_flip()
+
+    reader = RecordingReader(path, cam_index)
+    start_position = 0
+    if start > 0 and len(reader):
+        start_position = reader.seek(int(reader.index['capture_timestamp'][0]) + int(start * 1_000_000))
+    live = broadcasters[cam_index]
+    replay = FrameBroadcaster(cam_index, flip=live.flip)
+    stop_replay = threading.Event()
+    player = threading.Thread(target=play_recording, args=(reader, replay, stop_replay, speed, start_position),
+                              daemon=True)
+    def stop_player():
+        stop_replay.set()
+        player.join()
+        reader.close()
+    player.start()
+    response = Response(generate_mjpeg(replay, min_interval, tier, client_flip=client_flip), mimetype=MJPEG_MIMETYPE)
+    # Runs even when the client goes away before the first frame is sent
+    response.call_on_close(stop_player)
+    return response
+
+@bp.route("/subscriptions")
+def subscription_status():
+    return jsonify({"background": background_consumers, "cameras": subscriptions.status()})
 
 # Start ZMQ receiver threads for each camera
 
@@ -0,0 +1,124 @@
+from flask import(
+    Blueprint
+)
+import struct
+import threading
+import time
+
+from app import metrics
+from app.clock import PI_CLOCK
+from app.routes.viewfinder import (
+    broadcasters, client_id, get_client_flip, get_min_interval, get_tier, subscriptions, KEEPALIVE_INTERVAL
+)
+from app.routes.stream.broadcaster import FULL_TIER, chunk_payload
+
+try:
+    from flask_sock import Sock
+except ImportError:
+    # WebSocket push is optional; without flask-sock the viewfinder falls back to MJPEG
+    Sock = None
+
+bp = Blueprint('viewfinder_ws', __name__, url_prefix='/viewfinder')
+
+# Binary frame header (little endian), followed by the JPEG bytes:
+#   version u8, camera u8, header length u16, frame_number i64,
+#   capture_timestamp i64 (us, on the server clock), server send timestamp i64 (us), fps f32
+FRAME_HEADER = struct.Struct('<BBHqqqf')
+FRAME_HEADER_VERSION = 1
+
+sock = Sock() if Sock is not None else None
+
+
+def frame_message(cam_index, frame, jpeg):
+    header = FRAME_HEADER.pack(FRAME_HEADER_VERSION, cam_index, FRAME_HEADER.size, frame.frame_number,
+                               PI_CLOCK.to_local_us(frame.capture_timestamp), time.time_ns() // 1000, frame.fps)
+    return header + jpeg
+
+
+class LatestFrameSender:
+    """
+    Sends on its own thread from a one-slot mailbox. A slow client only ever has
+    one frame queued; anything newer replaces it, so its TCP buffer never backs up.
+    """
+
+    def __init__(self, ws, stats=metrics.NULL_STREAM_STATS):
+        self._ws = ws
+        self._stats = stats
+        self._pending = None
+        self._ready = threading.Condition()
+        self.closed = threading.Event()
+        self.dropped = 0
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+
+    def offer(self, message):
+        with self._ready:
+            if self._pending is not None:
+                self.dropped += 1
+                self._stats.dropped(1)
+            self._pending = message
+            self._ready.notify()
+
+    def close(self):
+        self.closed.set()
+        with self._ready:
+            self._ready.notify()
+        self._thread.join()
+
+    def _run(self):
+        while not self.closed.is_set():
+            with self._ready:
+                self._ready.wait_for(lambda: self._pending is not None or self.closed.is_set())
+                message, self._pending = self._pending, None
+            if message is None:
+                continue
+            try:
+                self._ws.send(message)
+                self._stats.sent(len(message))
+            except Exception:
+                self.closed.set()
+
+
+def send_frames(ws, cam_index, broadcaster, sender, min_interval=0.0, tier=FULL_TIER, client_flip=False,
+                stats=metrics.NULL_STREAM_STATS, keepalive=KEEPALIVE_INTERVAL):
+    """Offer each new frame of broadcaster to sender until the client goes away"""
+    generation = -1
+    next_send = 0.0
+    while not sender.closed.is_set() and ws.connected:
+        if min_interval:
+            delay = next_send - time.monotonic()
+            if delay > 0:
+                time.sleep(delay)
+        new_generation, frame = broadcaster.wait_for_new_frame(generation, timeout=keepalive)
+        if new_generation == generation:
+            continue
+        if frame is None:
+            # No frame yet, or the camera was reset; wait for the next generation
+            generation = new_generation
+            continue
+        if generation >= 0:
+            stats.dropped(new_generation - generation - 1)
+        generation = new_generation
+        chunk = broadcaster.latest_chunk(tier, frame, client_flip)
+        if chunk is None:
+            continue
+        sender.offer(frame_message(cam_index, frame, chunk_payload(chunk)))
+        next_send = time.monotonic() + min_interval
+
+
+if sock is not None:
+    @sock.route("/ws/<int:cam_index>", bp=bp)
+    def stream_ws(ws, cam_index):
+        if cam_index >= len(broadcasters):
+            ws.close(reason=1008, message="Unknown camera")
+            return
+        stats = metrics.stream_stats(cam_index, "websocket", client_id())
+        subscriptions.acquire(cam_index)
+        sender = LatestFrameSender(ws, stats)
+        try:
+            send_frames(ws, cam_index, broadcasters[cam_index], sender, get_min_interval(), get_tier(),
+                        get_client_flip(), stats)
+        finally:
+            sender.close()
+            stats.close()
+            subscriptions.release(cam_index)
@@ -0,0 +1,279 @@
+"""
+PiTrac Load Driver
+Opens concurrent MJPEG viewers against a running app (usually fed by
+benchmarks.pi_simulator), fires change_mode bursts, and reports delivered fps,
+frame latency and the server's CPU and memory use.
+
+    python -m benchmarks.pi_simulator &
+    python run.py &
+    python -m benchmarks.load_driver --viewers 20 --duration 30 --server-pid <app pid>
+
+Latency is receive time minus the X-Timestamp capture time on each part, so the
+simulator, app and driver must share a clock (run them on one machine).
+"""
+
+import argparse
+import http.client
+import json
+import os
+import threading
+import time
+from typing import Dict, List, Optional
+from urllib.parse import urlsplit
+
+import numpy as np
+
+try:
+    import psutil
+except ImportError:
+    # Optional; without it server stats come from /proc (Linux only)
+    psutil = None
+
+SAMPLE_INTERVAL = 1.0
+MODES = ("viewfinder", "standby")
+
+
+class Viewer:
+    """One MJPEG client, reading parts by Content-Length"""
+
+    def __init__(self, host: str, port: int, path: str):
+        self.host = host
+        self.port = port
+        self.path = path
+        self.frames = 0
+        self.bytes = 0
+        self.latencies: List[float] = []
+        self.error: Optional[str] = None
+        self.started = 0.0
+        self.finished = 0.0
+
+    def run(self, stop_event: threading.Event) -> None:
+        connection = http.client.HTTPConnection(self.host, self.port, timeout=10)
+        self.started = time.monotonic()
+        try:
+            connection.request("GET", self.path)
+            response = connection.getresponse()
+            if response.status != 200:
+                self.error = f"HTTP {response.status}"
+                return
+            while not stop_event.is_set():
+                headers = self._read_headers(response)
+                if headers is None:
+                    self.error = "stream closed"
+                    return
+                length = int(headers.get("content-length", 0))
+                payload = response.read(length + 2)  # trailing CRLF
+                now = time.time()
+                self.frames += 1
+                self.bytes += len(payload)
+                if "x-timestamp" in headers:
+                    self.latencies.append(now - float(headers["x-timestamp"]))
+        except (OSError, http.client.HTTPException, ValueError) as e:
+            if not stop_event.is_set():
+                self.error = str(e)
+        finally:
+            self.finished = time.monotonic()
+            connection.close()
+
+    @staticmethod
+    def _read_headers(response) -> Optional[Dict[str, str]]:
+        headers = {}
+        while True:
+            line = response.readline()
+            if not line:
+                return None
+            line = line.strip()
+            if not line:
+                if headers:
+                    return headers
+                continue
+            if b":" in line:
+                name, value = line.split(b":", 1)
+                headers[name.decode().strip().lower()] = value.decode().strip()
+
+    def summary(self) -> Dict[str, object]:
+        elapsed = (self.finished or time.monotonic()) - self.started
+        result = {
+            "path": self.path,
+            "frames": self.frames,
+            "fps": self.frames / elapsed if elapsed > 0 else 0.0,
+            "mbit_per_second": self.bytes * 8 / elapsed / 1e6 if elapsed > 0 else 0.0,
+            "error": self.error,
+        }
+        result.update(latency_summary(self.latencies))
+        return result
+
+
+class CommandBursts:
+    """Every interval, sends burst concurrent change_mode requests, alternating modes"""
+
+    def __init__(self, host: str, port: int, burst: int, interval: float):
+        self.host = host
+        self.port = port
+        self.burst = burst
+        self.interval = interval
+        self.latencies: List[float] = []
+        self.status_counts: Dict[str, int] = {}
+        self._lock = threading.Lock()
+
+    def run(self, stop_event: threading.Event) -> None:
+        round_number = 0
+        while not stop_event.wait(self.interval):
+            mode = MODES[round_number % len(MODES)]
+            round_number += 1
+            senders = [threading.Thread(target=self._send, args=(mode,)) for _ in range(self.burst)]
+            for sender in senders:
+                sender.start()
+            for sender in senders:
+                sender.join()
+
+    def _send(self, mode: str) -> None:
+        connection = http.client.HTTPConnection(self.host, self.port, timeout=30)
+        start = time.perf_counter()
+        try:
+            connection.request("POST", "/api/change_mode", body=json.dumps({"mode": mode}),
+                               headers={"Content-Type": "application/json"})
+            status = str(connection.getresponse().status)
+        except (OSError, http.client.HTTPException) as e:
+            status = type(e).__name__
+        finally:
+            connection.close()
+        with self._lock:
+            self.latencies.append(time.perf_counter() - start)
+            self.status_counts[status] = self.status_counts.get(status, 0) + 1
+
+    def summary(self) -> Dict[str, object]:
+        result: Dict[str, object] = {"requests": len(self.latencies), "status": self.status_counts}
+        result.update(latency_summary(self.latencies))
+        return result
+
+
+class ServerSampler:
+    """Samples a process's CPU (percent of one core) and resident memory"""
+
+    def __init__(self, pid: int):
+        self.pid = pid
+        self.cpu_percent: List[float] = []
+        self.rss_bytes: List[int] = []
+        self._process = psutil.Process(pid) if psutil is not None else None
+
+    def run(self, stop_event: threading.Event) -> None:
+        last_cpu, last_time = self._cpu_seconds(), time.monotonic()
+        while not stop_event.wait(SAMPLE_INTERVAL):
+            cpu, now = self._cpu_seconds(), time.monotonic()
+            self.cpu_percent.append(100.0 * (cpu - last_cpu) / (now - last_time))
+            self.rss_bytes.append(self._rss())
+            last_cpu, last_time = cpu, now
+
+    def _cpu_seconds(self) -> float:
+        if self._process is not None:
+            times = self._process.cpu_times()
+            return times.user + times.system
+        with open(f"/proc/{self.pid}/stat") as f:
+            fields = f.read().rsplit(")", 1)[1].split()
+        return (int(fields[11]) + int(fields[12])) / os.sysconf("SC_CLK_TCK")
+
+    def _rss(self) -> int:
+        if self._process is not None:
+            return self._process.memory_info().rss
+        with open(f"/proc/{self.pid}/status") as f:
+            for line in f:
+                if line.startswith("VmRSS:"):
+                    return int(line.split()[1]) * 1024
+        return 0
+
+    def summary(self) -> Dict[str, object]:
+        if not self.cpu_percent:
+            return {}
+        return {
+            "cpu_percent_mean": float(np.mean(self.cpu_percent)),
+            "cpu_percent_max": float(np.max(self.cpu_percent)),
+            "rss_mb_max": max(self.rss_bytes) / 1e6,
+            "rss_mb_last": self.rss_bytes[-1] / 1e6,
+        }
+
+
+def latency_summary(latencies: List[float]) -> Dict[str, Optional[float]]:
+    if not latencies:
+        return {"latency_p50_ms": None, "latency_p99_ms": None}
+    p50, p99 = np.percentile(np.asarray(latencies) * 1000.0, [50, 99])
+    return {"latency_p50_ms": float(p50), "latency_p99_ms": float(p99)}
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--url", default="http://127.0.0.1:5000", help="app base URL")
+    parser.add_argument("--viewers", type=int, default=10, help="concurrent MJPEG viewers")
+    parser.add_argument("--cameras", default="0,1", help="cameras to spread viewers across")
+    parser.add_argument("--query", default="", help="stream query string, e.g. quality=medium&max_fps=15")
+    parser.add_argument("--duration", type=float, default=30.0, help="seconds")
+    parser.add_argument("--command-burst", type=int, default=0, help="change_mode requests per burst")
+    parser.add_argument("--burst-interval", type=float, default=5.0, help="seconds between bursts")
+    parser.add_argument("--server-pid", type=int, help="app process to sample for CPU and RSS")
+    parser.add_argument("--output", help="write the report as JSON")
+    args = parser.parse_args(argv)
+
+    url = urlsplit(args.url)
+    host, port = url.hostname or "127.0.0.1", url.port or 80
+    cameras = [int(camera) for camera in args.cameras.split(",")]
+    query = f"?{args.query}" if args.query else ""
+
+    # The viewfinder page starts the app's camera receivers
+    connection = http.client.HTTPConnection(host, port, timeout=10)
+    connection.request("GET", "/viewfinder/")
+    connection.getresponse().read()
+    connection.close()
+
+    stop_event = threading.Event()
+    viewers = [Viewer(host, port, f"/viewfinder/stream/{cameras[i % len(cameras)]}{query}")
+               for i in range(args.viewers)]
+    workers = [viewer.run for viewer in viewers]
+    bursts = CommandBursts(host, port, args.command_burst, args.burst_interval) if args.command_burst else None
+    if bursts is not None:
+        workers.append(bursts.run)
+    sampler = ServerSampler(args.server_pid) if args.server_pid else None
+    if sampler is not None:
+        workers.append(sampler.run)
+
+    threads = [threading.Thread(target=worker, args=(stop_event,), daemon=True) for worker in workers]
+    for thread in threads:
+        thread.start()
+    try:
+        time.sleep(args.duration)
+    except KeyboardInterrupt:
+        pass
+    stop_event.set()
+    for thread in threads:
+        thread.join(timeout=15)
+
+    all_latencies = [latency for viewer in viewers for latency in viewer.latencies]
+    clients = [viewer.summary() for viewer in viewers]
+    fps = [client["fps"] for client in clients]
+    report = {
+        "settings": vars(args),
+        "viewers": {
+            "count": len(viewers),
+            "fps_mean": float(np.mean(fps)) if fps else 0.0,
+            "fps_min": float(np.min(fps)) if fps else 0.0,
+            "errors": sum(1 for client in clients if client["error"]),
+            **latency_summary(all_latencies),
+        },
+        "clients": clients,
+        "commands": bursts.summary() if bursts is not None else None,
+        "server": sampler.summary() if sampler is not None else None,
+    }
+
+    for i, client in enumerate(clients):
+        latency = (f"p50 {client['latency_p50_ms']:7.1f} ms  p99 {client['latency_p99_ms']:7.1f} ms"
+                   if client["latency_p50_ms"] is not None else "no frames")
+        print(f"client {i:3d} {client['path']:<40} {client['fps']:6.1f} fps  {latency}"
+              f"{'  error: ' + client['error'] if client['error'] else ''}")
+    print(json.dumps({key: report[key] for key in ("viewers", "commands", "server")}, indent=2))
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(report, f, indent=2)
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
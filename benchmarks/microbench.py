@@ -0,0 +1,309 @@
+"""
+PiTrac Microbenchmarks
+Message layer (serialize, deserialize, clone, to_json, from_dict) at realistic
+payload sizes, plus viewfinder MJPEG generator throughput on synthetic frames.
+
+    python -m benchmarks.microbench                        # full run, saved under benchmarks/results/
+    python -m benchmarks.microbench --quick --filter Camera
+    python -m benchmarks.microbench --compare benchmarks/results/<previous>.json
+
+Results are JSON so runs can be compared across commits and machines.
+"""
+
+import argparse
+import json
+import os
+import platform
+import re
+import statistics
+import subprocess
+import sys
+import time
+import timeit
+from typing import Callable, Dict, Iterator, List, Optional, Tuple
+
+import cv2
+import numpy as np
+
+from app.messages.common import AckMessage
+from app.messages.common.AckMessage import AckStatus
+from app.messages.external import CameraFrameMsg, SystemCommandMsg, TaskStatusMsg
+from app.messages.external.SystemCommandMsg import CommandID
+from app.messages.internal import HeartbeatMsg
+from app.messages.message_types import MessageType
+
+RESULTS_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "results")
+
+# image_data sizes spanning a small preview JPEG to a full-resolution frame
+IMAGE_SIZES = (50 * 1024, 256 * 1024, 1024 * 1024, 2 * 1024 * 1024)
+ERROR_LOG_LINES = (0, 1_000, 10_000)
+STREAM_RESOLUTIONS = ((640, 480), (1456, 1088))
+
+OPERATIONS = ("serialize", "deserialize", "clone", "to_json", "from_dict")
+
+
+def _camera_frame(size: int) -> CameraFrameMsg:
+    return CameraFrameMsg(camera_id="cam0", frame_number=123_456, capture_timestamp=time.time_ns() // 1000,
+                          fps=60.0, image_data=os.urandom(size), metadata={"codec": "jpeg", "quality": "90"})
+
+
+def _task_status(lines: int) -> TaskStatusMsg:
+    return TaskStatusMsg(task_id="calibration-0001", status="failed", progress=0.73,
+                         details={"stage": "ball_detection", "camera": "0", "attempt": "3"},
+                         error_log=[f"[{i:06d}] ball not found in ROI (x=412, y=388, r=14): contrast below threshold"
+                                    for i in range(lines)])
+
+
+def _system_command() -> SystemCommandMsg:
+    return SystemCommandMsg(command_id=CommandID.SetMode, command_params={"mode": "3", "correlation_id": "0" * 32})
+
+
+def _ack(payload: bytes) -> AckMessage:
+    return AckMessage(ack_status=AckStatus.Success, original_message_type=int(MessageType.SystemCommand),
+                      original_message_data=payload, original_timestamp=time.time_ns() // 1000,
+                      ack_timestamp=time.time_ns() // 1000, metadata={"correlation_id": "0" * 32})
+
+
+def _heartbeat() -> HeartbeatMsg:
+    now = time.time_ns() // 1000
+    return HeartbeatMsg(agent_id="pi", sequence=123_456, origin_timestamp=now, receive_timestamp=now + 150,
+                        transmit_timestamp=now + 180, status="viewfinder")
+
+
+def message_cases() -> Iterator[Tuple[str, Dict[str, object], Callable[[], object], int]]:
+    """(name, params, factory, payload bytes) for every message class and payload size"""
+    for size in IMAGE_SIZES:
+        yield "CameraFrameMsg", {"image_bytes": size}, lambda size=size: _camera_frame(size), size
+    for lines in ERROR_LOG_LINES:
+        message = _task_status(lines)
+        yield "TaskStatusMsg", {"error_log_lines": lines}, lambda lines=lines: _task_status(lines), \
+            len(message.serialize())
+    yield "SystemCommandMsg", {}, _system_command, len(_system_command().serialize())
+    command_data = _system_command().serialize()
+    yield "AckMessage", {"original_bytes": len(command_data)}, lambda: _ack(command_data), len(command_data)
+    yield "HeartbeatMsg", {}, _heartbeat, len(_heartbeat().serialize())
+
+
+def _operation(message, operation: str) -> Callable[[], object]:
+    message_class = message.__class__
+    if operation == "serialize":
+        return message.serialize
+    if operation == "deserialize":
+        data = message.serialize()
+        return lambda: message_class().deserialize(data)
+    if operation == "clone":
+        return message.clone
+    if operation == "to_json":
+        return message.to_json
+    if operation == "from_dict":
+        data = message.to_dict()
+        return lambda: message_class.from_dict(data)
+    raise ValueError(f"Unknown operation {operation}")
+
+
+def measure(func: Callable[[], object], repeat: int, min_time: float) -> List[float]:
+    """Seconds per call for each of repeat runs, each run lasting at least min_time"""
+    timer = timeit.Timer(func)
+    number = 1
+    while True:
+        elapsed = timer.timeit(number)
+        if elapsed >= min_time:
+            break
+        number = max(number * 2, int(number * min_time / max(elapsed, 1e-9)))
+    return [timer.timeit(number) / number for _ in range(repeat)]
+
+
+def _result(name: str, params: Dict[str, object], samples: List[float], payload_bytes: int = 0,
+            unit: str = "op") -> Dict[str, object]:
+    median = statistics.median(samples)
+    result = {
+        "name": name,
+        "params": params,
+        "unit": unit,
+        "median_us": median * 1e6,
+        "min_us": min(samples) * 1e6,
+        "stdev_us": statistics.stdev(samples) * 1e6 if len(samples) > 1 else 0.0,
+        "per_second": 1.0 / median if median else 0.0,
+    }
+    if payload_bytes:
+        result["mb_per_second"] = payload_bytes / median / 1e6 if median else 0.0
+    return result
+
+
+def _failed(name: str, params: Dict[str, object], error: Exception) -> Dict[str, object]:
+    """Result recorded in place of a benchmark that raised, so the rest of the run still counts"""
+    return {"name": name, "params": params, "error": f"{type(error).__name__}: {error}"}
+
+
+def bench_messages(repeat: int, min_time: float, name_filter: Optional[re.Pattern]) -> Iterator[Dict[str, object]]:
+    for class_name, params, factory, payload_bytes in message_cases():
+        message = factory()
+        for operation in OPERATIONS:
+            name = f"{class_name}.{operation}"
+            if name_filter and not name_filter.search(name):
+                continue
+            try:
+                samples = measure(_operation(message, operation), repeat, min_time)
+            except Exception as e:
+                yield _failed(name, params, e)
+                continue
+            yield _result(name, params, samples, payload_bytes)
+
+
+def synthetic_frames(width: int, height: int, count: int = 8, quality: int = 90,
+                     codec: str = "jpeg") -> List[CameraFrameMsg]:
+    """Frames of a moving gradient plus sensor noise, so they compress like real captures"""
+    rng = np.random.default_rng(0)
+    x = np.linspace(0, 255, width, dtype=np.float32)
+    frames = []
+    for i in range(count):
+        gradient = np.roll(np.broadcast_to(x, (height, width)), i * width // count, axis=1)
+        image = np.clip(gradient + rng.normal(0, 8, (height, width)), 0, 255).astype(np.uint8)
+        image = cv2.cvtColor(image, cv2.COLOR_GRAY2BGR)
+        if codec == "png":
+            ret, data = cv2.imencode('.png', image)
+        else:
+            ret, data = cv2.imencode('.jpg', image, [cv2.IMWRITE_JPEG_QUALITY, quality])
+        frames.append(CameraFrameMsg(camera_id="cam0", frame_number=i + 1, capture_timestamp=time.time_ns() // 1000,
+                                     fps=60.0, image_data=data.tobytes(), metadata={"codec": codec}))
+    return frames
+
+
+def bench_stream(repeat: int, min_time: float, name_filter: Optional[re.Pattern]) -> Iterator[Dict[str, object]]:
+    """
+    Frames per second through generate_mjpeg on one core: each iteration publishes a
+    new frame and pulls the next chunk, so the generator never waits on a receiver
+    """
+    from app.routes.stream.broadcaster import FrameBroadcaster, QUALITY_TIERS
+    from app.routes.stream.mjpeg import generate_mjpeg
+
+    for width, height in STREAM_RESOLUTIONS:
+        source = synthetic_frames(width, height)
+        for flip in (False, True):
+            for tier in QUALITY_TIERS.values():
+                name = "generate_mjpeg"
+                params = {"resolution": f"{width}x{height}", "tier": tier.name, "server_flip": flip}
+                if name_filter and not name_filter.search(f"{name} {tier.name}"):
+                    continue
+                broadcaster = FrameBroadcaster(0, flip=flip)
+                stream = generate_mjpeg(broadcaster, tier=tier)
+                frame_numbers = iter(range(1, 1 << 62))
+
+                def next_frame():
+                    number = next(frame_numbers)
+                    frame = source[number % len(source)]
+                    # Fresh message object each time, as if just received, so caches miss
+                    broadcaster.publish(CameraFrameMsg(camera_id=frame.camera_id, frame_number=number,
+                                                       capture_timestamp=frame.capture_timestamp, fps=frame.fps,
+                                                       image_data=frame.image_data, metadata=frame.metadata))
+                    return next(stream)
+
+                try:
+                    samples = measure(next_frame, repeat, min_time)
+                except Exception as e:
+                    yield _failed(name, params, e)
+                    continue
+                finally:
+                    stream.close()
+                yield _result(name, params, samples, unit="frame")
+
+
+def _report(result: Dict[str, object]) -> None:
+    params = " ".join(f"{key}={value}" for key, value in result["params"].items())
+    if "error" in result:
+        print(f"{result['name']:<28} {params:<48} FAILED {result['error']}", flush=True)
+        return
+    throughput = f"  {result['mb_per_second']:8.1f} MB/s" if "mb_per_second" in result else ""
+    print(f"{result['name']:<28} {params:<48} {result['median_us']:>11.2f} us/{result['unit']}"
+          f"  {result['per_second']:>11.1f}/s{throughput}", flush=True)
+
+
+def _git_commit() -> Optional[str]:
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True,
+                              check=True, cwd=os.path.dirname(RESULTS_DIR)).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def environment() -> Dict[str, object]:
+    return {
+        "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S%z"),
+        "git_commit": _git_commit(),
+        "python": sys.version.split()[0],
+        "platform": platform.platform(),
+        "machine": platform.machine(),
+        "cpu_count": os.cpu_count(),
+        "numpy": np.__version__,
+        "opencv": cv2.__version__,
+    }
+
+
+def _key(result: Dict[str, object]) -> str:
+    return result["name"] + json.dumps(result["params"], sort_keys=True)
+
+
+def compare(previous: Dict[str, object], current: Dict[str, object]) -> None:
+    """Print the median time ratio (current / previous) for benchmarks present in both runs"""
+    before = {_key(result): result for result in previous["results"]}
+    print(f"\nCompared with {previous['environment'].get('git_commit')} ({previous['environment']['timestamp']}):")
+    for result in current["results"]:
+        old = before.get(_key(result))
+        if old is None or "error" in result or "error" in old:
+            continue
+        ratio = result["median_us"] / old["median_us"] if old["median_us"] else float('nan')
+        params = " ".join(f"{key}={value}" for key, value in result["params"].items())
+        verdict = "faster" if ratio < 0.98 else "slower" if ratio > 1.02 else "unchanged"
+        print(f"{result['name']:<28} {params:<48} {ratio:6.2f}x time  {verdict}")
+
+
+def _save(run: Dict[str, object], output: str) -> None:
+    # Write then rename, so the file is never left half written
+    partial = output + ".tmp"
+    with open(partial, "w") as f:
+        json.dump(run, f, indent=2)
+    os.replace(partial, output)
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--output", help="result file (default: benchmarks/results/<commit>-<time>.json)")
+    parser.add_argument("--filter", help="only run benchmarks whose name matches this regex")
+    parser.add_argument("--repeat", type=int, default=7, help="timed runs per benchmark")
+    parser.add_argument("--min-time", type=float, default=0.2, help="minimum seconds per timed run")
+    parser.add_argument("--quick", action="store_true", help="3 short runs per benchmark")
+    parser.add_argument("--skip-stream", action="store_true", help="skip the generate_mjpeg benchmarks")
+    parser.add_argument("--compare", help="previous result file to compare against")
+    args = parser.parse_args(argv)
+
+    repeat, min_time = (3, 0.05) if args.quick else (args.repeat, args.min_time)
+    name_filter = re.compile(args.filter) if args.filter else None
+
+    run = {"environment": environment(), "settings": {"repeat": repeat, "min_time": min_time}, "results": []}
+    output = args.output
+    if output is None:
+        os.makedirs(RESULTS_DIR, exist_ok=True)
+        output = os.path.join(RESULTS_DIR, f"{run['environment']['git_commit'] or 'unknown'}-"
+                                           f"{time.strftime('%Y%m%d-%H%M%S')}.json")
+
+    benchmarks = [bench_messages(repeat, min_time, name_filter)]
+    if not args.skip_stream:
+        benchmarks.append(bench_stream(repeat, min_time, name_filter))
+    # Saved after every result, so an interrupted or crashed run keeps what it measured
+    for results in benchmarks:
+        for result in results:
+            run["results"].append(result)
+            _report(result)
+            _save(run, output)
+    _save(run, output)
+    failed = sum("error" in result for result in run["results"])
+    print(f"\nSaved {len(run['results'])} results to {output}" + (f" ({failed} failed)" if failed else ""))
+
+    if args.compare:
+        with open(args.compare) as f:
+            compare(json.load(f), run)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,308 @@
+"""
+PiTrac Simulator
+Stands in for the Pi: publishes synthetic CameraFrameMsg streams and acknowledges
+SystemCommandMsg, so the app can be run and load tested without a camera.
+
+    python -m benchmarks.pi_simulator --width 1456 --height 1088 --fps 60
+    python -m benchmarks.pi_simulator --ack-delay-ms 50 --failure-rate 0.1 --drop-rate 0.05
+    python -m benchmarks.pi_simulator --task-rate 200     # TaskStatusMsg progress flood
+    python -m benchmarks.pi_simulator --clock-skew-ms 350  # Pi clock ahead of ours
+
+Point the app's PI_IP at this machine (127.0.0.1 when run locally).
+"""
+
+import argparse
+import heapq
+import logging
+import random
+import signal
+import threading
+import time
+from datetime import datetime
+from typing import List, Optional, Tuple
+
+import zmq
+
+from app.messages.common import AckMessage
+from app.messages.common.AckMessage import AckStatus
+from app.messages.external import CameraFrameMsg, SystemCommandMsg, TaskStatusMsg
+from app.messages.external.SystemCommandMsg import CommandID
+from app.messages.internal import HeartbeatMsg
+from app.messages.message_registry import decode_message
+from app.routes.command.client import CORRELATION_KEY
+from benchmarks.microbench import synthetic_frames
+
+CAMERA_PORTS = (5555, 5556)
+COMMAND_PORT = 6000
+TASK_STATUS_PORT = 5557
+# Progress updates per simulated task before it completes
+TASK_STEPS = 500
+# Distinct frames cycled per camera; encoding happens once, up front
+FRAME_POOL_SIZE = 16
+
+# Simulated Pi clock minus real time; every timestamp the simulator sends is on the Pi clock
+clock_skew_us = 0
+
+logger = logging.getLogger("pi_simulator")
+
+
+def pi_now_us() -> int:
+    return time.time_ns() // 1000 + clock_skew_us
+
+
+def stamp(message) -> None:
+    """Set a message's send timestamp on the simulated Pi clock"""
+    message.set_timestamp(datetime.fromtimestamp(pi_now_us() / 1_000_000))
+
+
+class CameraPublisher:
+    """Publishes one camera's frames at a fixed rate, stamped at send time"""
+
+    def __init__(self, context: zmq.Context, endpoint: str, cam_index: int, frames: List[CameraFrameMsg],
+                 fps: float, start_delay: float = 0.0):
+        self._socket = context.socket(zmq.PUB)
+        self._socket.setsockopt(zmq.SNDHWM, 4)
+        self._socket.bind(endpoint)
+        self._cam_index = cam_index
+        self._frames = frames
+        self._interval = 1.0 / fps
+        self._start_delay = start_delay
+        self.sent = 0
+
+    def run(self, stop_event: threading.Event) -> None:
+        next_due = time.monotonic() + self._start_delay
+        frame_number = 0
+        try:
+            while not stop_event.is_set():
+                delay = next_due - time.monotonic()
+                if delay > 0 and stop_event.wait(delay):
+                    break
+                # Skip ahead rather than bursting if we fell behind
+                next_due = max(next_due + self._interval, time.monotonic())
+                frame_number += 1
+                source = self._frames[frame_number % len(self._frames)]
+                frame = CameraFrameMsg(camera_id=f"cam{self._cam_index}", frame_number=frame_number,
+                                       capture_timestamp=pi_now_us(), fps=1.0 / self._interval,
+                                       image_data=source.image_data, metadata=source.metadata)
+                stamp(frame)
+                self._socket.send(frame.serialize(), copy=False)
+                self.sent += 1
+        finally:
+            self._socket.close(linger=0)
+
+
+class TaskPublisher:
+    """Publishes TaskStatusMsg progress for a rolling series of simulated tasks"""
+
+    def __init__(self, context: zmq.Context, endpoint: str, rate: float, failure_rate: float = 0.0):
+        self._socket = context.socket(zmq.PUB)
+        self._socket.bind(endpoint)
+        self._interval = 1.0 / rate
+        self._failure_rate = failure_rate
+        self.sent = 0
+
+    def run(self, stop_event: threading.Event) -> None:
+        task_number = 0
+        try:
+            while not stop_event.is_set():
+                task_number += 1
+                task_id = f"calibration-{task_number:04d}"
+                failed = random.random() < self._failure_rate
+                for step in range(1, TASK_STEPS + 1):
+                    if stop_event.wait(self._interval):
+                        return
+                    status = "running"
+                    error_log = []
+                    if step == TASK_STEPS:
+                        status = "failed" if failed else "completed"
+                        error_log = ["Simulated failure: ball not found"] if failed else []
+                    message = TaskStatusMsg(task_id=task_id, status=status, progress=step / TASK_STEPS,
+                                            details={"stage": f"step {step}"}, error_log=error_log)
+                    stamp(message)
+                    self._socket.send(message.serialize())
+                    self.sent += 1
+        finally:
+            self._socket.close(linger=0)
+
+
+class CommandResponder:
+    """
+    Acknowledges commands on a ROUTER socket (compatible with the app's DEALER),
+    after a configurable delay, failing or dropping a configurable fraction.
+
+    By default heartbeats are answered immediately and out of order, like a Pi
+    with a separate heartbeat handler. With serial, every request is handled one
+    at a time in arrival order, as behind the real Pi's REP socket, so a heartbeat
+    waits for the commands ahead of it. heartbeat_reply "ack" answers heartbeats
+    with a failed AckMessage and "none" ignores them, like a Pi that predates them.
+    """
+
+    def __init__(self, context: zmq.Context, endpoint: str, delay_ms: float = 0.0, jitter_ms: float = 0.0,
+                 failure_rate: float = 0.0, drop_rate: float = 0.0, retry_rate: float = 0.0,
+                 serial: bool = False, heartbeat_reply: str = "heartbeat"):
+        self._socket = context.socket(zmq.ROUTER)
+        self._socket.bind(endpoint)
+        self._delay = delay_ms / 1000.0
+        self._jitter = jitter_ms / 1000.0
+        self._failure_rate = failure_rate
+        self._drop_rate = drop_rate
+        self._retry_rate = retry_rate
+        self._serial = serial
+        self._heartbeat_reply = heartbeat_reply
+        # When the request being handled in serial mode finishes
+        self._busy_until = 0.0
+        self._scheduled: List[Tuple[float, int, List[bytes]]] = []
+        self._sequence = 0
+        self.mode: Optional[str] = None
+        self.received = 0
+        self.dropped = 0
+        self.heartbeats = 0
+        self.retries = 0
+
+    def run(self, stop_event: threading.Event) -> None:
+        try:
+            while not stop_event.is_set():
+                now = time.monotonic()
+                while self._scheduled and self._scheduled[0][0] <= now:
+                    _, _, reply = heapq.heappop(self._scheduled)
+                    self._socket.send_multipart(reply)
+                timeout = 100
+                if self._scheduled:
+                    timeout = min(timeout, max(0, int((self._scheduled[0][0] - now) * 1000)))
+                if self._socket.poll(timeout):
+                    self._handle(self._socket.recv_multipart())
+        finally:
+            self._socket.close(linger=0)
+
+    def _handle(self, parts: List[bytes]) -> None:
+        received_us = pi_now_us()
+        identity, data = parts[0], parts[-1]
+        try:
+            command = decode_message(data)
+        except ValueError as e:
+            logger.warning(f"Ignoring malformed command: {e}")
+            return
+        if isinstance(command, HeartbeatMsg):
+            self.heartbeats += 1
+            if self._heartbeat_reply == "none":
+                return
+            if self._heartbeat_reply == "ack":
+                ack = AckMessage(ack_status=AckStatus.Failure, original_message_type=int(command.get_message_type()),
+                                 original_message_data=data, original_timestamp=command.get_timestamp_ms() or 0,
+                                 ack_timestamp=pi_now_us(), error_message="Unsupported message type")
+                self._schedule(0.0, [identity, b"", ack.serialize()])
+                return
+            reply = HeartbeatMsg(agent_id="pi", sequence=command.sequence, origin_timestamp=command.origin_timestamp,
+                                 receive_timestamp=received_us, status=self.mode or "", metadata=command.metadata)
+            stamp(reply)
+            reply.transmit_timestamp = pi_now_us()
+            if self._serial:
+                self._schedule(0.0, [identity, b"", reply.serialize()])
+            else:
+                self._socket.send_multipart([identity, b"", reply.serialize()])
+            return
+        if not isinstance(command, SystemCommandMsg):
+            logger.warning(f"Ignoring unexpected {command.__class__.__name__}")
+            return
+        self.received += 1
+        if random.random() < self._drop_rate:
+            self.dropped += 1
+            return
+
+        ack = AckMessage(original_message_type=int(command.get_message_type()), original_message_data=data,
+                         original_timestamp=command.get_timestamp_ms() or 0, ack_timestamp=pi_now_us())
+        correlation_id = command.command_params.get(CORRELATION_KEY)
+        if correlation_id:
+            ack.metadata[CORRELATION_KEY] = correlation_id
+        if random.random() < self._failure_rate:
+            ack.ack_status = AckStatus.Failure
+            ack.error_message = "Simulated failure"
+        elif random.random() < self._retry_rate:
+            ack.ack_status = AckStatus.Retry
+            ack.error_message = "Simulated busy"
+            self.retries += 1
+        else:
+            ack.ack_status = AckStatus.Success
+            if command.command_id == CommandID.SetMode:
+                self.mode = command.command_params.get("mode")
+                ack.metadata["mode"] = self.mode or ""
+        self._schedule(self._delay + random.uniform(0, self._jitter), [identity, b"", ack.serialize()])
+
+    def _schedule(self, delay: float, reply: List[bytes]) -> None:
+        due = time.monotonic()
+        if self._serial:
+            # Handled after everything received before it
+            due = max(due, self._busy_until)
+            self._busy_until = due + delay
+        self._sequence += 1
+        heapq.heappush(self._scheduled, (due + delay, self._sequence, reply))
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--host", default="*", help="interface to bind")
+    parser.add_argument("--cameras", type=int, default=len(CAMERA_PORTS), choices=range(1, len(CAMERA_PORTS) + 1))
+    parser.add_argument("--width", type=int, default=1456)
+    parser.add_argument("--height", type=int, default=1088)
+    parser.add_argument("--fps", type=float, default=30.0)
+    parser.add_argument("--codec", choices=("jpeg", "png"), default="jpeg")
+    parser.add_argument("--quality", type=int, default=90, help="JPEG quality")
+    parser.add_argument("--ack-delay-ms", type=float, default=5.0)
+    parser.add_argument("--ack-jitter-ms", type=float, default=0.0)
+    parser.add_argument("--failure-rate", type=float, default=0.0, help="fraction of commands acked with Failure")
+    parser.add_argument("--drop-rate", type=float, default=0.0, help="fraction of commands never acked")
+    parser.add_argument("--retry-rate", type=float, default=0.0, help="fraction of commands acked with Retry")
+    parser.add_argument("--task-rate", type=float, default=0.0, help="TaskStatusMsg updates per second (0: off)")
+    parser.add_argument("--clock-skew-ms", type=float, default=0.0, help="simulated Pi clock minus real time")
+    parser.add_argument("--serial", action="store_true",
+                        help="handle commands and heartbeats one at a time, in order, like a REP socket")
+    parser.add_argument("--heartbeat-reply", choices=("heartbeat", "ack", "none"), default="heartbeat",
+                        help="answer heartbeats with a HeartbeatMsg, a failed AckMessage, or not at all")
+    parser.add_argument("--camera-offset-ms", type=float, default=0.0,
+                        help="capture time offset of each camera from the previous one")
+    parser.add_argument("--seed", type=int, help="random seed for failures and drops")
+    args = parser.parse_args(argv)
+
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s %(name)s %(message)s")
+    global clock_skew_us
+    clock_skew_us = int(args.clock_skew_ms * 1000)
+    if args.seed is not None:
+        random.seed(args.seed)
+
+    context = zmq.Context()
+    stop_event = threading.Event()
+    signal.signal(signal.SIGINT, lambda *_: stop_event.set())
+    signal.signal(signal.SIGTERM, lambda *_: stop_event.set())
+
+    frames = synthetic_frames(args.width, args.height, FRAME_POOL_SIZE, args.quality, args.codec)
+    logger.info(f"{args.width}x{args.height} {args.codec} frames, "
+                f"{sum(len(frame.image_data) for frame in frames) // len(frames)} bytes average")
+    publishers = [CameraPublisher(context, f"tcp://{args.host}:{port}", cam_index, frames, args.fps,
+                                  cam_index * args.camera_offset_ms / 1000.0)
+                  for cam_index, port in enumerate(CAMERA_PORTS[:args.cameras])]
+    responder = CommandResponder(context, f"tcp://{args.host}:{COMMAND_PORT}", args.ack_delay_ms,
+                                 args.ack_jitter_ms, args.failure_rate, args.drop_rate, args.retry_rate,
+                                 args.serial, args.heartbeat_reply)
+    workers = publishers + [responder]
+    if args.task_rate > 0:
+        workers.append(TaskPublisher(context, f"tcp://{args.host}:{TASK_STATUS_PORT}", args.task_rate,
+                                     args.failure_rate))
+    threads = [threading.Thread(target=worker.run, args=(stop_event,), daemon=True) for worker in workers]
+    for thread in threads:
+        thread.start()
+
+    started = time.monotonic()
+    while not stop_event.wait(5.0):
+        elapsed = time.monotonic() - started
+        rates = ", ".join(f"cam{i} {publisher.sent / elapsed:.1f} fps" for i, publisher in enumerate(publishers))
+        logger.info(f"{rates}; commands {responder.received} ({responder.dropped} dropped, "
+                    f"{responder.retries} asked to retry), "
+                    f"{responder.heartbeats} heartbeats, mode {responder.mode}")
+    for thread in threads:
+        thread.join()
+    context.term()
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
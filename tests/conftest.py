@@ -0,0 +1,40 @@
+"""
+Shared test setup. The app reads the Pi's address from app.routes.messages.Common,
+which is deployment configuration kept outside the repository; when it's absent,
+point the app at a Pi on this machine.
+"""
+
+import sys
+import types
+
+import cv2
+import numpy as np
+import pytest
+import zmq
+
+from app.messages.external import CameraFrameMsg
+
+try:
+    import app.routes.messages.Common  # noqa: F401
+except ImportError:
+    common = types.ModuleType("app.routes.messages.Common")
+    common.PI_IP = "127.0.0.1"
+    common.ZMQ_CONTEXT = zmq.Context.instance()
+    sys.modules.setdefault("app.routes.messages", types.ModuleType("app.routes.messages"))
+    sys.modules["app.routes.messages.Common"] = common
+
+
+def make_frame(frame_number=1, capture_timestamp=None, width=64, height=48, camera_id="cam0"):
+    """A small JPEG camera frame"""
+    image = np.full((height, width, 3), frame_number % 256, dtype=np.uint8)
+    ret, jpeg = cv2.imencode('.jpg', image)
+    assert ret
+    if capture_timestamp is None:
+        capture_timestamp = 1_000_000 + frame_number * 33_333
+    return CameraFrameMsg(camera_id=camera_id, frame_number=frame_number, capture_timestamp=capture_timestamp,
+                          fps=30.0, image_data=jpeg.tobytes(), metadata={"codec": "jpeg"})
+
+
+@pytest.fixture
+def frame_factory():
+    return make_frame
@@ -0,0 +1,123 @@
+import threading
+import time
+
+from app.routes.stream.broadcaster import FrameBroadcaster
+from app.routes.stream.composite import CompositeStream, FramePairer
+from app.routes.stream.subscriptions import SubscriptionManager
+
+
+def collect_pairs(**kwargs):
+    pairs = []
+    return pairs, FramePairer(lambda first, second: pairs.append((first.frame_number, second.frame_number)),
+                              **kwargs)
+
+
+def test_pairs_nearest_frame_within_tolerance(frame_factory):
+    pairs, pairer = collect_pairs(tolerance_ms=5)
+    pairer.add(0, frame_factory(1, capture_timestamp=1_000_000))
+    pairer.add(1, frame_factory(11, capture_timestamp=1_002_000))
+    pairer.add(0, frame_factory(2, capture_timestamp=1_033_000))
+    # 9 ms away: outside tolerance
+    pairer.add(1, frame_factory(12, capture_timestamp=1_042_000))
+    pairer.add(0, frame_factory(3, capture_timestamp=1_066_000))
+    pairer.add(1, frame_factory(13, capture_timestamp=1_067_000))
+    assert pairs == [(1, 11), (3, 13)]
+
+
+def test_pairs_only_move_forward(frame_factory):
+    pairs, pairer = collect_pairs(tolerance_ms=20)
+    pairer.add(0, frame_factory(1, capture_timestamp=1_000_000))
+    pairer.add(1, frame_factory(11, capture_timestamp=1_001_000))
+    # Closer to frame 1 than anything else, but frame 1 is already paired
+    pairer.add(1, frame_factory(12, capture_timestamp=1_002_000))
+    pairer.add(0, frame_factory(2, capture_timestamp=1_010_000))
+    assert pairs == [(1, 11), (2, 12)]
+
+
+def test_frames_leaving_the_window_are_counted_unpaired(frame_factory):
+    _, pairer = collect_pairs(tolerance_ms=5, window_ms=100)
+    pairer.add(0, frame_factory(1, capture_timestamp=1_000_000))
+    pairer.add(0, frame_factory(2, capture_timestamp=1_200_000))
+    assert pairer.unpaired == [1, 0]
+
+
+def test_reset_forgets_buffered_frames(frame_factory):
+    pairs, pairer = collect_pairs(tolerance_ms=20)
+    pairer.add(0, frame_factory(1, capture_timestamp=1_000_000))
+    pairer.reset()
+    pairer.add(1, frame_factory(11, capture_timestamp=1_001_000))
+    assert pairs == []
+
+
+def make_composite():
+    sources = [FrameBroadcaster(0), FrameBroadcaster(1)]
+    return sources, CompositeStream(sources, tolerance_ms=20, side_width=32)
+
+
+def publish_pair(sources, frame_factory, number):
+    timestamp = 1_000_000 + number * 33_333
+    sources[0].publish(frame_factory(number, capture_timestamp=timestamp))
+    sources[1].publish(frame_factory(number, capture_timestamp=timestamp + 2_000))
+
+
+def wait_for(condition, timeout=2.0):
+    deadline = time.monotonic() + timeout
+    while not condition() and time.monotonic() < deadline:
+        time.sleep(0.01)
+    return condition()
+
+
+def test_skew_recorded_but_nothing_composed_without_viewers(frame_factory):
+    sources, composite = make_composite()
+    for number in range(1, 6):
+        publish_pair(sources, frame_factory, number)
+    status = composite.status()
+    assert status["pairs"] == 5
+    assert status["skew_ms"]["last"] == 2.0
+    time.sleep(0.1)
+    assert composite.status()["composed"] == 0
+    assert composite.broadcaster.latest_frame() is None
+
+
+def test_composes_for_viewers(frame_factory):
+    sources, composite = make_composite()
+    composite.acquire()
+    publish_pair(sources, frame_factory, 1)
+    assert wait_for(lambda: composite.broadcaster.latest_frame() is not None)
+    frame = composite.broadcaster.latest_frame()
+    assert frame.metadata["skew_us"] == "2000"
+    assert frame.metadata["frame_numbers"] == "1,1"
+    composite.release()
+
+
+def test_status_while_receivers_append(frame_factory):
+    sources, composite = make_composite()
+    stop = threading.Event()
+
+    def receive():
+        number = 0
+        while not stop.is_set():
+            number += 1
+            publish_pair(sources, frame_factory, number)
+    thread = threading.Thread(target=receive)
+    thread.start()
+    try:
+        for _ in range(500):
+            composite.status()
+    finally:
+        stop.set()
+        thread.join()
+
+
+def test_camera_unsubscribing_resets_composite(frame_factory):
+    sources, composite = make_composite()
+    idle = lambda broadcaster, stop_event: stop_event.wait()
+    subscriptions = SubscriptionManager(sources, [idle, idle], grace_period=0.0, dependents=[composite])
+    composite.acquire()
+    subscriptions.acquire(0)
+    subscriptions.acquire(1)
+    publish_pair(sources, frame_factory, 1)
+    assert wait_for(lambda: composite.broadcaster.latest_frame() is not None)
+    subscriptions.release(0)
+    assert wait_for(lambda: composite.broadcaster.latest_frame() is None)
+    subscriptions.stop_all()
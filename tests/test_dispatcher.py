@@ -0,0 +1,139 @@
+import pytest
+
+from app.messages.common import AckMessage
+from app.messages.common.AckMessage import AckStatus
+from app.messages.external import SystemCommandMsg
+from app.routes.command.client import CommandTimeout
+from app.routes.command.dispatcher import RETRY_AFTER_KEY, CircuitBreaker, CircuitOpen, CommandDispatcher, RetryPolicy
+
+
+def ack(status=AckStatus.Success, **metadata):
+    return AckMessage(ack_status=status, metadata=metadata)
+
+
+def opened(breaker):
+    for _ in range(breaker.failure_threshold):
+        breaker.record_failure()
+    return breaker
+
+
+class ScriptedClient:
+    """A command client answering each send with the next scripted ack, or raising it"""
+
+    def __init__(self, *replies):
+        self.replies = list(replies)
+        self.sent = 0
+
+    def send_command(self, command, timeout_ms):
+        self.sent += 1
+        reply = self.replies.pop(0)
+        if isinstance(reply, Exception):
+            raise reply
+        return reply
+
+
+class IdleMonitor:
+    def __init__(self):
+        self.listeners = []
+
+    def start(self):
+        pass
+
+    def add_listener(self, listener):
+        self.listeners.append(listener)
+
+
+def test_circuit_opens_after_consecutive_failures():
+    breaker = CircuitBreaker(failure_threshold=3)
+    breaker.record_failure()
+    breaker.record_failure()
+    breaker.record_success()
+    breaker.record_failure()
+    breaker.record_failure()
+    assert breaker.state == CircuitBreaker.CLOSED
+    breaker.record_failure()
+    assert breaker.state == CircuitBreaker.OPEN
+    with pytest.raises(CircuitOpen) as rejected:
+        breaker.allow()
+    assert 0 < rejected.value.retry_after <= breaker.open_seconds * 1.2
+    assert breaker.status()["rejected"] == 1
+
+
+def test_cooldown_lets_a_single_trial_through():
+    breaker = opened(CircuitBreaker(open_seconds=0.0))
+    breaker.allow()
+    assert breaker.state == CircuitBreaker.HALF_OPEN
+    with pytest.raises(CircuitOpen):
+        breaker.allow()
+    breaker.record_success()
+    assert breaker.state == CircuitBreaker.CLOSED
+    breaker.allow()
+
+
+def test_failed_trial_reopens_at_once():
+    breaker = opened(CircuitBreaker(open_seconds=0.0))
+    breaker.allow()
+    breaker.open_seconds = 60.0
+    breaker.record_failure()
+    assert breaker.state == CircuitBreaker.OPEN
+    assert breaker.status()["opened"] == 2
+    with pytest.raises(CircuitOpen):
+        breaker.allow()
+
+
+def test_heartbeat_loss_holds_the_circuit_until_the_probe_answers():
+    breaker = CircuitBreaker(open_seconds=60.0)
+    breaker.trip()
+    assert breaker.status()["held_open"]
+    with pytest.raises(CircuitOpen):
+        breaker.allow()
+    breaker.probe_succeeded()
+    breaker.allow()
+    assert breaker.state == CircuitBreaker.HALF_OPEN
+
+
+def test_retry_policy_bounds_attempts_to_retryable_statuses():
+    policy = RetryPolicy(max_attempts=3)
+    assert policy.should_retry(ack(AckStatus.Retry), 1)
+    assert policy.should_retry(ack(AckStatus.Partial), 2)
+    assert not policy.should_retry(ack(AckStatus.Retry), 3)
+    assert not policy.should_retry(ack(AckStatus.Failure), 1)
+    assert not policy.should_retry(ack(AckStatus.Success), 1)
+
+
+def test_retry_delay_is_capped_and_honours_the_pi_hint():
+    policy = RetryPolicy(base_delay=0.05, max_delay=0.2)
+    assert all(0 <= policy.delay(ack(AckStatus.Retry), attempt) <= 0.2 for attempt in range(1, 10))
+    assert policy.delay(ack(AckStatus.Retry, **{RETRY_AFTER_KEY: "300"}), 1) >= 0.3
+    assert policy.delay(ack(AckStatus.Retry, **{RETRY_AFTER_KEY: "soon"}), 1) <= 0.05
+
+
+def test_dispatcher_retries_busy_acks():
+    client = ScriptedClient(ack(AckStatus.Retry), ack(AckStatus.Success))
+    dispatcher = CommandDispatcher(client, IdleMonitor(), policy=RetryPolicy(base_delay=0.001))
+    assert dispatcher.send(SystemCommandMsg(command_id=1)).ack_status == AckStatus.Success
+    assert client.sent == 2
+
+
+def test_dispatcher_stops_sending_to_an_unreachable_pi():
+    client = ScriptedClient(*[CommandTimeout("no ack")] * 3)
+    dispatcher = CommandDispatcher(client, IdleMonitor())
+    for _ in range(3):
+        with pytest.raises(CommandTimeout):
+            dispatcher.send(SystemCommandMsg())
+    with pytest.raises(CircuitOpen):
+        dispatcher.send(SystemCommandMsg())
+    assert client.sent == 3
+
+
+def test_dispatcher_follows_heartbeat_liveness():
+    monitor = IdleMonitor()
+    dispatcher = CommandDispatcher(ScriptedClient(ack()), monitor)
+    for listener in monitor.listeners:
+        listener("pi", False)
+    with pytest.raises(CircuitOpen):
+        dispatcher.send(SystemCommandMsg())
+    for listener in monitor.listeners:
+        listener("pi", True)
+    dispatcher.send(SystemCommandMsg())
+    assert dispatcher.status()["state"] == CircuitBreaker.CLOSED
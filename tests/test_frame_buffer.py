@@ -0,0 +1,88 @@
+import io
+import json
+import time
+import zipfile
+
+import cv2
+import numpy as np
+
+from app.routes.stream.frame_buffer import FrameRingBuffer, clip_info, iter_multipart, iter_zip
+
+
+def test_keeps_only_the_time_window(frame_factory):
+    buffer = FrameRingBuffer(max_seconds=0.1)
+    for number in range(1, 11):
+        buffer.append(frame_factory(number, capture_timestamp=number * 20_000))
+    frames = buffer.freeze()
+    assert [frame.frame_number for frame in frames] == [5, 6, 7, 8, 9, 10]
+
+
+def test_keeps_within_the_byte_budget(frame_factory):
+    size = len(frame_factory(1).image_data)
+    buffer = FrameRingBuffer(max_seconds=60, max_bytes=size * 3 + size // 2)
+    for number in range(1, 8):
+        buffer.append(frame_factory(1, capture_timestamp=number * 1000))
+    assert len(buffer) == 3
+    assert buffer.size_bytes <= buffer.max_bytes
+
+
+def test_frame_larger_than_the_budget_is_skipped(frame_factory):
+    buffer = FrameRingBuffer(max_bytes=10)
+    buffer.append(frame_factory(1))
+    assert len(buffer) == 0
+
+
+def test_frozen_clip_is_unaffected_by_later_frames(frame_factory):
+    buffer = FrameRingBuffer()
+    buffer.append(frame_factory(1))
+    clip = buffer.freeze()
+    buffer.append(frame_factory(2))
+    buffer.clear()
+    assert [frame.frame_number for frame in clip] == [1]
+    assert clip_info(clip)["frames"] == 1
+
+
+def unzip(chunks):
+    return zipfile.ZipFile(io.BytesIO(b''.join(chunks)))
+
+
+def test_zip_holds_every_frame_as_sent_and_an_index(frame_factory):
+    frames = [frame_factory(number) for number in range(1, 4)]
+    buffer = FrameRingBuffer()
+    for frame in frames:
+        buffer.append(frame)
+    archive = unzip(iter_zip(buffer.freeze(), prefix="cam0"))
+    index = json.loads(archive.read("frames.json"))
+    assert [entry["frame_number"] for entry in index] == [1, 2, 3]
+    for entry, frame in zip(index, frames):
+        assert entry["file"].startswith("cam0_")
+        assert archive.read(entry["file"]) == frame.image_data
+        # Stamped in 1970, as by a Pi clock counting from boot
+        assert archive.getinfo(entry["file"]).date_time == (1980, 1, 1, 0, 0, 0)
+
+
+def test_zip_flips_frames_when_asked(frame_factory):
+    image = np.zeros((48, 64, 3), dtype=np.uint8)
+    image[:8] = 255
+    frame = frame_factory(1)
+    frame.image_data = cv2.imencode('.png', image)[1].tobytes()
+    frame.metadata = {"codec": "png"}
+    buffer = FrameRingBuffer()
+    buffer.append(frame)
+    archive = unzip(iter_zip(buffer.freeze(), flip=True))
+    name = json.loads(archive.read("frames.json"))[0]["file"]
+    assert name.endswith(".jpeg")
+    flipped = cv2.imdecode(np.frombuffer(archive.read(name), dtype=np.uint8), cv2.IMREAD_GRAYSCALE)
+    assert flipped[-4:].mean() > 200 and flipped[:4].mean() < 50
+
+
+def test_multipart_is_paced_by_speed(frame_factory):
+    buffer = FrameRingBuffer()
+    for number in range(1, 5):
+        buffer.append(frame_factory(number, capture_timestamp=number * 100_000))
+    start = time.monotonic()
+    chunks = list(iter_multipart(buffer.freeze(), speed=4.0))
+    elapsed = time.monotonic() - start
+    assert len(chunks) == 4
+    # 0.3 s of capture at 4x
+    assert 0.06 <= elapsed < 0.2
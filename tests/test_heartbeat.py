@@ -0,0 +1,63 @@
+from app.clock import ClockSync
+from app.routes.command.client import DEFAULT_TIMEOUT_MS, CommandTimeout
+from app.routes.command.heartbeat import HeartbeatMonitor
+
+
+class SilentClient:
+    """A command client whose heartbeats are never answered"""
+
+    def __init__(self):
+        self.clock = ClockSync()
+        self.in_flight = 0
+        self.released = 0
+
+    def commands_in_flight(self):
+        return self.in_flight
+
+    def send_heartbeat(self, heartbeat, timeout_ms):
+        raise CommandTimeout("no reply")
+
+    def fail_pending(self, reason):
+        self.released += 1
+        return 0
+
+
+def answered_monitor(client):
+    monitor = HeartbeatMonitor(client, misses_before_dead=2)
+    # As if the Pi had answered before going quiet
+    monitor._answered = True
+    monitor._agents[monitor.target].responding = True
+    return monitor
+
+
+def test_idle_pi_is_declared_dead_after_two_misses():
+    client = SilentClient()
+    monitor = answered_monitor(client)
+    monitor._beat()
+    assert not monitor.pi_down
+    monitor._beat()
+    assert monitor.pi_down
+    assert client.released == 1
+
+
+def test_misses_while_a_command_is_in_flight_are_excused():
+    client = SilentClient()
+    client.in_flight = 1
+    monitor = answered_monitor(client)
+    for _ in range(5):
+        monitor._beat()
+    assert not monitor.pi_down
+    assert monitor.status()["agents"][0]["total_misses"] == 5
+
+
+def test_pi_that_never_answers_switches_to_passive():
+    monitor = HeartbeatMonitor(SilentClient())
+    for _ in range(3):
+        monitor._beat()
+    assert not monitor.polling
+    assert not monitor.pi_down
+
+
+def test_detection_is_faster_than_a_command_timeout():
+    monitor = HeartbeatMonitor(SilentClient())
+    assert monitor.misses_before_dead * monitor.interval * 1000 + monitor.timeout_ms < DEFAULT_TIMEOUT_MS
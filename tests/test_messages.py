@@ -0,0 +1,82 @@
+import msgpack
+import pytest
+
+from app.messages.common import AckMessage
+from app.messages.external import CameraFrameMsg, SystemCommandMsg, TaskStatusMsg
+from app.messages.internal import HeartbeatMsg
+from app.messages.message_interface import MessageBase
+from app.messages.message_registry import decode_message, get_message_class, peek_header
+from app.messages.message_types import MessageType
+
+SAMPLES = [
+    AckMessage(ack_status=4, original_message_type=201, original_message_data=b'\x93\x01\x02\x03',
+               original_timestamp=1_700_000_000_123_456, ack_timestamp=1_700_000_000_223_456,
+               error_message="busy", metadata={"mode": "calibration"}),
+    CameraFrameMsg(camera_id="cam1", frame_number=70_000, capture_timestamp=1_700_000_000_000_001, fps=59.94,
+                   image_data=bytes(range(256)) * 300, metadata={"codec": "jpeg", "quality": "80"}),
+    SystemCommandMsg(command_id=1, command_params={"mode": "viewfinder"}),
+    TaskStatusMsg(task_id="ball-detect", status="running", progress=0.25, details={"stage": "2"},
+                  error_log=["late frame", "retrying"]),
+    HeartbeatMsg(agent_id="pi", sequence=12, origin_timestamp=1, receive_timestamp=2, transmit_timestamp=3,
+                 status="viewfinder", metadata={"uptime": "10"}),
+]
+
+
+def legacy_wire_bytes(message):
+    """Wire format as originally generated: [type, timestamp_ms, fields...] packed by msgpack.packb"""
+    return msgpack.packb([int(message.get_message_type()), message.get_timestamp_ms() or 0]
+                         + message._get_fields_data(), use_bin_type=True)
+
+
+def legacy_decode(message_class, data):
+    message = message_class()
+    MessageBase.deserialize(message, data)
+    return message
+
+
+def fields(message):
+    return [bytes(value) if isinstance(value, memoryview) else value for value in message._get_fields_data()]
+
+
+def test_every_registered_type_has_a_sample():
+    registered = {message_type for message_type in MessageType if get_message_class(message_type) is not None}
+    assert registered == {sample.get_message_type() for sample in SAMPLES}
+
+
+@pytest.mark.parametrize("message", SAMPLES, ids=lambda message: type(message).__name__)
+def test_wire_bytes_unchanged(message):
+    assert message.serialize() == legacy_wire_bytes(message)
+
+
+@pytest.mark.parametrize("message", SAMPLES, ids=lambda message: type(message).__name__)
+def test_round_trip_matches_generic_decode(message):
+    data = message.serialize()
+    decoded = type(message)()
+    decoded.deserialize(data)
+    legacy = legacy_decode(type(message), data)
+    assert fields(decoded) == fields(legacy) == fields(message)
+    assert decoded.get_timestamp_ms() == legacy.get_timestamp_ms() == message.get_timestamp_ms()
+    assert decoded.serialize() == data
+    assert fields(decode_message(data)) == fields(message)
+
+
+@pytest.mark.parametrize("message", SAMPLES, ids=lambda message: type(message).__name__)
+def test_malformed_data_is_rejected(message):
+    data = message.serialize()
+    header = peek_header(data)
+    too_short = msgpack.packb([header.message_type, header.timestamp_ms], use_bin_type=True)
+    with pytest.raises(ValueError, match="Expected"):
+        type(message)().deserialize(too_short)
+    wrong_type = msgpack.packb([999, 0] + message._get_fields_data(), use_bin_type=True)
+    with pytest.raises(ValueError, match="mismatch"):
+        type(message)().deserialize(wrong_type)
+    with pytest.raises(ValueError):
+        type(message)().deserialize(data[:-1])
+
+
+def test_camera_frame_image_is_a_view_of_the_buffer():
+    data = bytearray(SAMPLES[1].serialize())
+    frame = CameraFrameMsg()
+    frame.deserialize(data)
+    assert isinstance(frame.image_data, memoryview)
+    assert frame.image_data.obj is data
@@ -0,0 +1,66 @@
+import msgpack
+import pytest
+import zmq
+
+from app.messages.msgpack_buffer import packb, read_array_header, skip_object, unpack_array
+
+SAMPLES = [
+    None, True, False, 0, 127, -1, -32, -33, 128, 255, 256, 65_535, 65_536, 2 ** 32, 2 ** 63, -2 ** 63,
+    1.5, float("inf"), "", "x" * 31, "x" * 32, "x" * 255, "x" * 256, "x" * 65_536, b"", b"x" * 255,
+    b"x" * 256, b"x" * 65_536, [], list(range(15)), list(range(16)), list(range(65_536)), {},
+    {str(key): key for key in range(15)}, {str(key): key for key in range(16)}, [[], {"a": [1, {"b": b"c"}]}],
+    msgpack.ExtType(1, b"x"), msgpack.ExtType(2, b"x" * 16), msgpack.ExtType(3, b"x" * 300),
+]
+
+
+@pytest.mark.parametrize("value", SAMPLES, ids=lambda value: type(value).__name__)
+def test_skip_object_finds_the_end_of_every_type(value):
+    data = msgpack.packb(value, use_bin_type=True)
+    assert skip_object(memoryview(data + b"\xc0"), 0) == len(data)
+
+
+def test_unpack_array_matches_msgpack():
+    data = msgpack.packb(SAMPLES, use_bin_type=True)
+    assert unpack_array(data) == msgpack.unpackb(data, raw=False)
+
+
+@pytest.mark.parametrize("count", [0, 15, 16, 65_535, 65_536])
+def test_array_headers(count):
+    data = msgpack.packb([0] * count)
+    assert read_array_header(memoryview(data))[0] == count
+
+
+def test_binary_elements_come_back_as_views():
+    image = bytes(range(256)) * 1000
+    data = bytearray(packb(["cam", image, b"small", 5]))
+    values = unpack_array(data, (1, 2, 3))
+    assert values[0] == "cam"
+    assert isinstance(values[1], memoryview) and values[1] == image
+    assert values[1].obj is data
+    assert values[2] == b"small"
+    # Only binary elements become views
+    assert values[3] == 5
+
+
+def test_views_over_zmq_frames():
+    data = packb([1, b"payload"])
+    frame = zmq.Frame(data)
+    values = unpack_array(frame, (1,))
+    assert bytes(values[1]) == b"payload"
+
+
+@pytest.mark.parametrize("cut", [1, 3, 6, 10])
+def test_truncated_data_is_rejected(cut):
+    data = packb([1, b"x" * 300, "text"])
+    with pytest.raises(ValueError):
+        unpack_array(data[:-cut], (1,))
+
+
+def test_invalid_type_byte_is_rejected():
+    with pytest.raises(ValueError, match="Invalid msgpack type byte"):
+        skip_object(memoryview(b"\xc1"), 0)
+
+
+def test_non_array_is_rejected():
+    with pytest.raises(ValueError, match="Expected msgpack array"):
+        unpack_array(packb({"a": 1}))
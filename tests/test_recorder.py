@@ -0,0 +1,131 @@
+import threading
+import time
+
+import pytest
+from flask import Flask
+
+from app.messages.external import CameraFrameMsg
+from app.routes.stream import recorder as recorder_module
+from app.routes.stream.broadcaster import FrameBroadcaster
+from app.routes.stream.recorder import (
+    RecordingReader, SessionRecorder, play_recording, segment_path, session_cameras, session_dir
+)
+
+
+def record(tmp_path, publish):
+    broadcaster = FrameBroadcaster(0)
+    recorder = SessionRecorder(str(tmp_path))
+    recorder.attach(broadcaster)
+    session_id = recorder.start()
+    publish(broadcaster)
+    recorder.stop()
+    return session_dir(str(tmp_path), session_id)
+
+
+def test_frames_are_written_as_received(tmp_path, frame_factory, monkeypatch):
+    wires = [bytearray(frame_factory(n).serialize()) for n in range(1, 6)]
+
+    def refuse(self):
+        raise AssertionError("received frames must not be re-serialized")
+    monkeypatch.setattr(CameraFrameMsg, "serialize", refuse)
+
+    def publish(broadcaster):
+        for wire in wires:
+            frame = CameraFrameMsg()
+            frame.deserialize(wire)
+            broadcaster.publish(frame, wire)
+    path = record(tmp_path, publish)
+
+    with open(segment_path(path, 0, 0), 'rb') as f:
+        assert f.read() == b''.join(wires)
+
+
+def test_local_frames_are_serialized(tmp_path, frame_factory):
+    frames = [frame_factory(n) for n in range(1, 4)]
+    path = record(tmp_path, lambda broadcaster: [broadcaster.publish(frame) for frame in frames])
+    assert session_cameras(path) == [0]
+    reader = RecordingReader(path, 0)
+    try:
+        assert len(reader) == 3
+        assert [reader.read_frame(position).frame_number for position in range(3)] == [1, 2, 3]
+        assert bytes(reader.read_frame(1).image_data) == frames[1].image_data
+        assert reader.seek(frames[1].capture_timestamp) == 1
+        assert reader.seek(frames[1].capture_timestamp + 1) == 2
+    finally:
+        reader.close()
+
+
+def test_dropped_frames_are_counted_across_receiver_threads(tmp_path, frame_factory, monkeypatch):
+    write = recorder_module.CameraRecorder.write
+
+    def slow_write(self, *args):
+        time.sleep(0.001)
+        write(self, *args)
+    monkeypatch.setattr(recorder_module.CameraRecorder, "write", slow_write)
+    recorder = SessionRecorder(str(tmp_path), queue_size=2)
+    broadcasters = [FrameBroadcaster(0), FrameBroadcaster(1)]
+    for broadcaster in broadcasters:
+        recorder.attach(broadcaster)
+    session_id = recorder.start()
+    per_camera = 400
+
+    def publish(broadcaster):
+        for n in range(1, per_camera + 1):
+            broadcaster.publish(frame_factory(n))
+    threads = [threading.Thread(target=publish, args=(broadcaster,)) for broadcaster in broadcasters]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    recorder.stop()
+
+    path = session_dir(str(tmp_path), session_id)
+    written = 0
+    for cam_index in session_cameras(path):
+        reader = RecordingReader(path, cam_index)
+        written += len(reader)
+        reader.close()
+    assert recorder.dropped > 0
+    assert written + recorder.dropped == 2 * per_camera
+
+
+def test_sessions_started_together_stay_separate(tmp_path):
+    recorder = SessionRecorder(str(tmp_path))
+    first = recorder.start()
+    recorder.stop()
+    second = recorder.start()
+    recorder.stop()
+    assert first != second
+
+
+def test_replay_ends_after_the_last_frame(tmp_path, frame_factory):
+    frames = [frame_factory(n) for n in range(1, 4)]
+    path = record(tmp_path, lambda broadcaster: [broadcaster.publish(frame) for frame in frames])
+    reader = RecordingReader(path, 0)
+    replay = FrameBroadcaster(0)
+    play_recording(reader, replay, threading.Event(), speed=4.0)
+    assert replay.finished
+    assert replay.latest_frame().frame_number == 3
+    reader.close()
+
+
+def test_replay_request_closed_before_streaming_stops_player(tmp_path, frame_factory, monkeypatch):
+    from app.routes import viewfinder
+
+    frames = [frame_factory(n) for n in range(1, 200)]
+    path = record(tmp_path, lambda broadcaster: [broadcaster.publish(frame) for frame in frames])
+    monkeypatch.setattr(viewfinder, "RECORDINGS_DIR", str(tmp_path))
+    app = Flask(__name__)
+    app.register_blueprint(viewfinder.bp)
+    closed = []
+    monkeypatch.setattr(RecordingReader, "close", lambda self: closed.append(self))
+
+    session_id = path.rsplit('/', 1)[-1]
+    before = threading.active_count()
+    with app.test_request_context(f"/viewfinder/recordings/{session_id}/0"):
+        response = viewfinder.replay_recording(session_id, 0)
+    assert threading.active_count() == before + 1
+    # Never iterated: the client went away before the first frame
+    response.close()
+    assert threading.active_count() == before
+    assert len(closed) == 1
@@ -0,0 +1,138 @@
+import multiprocessing
+import threading
+import time
+import uuid
+from multiprocessing import resource_tracker
+
+import pytest
+import zmq
+
+from app.routes.stream.broadcaster import FrameBroadcaster
+from app.routes.stream.receiver import shared_store_receiver
+from app.routes.stream.shared_store import _SEQUENCE, SharedFrameStore, notify_endpoint
+
+
+@pytest.fixture
+def store():
+    store = SharedFrameStore.create(f"pitrac_test_{uuid.uuid4().hex[:8]}", cameras=2, capacity=64 * 1024)
+    yield store
+    # A reader attached in this process unregistered the segment from the shared resource
+    # tracker; register it again so the owner's unlink doesn't trip the tracker
+    resource_tracker.register(store._memory._name, "shared_memory")
+    store.close()
+
+
+def payload(number, length):
+    """Every byte of frame number carries the same value, so a torn read shows up as mixed bytes"""
+    return bytes([number % 251]) * length
+
+
+def test_reads_the_newest_frame_once(store):
+    reader = SharedFrameStore.attach(store.name)
+    try:
+        assert reader.read(0) is None
+        store.write(0, b"first")
+        store.write(0, b"second")
+        generation, data = reader.read(0)
+        assert (generation, data) == (2, b"second")
+        assert reader.read(0, generation) is None
+        assert reader.read(1) is None
+        assert reader.written_ns(0) > 0
+    finally:
+        reader.close()
+
+
+def test_oversized_frame_is_refused(store):
+    assert not store.write(0, bytes(store.capacity + 1))
+    assert store.generation(0) == 0
+    assert store.write(0, bytes(store.capacity))
+    assert store.read(0)[1] == bytes(store.capacity)
+
+
+def test_unknown_camera(store):
+    with pytest.raises(IndexError):
+        store.write(2, b"frame")
+    with pytest.raises(IndexError):
+        store.read(-1)
+
+
+def test_write_in_progress_is_not_read(store):
+    store.write(0, b"complete")
+    _SEQUENCE.pack_into(store._buf, store._offset(0), store.generation(0) * 2 + 1)
+    assert store.read(0) is None
+
+
+def test_notify_endpoint_is_per_store_and_camera():
+    assert notify_endpoint("frames", 0) != notify_endpoint("frames", 1)
+    assert notify_endpoint("frames", 0) != notify_endpoint("other", 0)
+    assert notify_endpoint("frames", 1).startswith("ipc://")
+
+
+def test_attach_without_ingest_process():
+    with pytest.raises(FileNotFoundError):
+        SharedFrameStore.attach(f"pitrac_missing_{uuid.uuid4().hex[:8]}")
+
+
+def test_attach_rejects_other_shared_memory():
+    from multiprocessing import shared_memory
+    memory = shared_memory.SharedMemory(f"pitrac_other_{uuid.uuid4().hex[:8]}", create=True, size=64)
+    try:
+        with pytest.raises(ValueError):
+            SharedFrameStore.attach(memory.name)
+    finally:
+        memory.close()
+        memory.unlink()
+
+
+def _write_frames(store, frames, started):
+    # The forked writer inherits the mapping, standing in for the ingest process
+    started.set()
+    for number in range(1, frames + 1):
+        # Alternate lengths so a stale length would also tear the read
+        store.write(0, payload(number, 1000 if number % 2 else 50_000))
+
+
+def test_reads_racing_another_process_are_never_torn(store):
+    context = multiprocessing.get_context("fork")
+    started = context.Event()
+    writer = context.Process(target=_write_frames, args=(store, 3000, started))
+    writer.start()
+    started.wait(5)
+    reads = 0
+    last = 0
+    while writer.is_alive() or reads == 0:
+        latest = store.read(0, last)
+        if latest is None:
+            continue
+        last, data = latest
+        reads += 1
+        assert len(data) in (1000, 50_000)
+        assert data == payload(data[0], len(data))
+    writer.join()
+    assert reads > 0
+
+
+def test_receiver_wakes_on_notification(store, frame_factory):
+    context = zmq.Context.instance()
+    notify = context.socket(zmq.PUB)
+    notify.bind(notify_endpoint(store.name, 0))
+    broadcaster = FrameBroadcaster(0)
+    stop_event = threading.Event()
+    thread = threading.Thread(target=shared_store_receiver, args=(broadcaster, store.name, stop_event), daemon=True)
+    thread.start()
+    try:
+        for number in range(1, 4):
+            store.write(0, frame_factory(number).serialize())
+            notify.send(b"\x01")
+            deadline = time.monotonic() + 2.0
+            while time.monotonic() < deadline:
+                frame = broadcaster.latest_frame()
+                if frame is not None and frame.frame_number == number:
+                    break
+                time.sleep(0.005)
+            assert broadcaster.latest_frame().frame_number == number
+    finally:
+        stop_event.set()
+        thread.join(2.0)
+        notify.close(linger=0)
+    assert not thread.is_alive()
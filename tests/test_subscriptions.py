@@ -0,0 +1,78 @@
+import threading
+import time
+
+from app.routes.stream.broadcaster import FrameBroadcaster
+from app.routes.stream.subscriptions import SubscriptionManager
+
+
+class CountingSource:
+    """Frame source that publishes one frame per start and then idles until stopped"""
+
+    def __init__(self, frame_factory):
+        self._frame_factory = frame_factory
+        self.starts = 0
+        self.running = threading.Event()
+
+    def __call__(self, broadcaster, stop_event):
+        self.starts += 1
+        self.running.set()
+        broadcaster.publish(self._frame_factory(self.starts))
+        stop_event.wait()
+        self.running.clear()
+
+
+def make_manager(frame_factory, grace_period):
+    broadcaster = FrameBroadcaster(0)
+    source = CountingSource(frame_factory)
+    return broadcaster, source, SubscriptionManager([broadcaster], [source], grace_period)
+
+
+def test_subscribes_on_first_viewer_and_stops_after_grace(frame_factory):
+    broadcaster, source, subscriptions = make_manager(frame_factory, 0.1)
+    assert not subscriptions[0].active
+    subscriptions.acquire(0)
+    subscriptions.acquire(0)
+    assert source.running.wait(1.0)
+    assert source.starts == 1
+    subscriptions.release(0)
+    subscriptions.release(0)
+    # Still subscribed during the grace period
+    assert subscriptions[0].active
+    time.sleep(0.3)
+    assert not subscriptions[0].active
+    assert not source.running.is_set()
+    assert broadcaster.latest_frame() is None
+
+
+def test_viewer_returning_within_grace_keeps_subscription(frame_factory):
+    _, source, subscriptions = make_manager(frame_factory, 0.2)
+    subscriptions.acquire(0)
+    assert source.running.wait(1.0)
+    subscriptions.release(0)
+    time.sleep(0.05)
+    subscriptions.acquire(0)
+    time.sleep(0.3)
+    assert subscriptions[0].active
+    assert source.starts == 1
+    subscriptions.stop_all()
+
+
+def test_restarts_after_unsubscribing(frame_factory):
+    broadcaster, source, subscriptions = make_manager(frame_factory, 0.0)
+    with subscriptions.viewer(0):
+        assert source.running.wait(1.0)
+    time.sleep(0.1)
+    assert not subscriptions[0].active
+    with subscriptions.viewer(0):
+        deadline = time.monotonic() + 1.0
+        while source.starts < 2 and time.monotonic() < deadline:
+            time.sleep(0.01)
+        assert source.starts == 2
+        assert subscriptions[0].active
+    subscriptions.stop_all()
+
+
+def test_extra_release_is_ignored(frame_factory):
+    _, _, subscriptions = make_manager(frame_factory, 0.0)
+    subscriptions.release(0)
+    assert subscriptions[0].viewers == 0
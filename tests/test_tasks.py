@@ -0,0 +1,92 @@
+import pytest
+from flask import Flask
+
+from app.messages.external import TaskStatusMsg
+from app.routes import api
+from app.routes.tasks.aggregator import TaskIndex
+
+
+def status(task_id, status="running", progress=0.0, **kwargs):
+    return TaskStatusMsg(task_id=task_id, status=status, progress=progress, **kwargs)
+
+
+def test_delta_carries_only_changed_fields():
+    index = TaskIndex()
+    assert index.update(status("a", progress=0.1))
+    version = index.version
+    assert index.update(status("a", progress=0.2))
+    new_version, changed, removed = index.changes_since(version)
+    assert new_version == version + 1
+    assert changed == [{"task_id": "a", "updated_ms": changed[0]["updated_ms"], "progress": 0.2}]
+    assert removed == []
+
+
+def test_repeated_updates_are_coalesced():
+    index = TaskIndex()
+    index.update(status("a"))
+    version = index.version
+    assert not index.update(status("a"))
+    assert index.version == version
+    assert index.coalesced == 1
+    assert index.changes_since(version) == (version, [], [])
+
+
+def test_updates_between_reads_collapse_into_one_delta():
+    index = TaskIndex()
+    index.update(status("a"))
+    version = index.version
+    for progress in (0.1, 0.2, 0.3):
+        index.update(status("a", progress=progress))
+    index.update(status("b"))
+    _, changed, _ = index.changes_since(version)
+    by_task = {task["task_id"]: task for task in changed}
+    assert by_task["a"]["progress"] == 0.3
+    assert "status" not in by_task["a"]
+    assert by_task["b"]["status"] == "running"
+
+
+def test_eviction_prefers_finished_tasks_and_reports_removal():
+    index = TaskIndex(max_tasks=2)
+    index.update(status("done", status="completed"))
+    index.update(status("busy"))
+    version = index.version
+    index.update(status("new"))
+    _, tasks = index.snapshot()
+    assert sorted(task["task_id"] for task in tasks) == ["busy", "new"]
+    _, _, removed = index.changes_since(version)
+    assert removed == ["done"]
+
+
+class FakeTaskService:
+    def __init__(self):
+        self.index = TaskIndex()
+
+    def start(self):
+        pass
+
+
+@pytest.fixture
+def task_client(monkeypatch):
+    intervals = []
+    monkeypatch.setattr(api, "iter_task_events",
+                        lambda index, interval, keepalive, last_event_id: intervals.append(interval) or iter(()))
+    app = Flask(__name__)
+    app.extensions["pitrac_tasks"] = FakeTaskService()
+    app.register_blueprint(api.bp)
+    return app.test_client(), intervals
+
+
+@pytest.mark.parametrize("interval", ["nan", "inf", "-inf"])
+def test_task_stream_rejects_non_finite_interval(task_client, interval):
+    client, intervals = task_client
+    response = client.get(f"/api/tasks/stream?interval={interval}")
+    assert response.status_code == 400
+    assert intervals == []
+
+
+@pytest.mark.parametrize("interval, expected", [("0", api.TASK_STREAM_MIN_INTERVAL), ("2", 2.0),
+                                                ("1e9", api.TASK_STREAM_MAX_INTERVAL)])
+def test_task_stream_clamps_interval(task_client, interval, expected):
+    client, intervals = task_client
+    assert client.get(f"/api/tasks/stream?interval={interval}").status_code == 200
+    assert intervals == [expected]
@@ -0,0 +1,51 @@
+import pytest
+from flask import Flask
+
+from app.routes import viewfinder
+
+
+@pytest.fixture
+def client():
+    app = Flask(__name__)
+    app.register_blueprint(viewfinder.bp)
+    return app.test_client()
+
+
+@pytest.mark.parametrize("query, expected", [("", 0.5), ("?v=2", 2.0), ("?v=0", 0.1), ("?v=1e9", 5.0),
+                                             ("?v=nan", None), ("?v=inf", None), ("?v=-inf", None)])
+def test_bounded_float(query, expected):
+    with Flask(__name__).test_request_context(f"/{query}"):
+        assert viewfinder.get_bounded_float("v", 0.5, 0.1, 5.0) == expected
+
+
+@pytest.mark.parametrize("interval", ["nan", "inf"])
+def test_analytics_stream_rejects_non_finite_interval(client, interval):
+    if not viewfinder.ANALYTICS_ENABLED:
+        pytest.skip("analytics disabled")
+    assert client.get(f"/viewfinder/analytics/0/stream?interval={interval}").status_code == 400
+
+
+def test_clip_stream_rejects_non_finite_speed(client, monkeypatch):
+    monkeypatch.setitem(viewfinder.frozen_clips, "clip", [[], []])
+    assert client.get("/viewfinder/clips/clip/0?speed=nan").status_code == 400
+
+
+@pytest.mark.parametrize("query", ["speed=nan", "start=nan", "start=inf"])
+def test_replay_rejects_non_finite_arguments(client, tmp_path, monkeypatch, frame_factory, query):
+    from app.routes.stream.broadcaster import FrameBroadcaster
+    from app.routes.stream.recorder import SessionRecorder
+
+    broadcaster = FrameBroadcaster(0)
+    recorder = SessionRecorder(str(tmp_path))
+    recorder.attach(broadcaster)
+    session_id = recorder.start()
+    broadcaster.publish(frame_factory(1))
+    recorder.stop()
+    monkeypatch.setattr(viewfinder, "RECORDINGS_DIR", str(tmp_path))
+    assert client.get(f"/viewfinder/recordings/{session_id}/0?{query}").status_code == 400
+
+
+@pytest.mark.parametrize("query, status", [("x=0&y=0&w=10&h=10&scale=nan", 400), ("x=0&y=0&w=10&scale=2", 400),
+                                           ("x=0&y=0&w=0&h=10", 400)])
+def test_roi_stream_rejects_bad_rectangles_and_scales(client, query, status):
+    assert client.get(f"/viewfinder/stream/0/roi?{query}").status_code == status
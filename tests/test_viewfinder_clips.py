@@ -0,0 +1,57 @@
+import os
+import time
+
+import pytest
+import zmq
+from flask import Flask
+
+from app.routes.stream.receiver import CAMERA_PORTS
+
+pytestmark = pytest.mark.skipif(bool(os.environ.get("PITRAC_FRAME_STORE")) or
+                                os.environ.get("PITRAC_REPLAY_BUFFER") == "0",
+                                reason="needs the replay buffer fed straight from the Pi")
+
+
+@pytest.fixture
+def camera_publishers():
+    """Stand-ins for the Pi's camera publishers on 127.0.0.1"""
+    context = zmq.Context.instance()
+    publishers = []
+    try:
+        for port in CAMERA_PORTS:
+            socket = context.socket(zmq.PUB)
+            socket.setsockopt(zmq.LINGER, 0)
+            publishers.append(socket)
+            socket.bind(f"tcp://127.0.0.1:{port}")
+    except zmq.ZMQError as e:
+        for socket in publishers:
+            socket.close()
+        pytest.skip(f"camera ports unavailable: {e}")
+    yield publishers
+    for socket in publishers:
+        socket.close()
+
+
+def test_clip_has_frames_with_no_viewers(camera_publishers, frame_factory):
+    from app.routes import viewfinder
+
+    app = Flask(__name__)
+    app.register_blueprint(viewfinder.bp)
+    client = app.test_client()
+    assert "replay_buffer" in viewfinder.background_consumers
+
+    # Nobody opens a stream; the replay buffer's own subscription keeps the receivers running
+    frame_number = 0
+    deadline = time.monotonic() + 5.0
+    while time.monotonic() < deadline:
+        frame_number += 1
+        for cam_index, socket in enumerate(camera_publishers):
+            socket.send(frame_factory(frame_number, camera_id=f"cam{cam_index}").serialize())
+        if all(len(replay_buffer) >= 3 for replay_buffer in viewfinder.replay_buffers):
+            break
+        time.sleep(0.02)
+
+    response = client.post("/viewfinder/clips")
+    assert response.status_code == 201
+    cameras = response.get_json()["cameras"]
+    assert [camera["frames"] > 0 for camera in cameras] == [True, True]
@@ -0,0 +1,71 @@
+import threading
+import time
+
+import pytest
+
+pytest.importorskip("flask_sock")
+
+from app.routes.stream.broadcaster import FrameBroadcaster
+from app.routes.viewfinder_ws import FRAME_HEADER, send_frames
+
+
+class FakeWebSocket:
+    def __init__(self):
+        self.connected = True
+
+
+class RecordingSender:
+    def __init__(self):
+        self.closed = threading.Event()
+        self.messages = []
+
+    def offer(self, message):
+        self.messages.append(message)
+
+
+class CountingBroadcaster(FrameBroadcaster):
+    def __init__(self, cam_index):
+        super().__init__(cam_index)
+        self.waits = 0
+
+    def wait_for_new_frame(self, after_generation, timeout=None):
+        self.waits += 1
+        return super().wait_for_new_frame(after_generation, timeout)
+
+
+def run_sender(broadcaster, ws, sender):
+    thread = threading.Thread(target=send_frames, args=(ws, 0, broadcaster, sender), kwargs={"keepalive": 0.1},
+                              daemon=True)
+    thread.start()
+    return thread
+
+
+def test_waits_for_first_frame_without_spinning():
+    broadcaster = CountingBroadcaster(0)
+    ws, sender = FakeWebSocket(), RecordingSender()
+    thread = run_sender(broadcaster, ws, sender)
+    time.sleep(0.5)
+    ws.connected = False
+    thread.join(1.0)
+    assert not thread.is_alive()
+    # One wait per keepalive, not a busy loop
+    assert broadcaster.waits <= 10
+    assert sender.messages == []
+
+
+def test_waits_after_reset_without_spinning(frame_factory):
+    broadcaster = CountingBroadcaster(0)
+    ws, sender = FakeWebSocket(), RecordingSender()
+    thread = run_sender(broadcaster, ws, sender)
+    broadcaster.publish(frame_factory(1))
+    time.sleep(0.1)
+    broadcaster.reset()
+    waits = broadcaster.waits
+    time.sleep(0.5)
+    broadcaster.publish(frame_factory(2))
+    time.sleep(0.1)
+    ws.connected = False
+    thread.join(1.0)
+    assert broadcaster.waits - waits <= 10
+    frame_numbers = [FRAME_HEADER.unpack_from(message)[3] for message in sender.messages]
+    assert frame_numbers == [1, 2]